@@ -9,7 +9,7 @@ __author__ = 'sergey'
 from time import time
 from math import floor
 
-from dedupsqlfs.my_formats import format_timespan
+from dedupsqlfs.my_formats import format_timespan, format_size
 from dedupsqlfs.lib import constants
 from dedupsqlfs.fuse.subvolume import Subvolume
 
@@ -307,6 +307,9 @@ def __collect_indexes(app):
     tableIndex = app.operations.getTable("inode_hash_block")
     tableInode = app.operations.getTable("inode")
     tableHashCount = app.operations.getTable("hash_count")
+    tableHashMeta = None
+    if app.operations.hash_meta_enabled:
+        tableHashMeta = app.operations.getTable("hash_meta")
 
     app.getLogger().debug("Clean unused block indexes...")
 
@@ -343,6 +346,8 @@ def __collect_indexes(app):
         hashes = tableIndex.get_hashid_by_inodes(to_delete)
         for hash_id in hashes:
             tableHashCount.dec(hash_id)
+            if tableHashMeta:
+                tableHashMeta.dec(hash_id)
 
         count += tableIndex.remove_by_inodes(to_delete)
 
@@ -369,6 +374,9 @@ def __collect_indexes(app):
     msg = ""
     if count > 0:
         tableIndex.commit()
+        tableHashCount.commit()
+        if tableHashMeta:
+            tableHashMeta.commit()
         msg = "Cleaned up %i unused index entr%s in %%s." % (count, count != 1 and 'ies' or 'y')
     return count, msg
 
@@ -420,6 +428,11 @@ def __collect_blocks(app):
     tableBlock = app.operations.getTable("block")
     tableHCT = app.operations.getTable("hash_compression_type")
     tableHSZ = app.operations.getTable("hash_sizes")
+    tableHDelta = app.operations.getTable("hash_delta")
+    tableHSketch = app.operations.getTable("hash_sketch")
+    tableHashMeta = None
+    if app.operations.hash_meta_enabled:
+        tableHashMeta = app.operations.getTable("hash_meta")
 
     if tableHash.getClustered():
         app.getLogger().warning("Hashes and blocks are clustered! Skip, @todo")
@@ -427,6 +440,7 @@ def __collect_blocks(app):
 
     subv = Subvolume(app.operations)
     indexHashIds = subv.prepareIndexHashIds()
+    app.getLogger().debug(" used hashes: %d", indexHashIds.count())
 
     app.getLogger().debug("Clean unused data blocks and hashes...")
 
@@ -453,29 +467,49 @@ def __collect_blocks(app):
         if not hashIds:
             continue
 
-        # SET magick
-        to_delete = hashIds - indexHashIds
+        # Bitmap check of whole window
+        to_delete = indexHashIds.unmarked(hashIds)
 
         id_str = ",".join((str(_id) for _id in to_delete))
-        count += tableHash.remove_by_ids(id_str)
+        # Blocks still used as delta base must stay
+        to_delete -= tableHDelta.get_used_base_ids(id_str)
+
+        id_str = ",".join((str(_id) for _id in to_delete))
+        # Block files are found by hash value
         tableBlock.remove_by_ids(id_str)
+        count += tableHash.remove_by_ids(id_str)
         tableHCT.remove_by_ids(id_str)
         tableHSZ.remove_by_ids(id_str)
+        tableHDelta.remove_by_ids(id_str)
+        tableHSketch.remove_by_ids(id_str)
+        if tableHashMeta:
+            tableHashMeta.remove_by_ids(id_str)
 
         p = "%6.2f%%" % (100.0 * current / countHashes)
         if p != proc:
             proc = p
             app.getLogger().debug("%s (count=%d)", proc, count)
 
+    indexHashIds.close()
+
     msg = ""
     if count > 0:
         tableHash.commit()
         tableBlock.commit()
         tableHCT.commit()
         tableHSZ.commit()
+        tableHDelta.commit()
+        tableHSketch.commit()
+        if tableHashMeta:
+            tableHashMeta.commit()
         msg = "Cleaned up %i unused data block%s and hashes in %%s." % (
             count, count != 1 and 's' or '',
         )
+
+    # Space of removed blocks in packfile segments
+    freed = tableBlock.compact()
+    if freed > 0 and msg:
+        msg += " Freed %s in block packfiles." % format_size(freed)
     return count, msg
 
 
@@ -101,6 +101,11 @@ def __collect_blocks(app):
         cnt=tableHSZ.remove_by_ids(id_str)
         app.getLogger().info("Clean %d unused sizes" % cnt)
 
+        if app.operations.hash_meta_enabled:
+            tableHashMeta = app.operations.getTable("hash_meta")
+            tableHashMeta.remove_by_ids(id_str)
+            tableHashMeta.commit()
+
 
     msg = ""
     if count2 > 0:
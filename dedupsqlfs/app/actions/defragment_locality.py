@@ -0,0 +1,160 @@
+# -*- coding: utf8 -*-
+
+"""
+Special action to place blocks of files close to each other
+
+Blocks are stored in order of flush, so after months of mixed writes
+blocks of one file are scattered over block files and restore of files
+turns into random reads.
+
+Every block partition is rewritten: first blocks of subvolume files,
+in order of inodes and their block numbers, each block once,
+then all other blocks. Sqlite block files are rewritten into new files,
+packfile segments - into new segments.
+
+Seek distance - sum of gaps between end of block and start of next one
+while files are read - is measured before and after over first blocks.
+"""
+
+__author__ = 'sergey'
+
+import sys
+from time import time
+
+from dedupsqlfs.my_formats import format_size, format_timespan
+from dedupsqlfs.lib import constants
+from dedupsqlfs.lib.hash_bitmap import HashIdBitmap
+
+BATCH_SIZE = 10000
+
+
+def __traversal(tableIndex, maxId, tmp_dir, n_parts=1, part=0, limit=0):
+    """
+    Hash ids of blocks in order of files, every hash id once
+
+    @param limit: stop after N hash ids, 0 - all
+    @return: generator of int
+    """
+    seen = HashIdBitmap(maxId + 1, tmp_dir)
+    count = 0
+    start_inode, start_block = 0, -1
+    try:
+        while True:
+            items = tableIndex.get_batch_ordered(start_inode, start_block, BATCH_SIZE)
+            if not items:
+                break
+            start_inode, start_block = items[-1]["inode_id"], items[-1]["block_number"]
+
+            for item in items:
+                hash_id = item["hash_id"]
+                if hash_id % n_parts != part or seen.isMarked(hash_id):
+                    continue
+                seen.mark((hash_id,))
+                yield hash_id
+                count += 1
+                if limit and count >= limit:
+                    return
+    finally:
+        seen.close()
+
+
+def __seek_distance(tableBlock, tableIndex, maxId, tmp_dir):
+    """
+    @return: tuple (distance in bytes, count of blocks) | None - not supported by storage
+    """
+    sample = list(__traversal(tableIndex, maxId, tmp_dir, limit=constants.LOCALITY_SAMPLE_SIZE))
+
+    parts = {}
+    for hash_id in sample:
+        parts.setdefault(hash_id % tableBlock.n_parts, []).append(hash_id)
+
+    distance = 0
+    for n, hash_ids in parts.items():
+        locations = tableBlock.getPart(n).get_locations(hash_ids)
+        if locations is None:
+            return None
+        prevEnd = None
+        for hash_id in hash_ids:
+            if hash_id not in locations:
+                continue
+            offset, length = locations[ hash_id ]
+            if prevEnd is not None:
+                distance += abs(offset - prevEnd)
+            prevEnd = offset + length
+    return distance, len(sample)
+
+
+def __print_distance(title, result):
+    if result is None:
+        print("%s: seek distance can't be measured for this storage." % title)
+        return
+    distance, count = result
+    print("%s: seek distance over %d blocks - %s, %s per block." % (
+        title, count, format_size(distance), format_size(distance / max(count, 1)),))
+    return
+
+
+def do_defragment_locality(options, _fuse):
+    """
+    @param options: Commandline options
+    @type  options: object
+
+    @param _fuse: FUSE wrapper
+    @type  _fuse: dedupsqlfs.fuse.dedupfs.DedupFS
+    """
+
+    isVerbose = _fuse.getOption("verbosity") > 0
+
+    manager = _fuse.operations.getManager()
+    if manager.TYPE != "sqlite" or _fuse.getOption("block_data_storage_on_fs") \
+            or manager.getTable("block").getStorage() == constants.BLOCK_STORAGE_FS:
+        print("Locality defragmentation supported only for block data in sqlite files or packfiles!")
+        return 1
+
+    name = options.defragment_locality
+    if type(name) is str:
+        name = name.encode('utf8')
+
+    subvolItem = manager.getTable("subvolume").find(name)
+    if not subvolItem:
+        print("Subvolume %r not found!" % name.decode())
+        return 1
+
+    tableIndex = manager.getTable("inode_hash_block_%d" % subvolItem["id"])
+    tableBlock = _fuse.operations.getTable("block")
+
+    maxId = manager.getTable("hash").get_max_id()
+    tmp_dir = _fuse.getOption("temp")
+
+    start_time = time()
+
+    # Partitions are used directly
+    tableBlock.stopWriters()
+
+    if isVerbose:
+        print("Place blocks of subvolume %r files together, %d partitions." % (name.decode(), tableBlock.n_parts,))
+        __print_distance("Before", __seek_distance(tableBlock, tableIndex, maxId, tmp_dir))
+
+    # Own transactions for every batch
+    manager.setAutocommit(False)
+    tableBlock.begin()
+
+    count = 0
+    for n in range(tableBlock.n_parts):
+        t = tableBlock.getPart(n)
+        count += t.rewrite_ordered(__traversal(tableIndex, maxId, tmp_dir, tableBlock.n_parts, n))
+        t.commit()
+
+        if isVerbose:
+            sys.stdout.write("\r  partition %d of %d rewritten, %d blocks in order " % (n + 1, tableBlock.n_parts, count,))
+            sys.stdout.flush()
+
+    manager.setAutocommit(True)
+
+    if isVerbose:
+        sys.stdout.write("\n")
+        sys.stdout.flush()
+        __print_distance("After", __seek_distance(tableBlock, tableIndex, maxId, tmp_dir))
+        print("Rewritten in %s." % format_timespan(time() - start_time))
+
+    return 0
@@ -0,0 +1,39 @@
+# -*- coding: utf8 -*-
+
+"""
+Special action to export sampled data blocks for compression benchmark
+"""
+
+__author__ = 'sergey'
+
+from dedupsqlfs.my_formats import format_size
+from dedupsqlfs.app.actions.train_dictionary import get_sample_blocks
+from dedupsqlfs.benchmark.corpus import write_samples
+
+
+def do_export_samples(options, _fuse):
+    """
+    Sample stored blocks evenly, decompress and write them into file,
+    readable by benchmark as 'samples:PATH' corpus.
+
+    @param options: Commandline options
+    @type  options: object
+
+    @param _fuse: FUSE wrapper
+    @type  _fuse: dedupsqlfs.fuse.dedupfs.DedupFS
+    """
+
+    path = _fuse.getOption("export_samples")
+    samplesCount = _fuse.getOption("export_samples_count")
+
+    samples = get_sample_blocks(_fuse, samplesCount, False)
+    if not samples:
+        print("No data blocks to export!")
+        return 1
+
+    count = write_samples(path, samples)
+
+    print("Exported %s sample blocks (%s) into %r." % (
+        count, format_size(sum(len(sample) for sample in samples)), path))
+
+    return 0
@@ -2,125 +2,346 @@
 
 """
 Special action to recompress all data
+
+Pipeline of three stages, all going at once:
+- main process reads hashes by keyset batches of hash_id,
+  with compression types and block data of whole batch,
+  and sends batches to decompression process pool;
+- decompressed batches go to compression tool in order of hash_id;
+- writer thread stores changed blocks, compression types and sizes,
+  with merged hash metadata if it is enabled, by batches
+  and saves last written hash_id into option table.
+
+Interrupted action continues from saved hash_id on next run.
+Tables are not thread-safe, so reader and writer share lock.
 """
 
 __author__ = 'sergey'
 
 import sys
-from multiprocessing import cpu_count
+from threading import Thread, Lock
+from queue import Queue
+from collections import deque
+from multiprocessing import get_context, cpu_count
 
-def do_recompress(options, _fuse):
-    """
-    @param options: Commandline options
-    @type  options: object
+from dedupsqlfs.fuse.compress import delta
 
-    @param _fuse: FUSE wrapper
-    @type  _fuse: dedupsqlfs.fuse.dedupfs.DedupFS
-    """
+BATCH_SIZE = 1000
 
-    isVerbose = _fuse.getOption("verbosity") > 0
+OPTION_LAST = "recompress_last_id"
+OPTION_COUNT = "recompress_count"
+OPTION_UPDATED = "recompress_updated"
 
-    tableHash = _fuse.operations.getTable("hash")
-    tableHashCT = _fuse.operations.getTable("hash_compression_type")
-    tableBlock = _fuse.operations.getTable("block")
-    tableSubvol = _fuse.operations.getTable("subvolume")
+# Compression tool of worker process
+_tool = None
 
-    hashCount = tableHash.get_count()
-    if isVerbose:
-        print("Ready to recompress %s blocks." % hashCount)
 
-    cur = tableHash.getCursor(True)
+def __init_worker(tool):
+    global _tool
+    _tool = tool
+    return
 
-    _fuse.operations.getManager().setAutocommit(False)
-    tableBlock.begin()
-    tableHashCT.begin()
-    _fuse.operations.getManager().setAutocommit(True)
 
-    # Every 100*100 (4x symbols)
-    cntNth = int(hashCount/10000.0)
-    if cntNth < 1:
-        cntNth = 1
+def _decompress_batch(items):
+    """
+    Broken blocks are skipped - stay as is, they are reported
 
-    # Process Nth blocks and then - commit
-    maxBatch = 1000
-    offBatch = 0
-    cnt = cntNext = upd = 0
-    cpu_n = cpu_count() * 4
+    @param items: list of tuples (hash_id, compression method, data)
+    @return: tuple (list of tuples (hash_id, compression method, raw data), broken hash ids)
+    """
+    result = []
+    broken = []
+    for hash_id, method, data in items:
+        try:
+            result.append((hash_id, method, _tool.decompressData(method, data),))
+        except Exception:
+            broken.append(hash_id)
+    return result, broken
 
-    try:
 
-        toCompress = {}
-        toCompressM = {}
+def _set_option(tableOption, name, value):
+    if tableOption.get(name) is None:
+        tableOption.insert(name, value)
+    else:
+        tableOption.update(name, value)
+    return
 
-        while cnt < hashCount:
 
-            cur.execute("SELECT `id` FROM `%s` LIMIT %s OFFSET %s" % (tableHash.getName(), maxBatch, offBatch,))
-            offBatch += maxBatch
+def __remove_options(tableOption):
+    cur = tableOption.getCursor()
+    for name in (OPTION_LAST, OPTION_COUNT, OPTION_UPDATED,):
+        cur.execute("DELETE FROM `%s` WHERE name=?" % tableOption.getName(), (name,))
+    tableOption.commit()
+    return
+
+
+def __get_processes(_fuse):
+    np = cpu_count()
+    limit = _fuse.getOption("cpu_limit")
+    if limit and 0 < int(limit) < np:
+        np = int(limit)
+    return np
+
+
+def __get_methods(_fuse):
+    """
+    Stored compression methods selected by --recompress-method,
+    level of compression is not stored - only method names.
+
+    @return: set of str | None - all methods
+    """
+    methods = _fuse.getOption("recompress_methods")
+    if not methods:
+        return None
+    selected = set()
+    for value in methods:
+        for method in value.split(","):
+            method = method.strip()
+            if method:
+                # Level is not stored with block
+                selected.add(method.split(":")[0].split("-")[0])
+    return selected
+
+
+class WriterThread(Thread):
+    """
+    Stores recompressed batches, in order of hash_id
+    """
 
-            for hashItem in iter(cur.fetchone, None):
+    def __init__(self, _fuse, lock, cnt, upd, hashMeta=False):
+        Thread.__init__(self, name="recompress-writer")
+        self.daemon = True
+        self._fuse = _fuse
+        self._lock = lock
+        self._hash_meta = hashMeta
+        self._queue = Queue(maxsize=4)
+        self.cnt = cnt
+        self.upd = upd
+        self.error = None
+        pass
 
-                cnt += 1
+    def put(self, last_id, count, items):
+        """
+        @param last_id: Last hash_id of batch
+        @param count: Count of processed hashes in batch
+        @param items: list of tuples (hash_id, compressed data, compression method, raw size)
+        """
+        self._queue.put((last_id, count, items,))
+        return self
+
+    def finish(self):
+        self._queue.put(None)
+        self.join()
+        return self
+
+    def run(self):
+        while True:
+            task = self._queue.get()
+            if task is None:
+                break
+            if self.error is not None:
+                # Drain queue, reader stops itself
+                continue
+            try:
+                with self._lock:
+                    self._write(*task)
+            except Exception as e:
+                self.error = e
+        return
+
+    def _write(self, last_id, count, items):
+        ops = self._fuse.operations
+        manager = ops.getManager()
+        tableBlock = ops.getTable("block")
+        tableHashCT = ops.getTable("hash_compression_type")
+        tableHashSZ = ops.getTable("hash_sizes")
+        tableOption = ops.getTable("option")
+        tableHashMeta = None
+        if self._hash_meta:
+            tableHashMeta = ops.getTable("hash_meta")
+
+        manager.setAutocommit(False)
+        tableBlock.begin()
+        tableHashCT.begin()
+        tableHashSZ.begin()
+        if tableHashMeta:
+            tableHashMeta.begin()
+        manager.setAutocommit(True)
+
+        types = []
+        sizes = []
+        for hashId, cData, cMethod, rawSize in items:
+            if tableBlock.update(hashId, cData):
+                types.append((hashId, ops.getCompressionTypeId(cMethod),))
+                sizes.append((hashId, rawSize, len(cData),))
+        self.upd += tableHashCT.update_many(types)
+        tableHashSZ.update_many(sizes)
+        if tableHashMeta:
+            for hashId, typeId in types:
+                tableHashMeta.set_type(hashId, typeId)
+            for hashId, rawSize, cSize in sizes:
+                tableHashMeta.set_sizes(hashId, rawSize, cSize)
+        self.cnt += count
+
+        manager.setAutocommit(False)
+        tableBlock.commit()
+        tableHashCT.commit()
+        tableHashSZ.commit()
+        if tableHashMeta:
+            tableHashMeta.commit()
+        manager.setAutocommit(True)
+
+        _set_option(tableOption, OPTION_LAST, "%i" % last_id)
+        _set_option(tableOption, OPTION_COUNT, "%i" % self.cnt)
+        _set_option(tableOption, OPTION_UPDATED, "%i" % self.upd)
+        tableOption.commit()
+
+        tableBlock.shrinkMemory()
+        tableHashCT.shrinkMemory()
+        return
+
+    pass
 
-                hashId = hashItem["id"]
 
-                blockItem = tableBlock.get(hashId)
-                hashCT = tableHashCT.get(hashId)
-                curMethod = _fuse.operations.getCompressionTypeName(hashCT["type_id"])
-                blockData = _fuse.decompressData(curMethod, blockItem["data"])
+def do_recompress(options, _fuse):
+    """
+    @param options: Commandline options
+    @type  options: object
 
-                toCompress[ hashId ] = blockData
-                toCompressM[ hashId ] = curMethod
+    @param _fuse: FUSE wrapper
+    @type  _fuse: dedupsqlfs.fuse.dedupfs.DedupFS
+    """
 
-                if cnt % cpu_n == 0:
+    isVerbose = _fuse.getOption("verbosity") > 0
 
-                    for hashId, item in _fuse.compressData(toCompress):
+    tableOption = _fuse.operations.getTable("option")
+    tableHash = _fuse.operations.getTable("hash")
+    tableHashCT = _fuse.operations.getTable("hash_compression_type")
+    tableBlock = _fuse.operations.getTable("block")
+    tableSubvol = _fuse.operations.getTable("subvolume")
 
-                        cData, cMethod = item
-                        curMethod = toCompressM[ hashId ]
+    tool = _fuse.getCompressTool()
+    methods = __get_methods(_fuse)
 
-                        if cMethod != curMethod:
-                            cMethodId = _fuse.operations.getCompressionTypeId(cMethod)
-                            res = tableBlock.update(hashId, cData)
-                            res2 = tableHashCT.update(hashId, cMethodId)
-                            if res and res2:
-                                upd += 1
+    hashCount = tableHash.get_count()
 
-                    toCompress = {}
-                    toCompressM = {}
+    start_id = int(tableOption.get(OPTION_LAST) or 0)
+    cnt = int(tableOption.get(OPTION_COUNT) or 0)
+    upd = int(tableOption.get(OPTION_UPDATED) or 0)
 
-                if isVerbose:
-                    if cnt >= cntNext:
-                        cntNext += cntNth
-                        prc = "%6.2f%%" % (cnt*100.0/hashCount)
-                        sys.stdout.write("\r%s " % prc)
-                        sys.stdout.flush()
-
-            # For ends - blocks commit
-            _fuse.operations.getManager().setAutocommit(False)
-            tableBlock.commit()
-            tableHashCT.commit()
-            tableBlock.shrinkMemory()
-            tableHash.shrinkMemory()
-            tableHashCT.shrinkMemory()
-            tableBlock.begin()
-            tableHashCT.begin()
-            _fuse.operations.getManager().setAutocommit(True)
-
-        if len(toCompress.keys()):
+    if isVerbose:
+        print("Ready to recompress %s blocks." % hashCount)
+        if methods:
+            print("Only blocks compressed by: %s." % ", ".join(sorted(methods)))
+        if start_id:
+            print("Continue from hash_id > %d, %d blocks processed already." % (start_id, cnt,))
+
+    np = __get_processes(_fuse)
+    # Fork before writer thread started
+    pool = get_context("fork").Pool(np, __init_worker, (tool,))
+
+    lock = Lock()
+    # Operations are not initialized here, flag is taken from database
+    hashMeta = tableOption.get("hash_meta") == "1"
+
+    writer = WriterThread(_fuse, lock, cnt, upd, hashMeta)
+    writer.start()
+
+    # Decompression of batches in order of hash_id: (last hash_id, count, list, broken ids, AsyncResult | None)
+    pending = deque()
+    readCnt = cnt
+    lastPrc = ""
+    brokenIds = []
+
+    def __compress(last_id, count, local, broken, result):
+        # Whole batch goes to writer at once - it saves last hash_id of batch
+        if result is not None:
+            result, _broken = result.get()
+            local.extend(result)
+            broken.extend(_broken)
+        for hash_id in broken:
+            _fuse.operations.getLogger().error("Recompress: block data of hash_id=%i not decompressed, skipped!", hash_id)
+        brokenIds.extend(broken)
+        toCompress = {}
+        toCompressM = {}
+        for hashId, curMethod, blockData in local:
+            toCompress[ hashId ] = blockData
+            toCompressM[ hashId ] = curMethod
+        items = []
+        if toCompress:
             for hashId, item in _fuse.compressData(toCompress):
-
                 cData, cMethod = item
-                curMethod = toCompressM[hashId]
+                if cMethod != toCompressM[ hashId ]:
+                    items.append((hashId, cData, cMethod, len(toCompress[ hashId ]),))
+        writer.put(last_id, count, items)
+        return
 
-                if cMethod != curMethod:
-                    cMethodId = _fuse.operations.getCompressionTypeId(cMethod)
-                    res = tableBlock.update(hashId, cData)
-                    res2 = tableHashCT.update(hashId, cMethodId)
-                    if res and res2:
-                        upd += 1
+    try:
+        while writer.error is None:
+
+            with lock:
+                hashItems = tableHash.get_batch(start_id, BATCH_SIZE)
+
+                if hashItems:
+                    start_id = hashItems[-1]["id"]
+                    hash_ids = [ item["id"] for item in hashItems ]
+
+                    types = tableHashCT.get_types_by_hash_ids(",".join(str(hash_id) for hash_id in hash_ids))
+                    typeNames = dict(
+                        (hash_id, _fuse.operations.getCompressionTypeName(type_id),) for hash_id, type_id in types.items()
+                    )
+                    if methods:
+                        hash_ids = [ hash_id for hash_id in hash_ids
+                                     if typeNames.get(hash_id) in methods
+                                     or tool.getBaseMethod(typeNames.get(hash_id, "")) in methods ]
+                    # Delta blocks stay as is - other blocks depend on their base
+                    hash_ids = [ hash_id for hash_id in hash_ids
+                                 if hash_id in typeNames and not delta.is_delta_method(typeNames[ hash_id ]) ]
+
+                    blocks = tableBlock.get_many(hash_ids)
+
+                    items = []
+                    local = []
+                    broken = []
+                    for hash_id in hash_ids:
+                        blockItem = blocks.get(hash_id)
+                        if not blockItem:
+                            continue
+                        method = typeNames[ hash_id ]
+                        if tool.getBaseMethod(method) == "zstd_dict":
+                            # Dictionaries are in database
+                            try:
+                                local.append((hash_id, method,
+                                              _fuse.operations.decompressHashData(hash_id, blockItem["data"], types[ hash_id ]),))
+                            except Exception:
+                                broken.append(hash_id)
+                            continue
+                        items.append((hash_id, method, blockItem["data"],))
+
+                    pending.append((start_id, len(hashItems), local, broken,
+                                    items and pool.apply_async(_decompress_batch, (items,)) or None,))
+                    readCnt += len(hashItems)
+
+            # Keep processes busy, but not too much data in memory
+            while pending and (not hashItems or len(pending) > np * 2):
+                __compress(*pending.popleft())
+
+            if not hashItems:
+                break
+
+            prc = "%6.2f%%" % (readCnt*100.0/max(hashCount, 1))
+            if prc != lastPrc:
+                lastPrc = prc
+                if isVerbose:
+                    sys.stdout.write("\r%s " % prc)
+                    sys.stdout.flush()
+    finally:
+        pool.terminate()
+        pool.join()
+        writer.finish()
 
-    except:
-        pass
+    cnt = writer.cnt
+    upd = writer.upd
 
     if isVerbose:
         sys.stdout.write("\n")
@@ -129,18 +350,23 @@ def do_recompress(options, _fuse):
     if isVerbose:
         print("Processed %s blocks, recompressed %s blocks." % (cnt, upd,))
 
-    if hashCount != cnt:
-        _fuse.operations.getManager().setAutocommit(False)
-        tableBlock.rollback()
-        tableHashCT.rollback()
-        _fuse.operations.getManager().setAutocommit(True)
-        print("Something went wrong? Changes are rolled back!")
+    if brokenIds:
+        print("Broken blocks not decompressed and skipped: %s, hash ids: %s%s" % (
+            len(brokenIds),
+            ",".join(str(hash_id) for hash_id in brokenIds[:100]), len(brokenIds) > 100 and ",..." or "",
+        ))
+
+    if writer.error is not None:
+        print("Write of recompressed blocks failed: %s" % writer.error)
+        print("Written batches are kept, run again to continue.")
         return 1
 
-    _fuse.operations.getManager().setAutocommit(False)
-    tableBlock.commit()
-    tableHashCT.commit()
-    _fuse.operations.getManager().setAutocommit(True)
+    # All done, next run starts from beginning
+    __remove_options(tableOption)
+
+    if hashCount != cnt:
+        print("Something went wrong?")
+        return 1
 
     tableBlock.shrinkMemory()
     tableHash.shrinkMemory()
@@ -207,4 +433,8 @@ def do_recompress(options, _fuse):
     tableSubvol.commit()
     _fuse.operations.getManager().setAutocommit(True)
 
+    if brokenIds:
+        # Broken blocks stay as is - run verify for them
+        return 1
+
     return 0
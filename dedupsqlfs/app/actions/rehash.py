@@ -2,11 +2,83 @@
 
 """
 Special action to rehash all data
+
+Hashes are read by keyset batches of hash_id, with compression types
+and block data of whole batch. Decompression and hashing by new function
+go in process pool, delta and dictionary compressed blocks need database -
+hashed in main process. New hash values are written by batches.
+
+If new hash value is used by other block already - hash collision
+or duplicated data - block keeps old hash value, hash function is
+not changed in the end. Run rehash with old function to revert.
+
+Last rehashed hash_id and new function are saved into option table
+after every batch, so interrupted action continues from there on next run.
+
+Rehash is offline only: mounted FS holds exclusive locks of sqlite files.
 """
 
 __author__ = 'sergey'
 
 import sys
+import hashlib
+from collections import deque
+from multiprocessing import get_context, cpu_count
+
+from dedupsqlfs.lib import constants
+from dedupsqlfs.fuse.compress import delta
+
+BATCH_SIZE = 1000
+
+OPTION_FUNCTION = "rehash_function"
+OPTION_LAST = "rehash_last_id"
+OPTION_COUNT = "rehash_count"
+OPTION_UPDATED = "rehash_updated"
+OPTION_COLLISIONS = "rehash_collisions"
+
+# Compression tool and hash function of worker process
+_tool = None
+_hash_function = None
+
+
+def __init_worker(tool, hash_function):
+    global _tool, _hash_function
+    _tool = tool
+    _hash_function = hash_function
+    return
+
+
+def _rehash_batch(items):
+    """
+    @param items: list of tuples (hash_id, compression method, data)
+    @return: list of tuples (hash_id, new hash value)
+    """
+    return [ (hash_id, hashlib.new(_hash_function, _tool.decompressData(method, data)).digest(),)
+             for hash_id, method, data in items ]
+
+
+def __set_option(tableOption, name, value):
+    if tableOption.get(name) is None:
+        tableOption.insert(name, value)
+    else:
+        tableOption.update(name, value)
+    return
+
+
+def __remove_options(tableOption):
+    cur = tableOption.getCursor()
+    for name in (OPTION_FUNCTION, OPTION_LAST, OPTION_COUNT, OPTION_UPDATED, OPTION_COLLISIONS,):
+        cur.execute("DELETE FROM `%s` WHERE name=?" % tableOption.getName(), (name,))
+    tableOption.commit()
+    return
+
+
+def __get_processes(_fuse):
+    np = cpu_count()
+    limit = _fuse.getOption("cpu_limit")
+    if limit and 0 < int(limit) < np:
+        np = int(limit)
+    return np
 
 
 def do_rehash(options, _fuse):
@@ -20,10 +92,28 @@ def do_rehash(options, _fuse):
 
     isVerbose = _fuse.getOption("verbosity") > 0
 
+    tableBlock = _fuse.operations.getTable("block")
+    if _fuse.getOption("block_data_storage_on_fs") \
+            or hasattr(tableBlock, "getStorage") and tableBlock.getStorage() == constants.BLOCK_STORAGE_FS:
+        print("Rehash not supported for block data in files - they are named by hash value!")
+        return 1
+
     tableOption = _fuse.operations.getTable("option")
 
     curHashFunc = tableOption.get("hash_function")
-    if curHashFunc == options.rehash_function:
+    lastHashFunc = tableOption.get(OPTION_FUNCTION)
+
+    start_id = cnt = upd = collisions = 0
+    if lastHashFunc == options.rehash_function:
+        start_id = int(tableOption.get(OPTION_LAST) or 0)
+        cnt = int(tableOption.get(OPTION_COUNT) or 0)
+        upd = int(tableOption.get(OPTION_UPDATED) or 0)
+        collisions = int(tableOption.get(OPTION_COLLISIONS) or 0)
+    elif lastHashFunc:
+        # Other rehash interrupted - go through all hashes again
+        if isVerbose:
+            print("Previous rehash to %s was not finished, start from beginning." % lastHashFunc)
+    elif curHashFunc == options.rehash_function:
         if isVerbose:
             print("Already using %s hash function for filesystem! Do not rehashing." % curHashFunc)
         return True
@@ -37,56 +127,110 @@ def do_rehash(options, _fuse):
     hashCount = tableHash.get_count()
     if isVerbose:
         print("Ready to rehash %s blocks." % hashCount)
+        if start_id:
+            print("Continue from hash_id > %d, %d blocks processed already." % (start_id, cnt,))
 
-    cur = tableHash.getCursor(True)
+    __set_option(tableOption, OPTION_FUNCTION, options.rehash_function)
+    tableOption.commit()
 
-    # Every 100*100 (4x symbols)
-    cntNth = int(hashCount/10000.0)
-    if cntNth < 1:
-        cntNth = 1
+    np = __get_processes(_fuse)
+    pool = get_context("fork").Pool(np, __init_worker, (_fuse.getCompressTool(), options.rehash_function,))
 
-    # Process Nth blocks and then - commit
-    maxBatch = 1000
-    offBatch = 0
-    cnt = cntNext = upd = 0
+    # Results of batches in order of hash_id: (last hash_id, count, list, AsyncResult | None)
+    pending = deque()
+    collisionIds = []
+    lastPrc = ""
+    readCnt = cnt
 
-    _fuse.operations.getManager().setAutocommit(False)
-    tableHash.begin()
-    _fuse.operations.getManager().setAutocommit(True)
+    def __write(last_id, count, result, asyncResult):
+        nonlocal cnt, upd, collisions
 
-    while cnt < hashCount:
+        if asyncResult is not None:
+            result = result + asyncResult.get()
 
-        cur.execute("SELECT `id` FROM `%s` LIMIT %s OFFSET %s" % (tableHash.getName(), maxBatch, offBatch ))
-        offBatch += maxBatch
+        # New values must stay unique
+        found = tableHash.find_many([ value for hash_id, value in result ])
+        items = []
+        seen = {}
+        for hash_id, value in result:
+            if found.get(value, hash_id) != hash_id or seen.get(value, hash_id) != hash_id:
+                collisionIds.append(hash_id)
+                collisions += 1
+                continue
+            seen[ value ] = hash_id
+            items.append((hash_id, value,))
 
-        for hashItem in iter(cur.fetchone, None):
+        _fuse.operations.getManager().setAutocommit(False)
+        tableHash.begin()
+        _fuse.operations.getManager().setAutocommit(True)
 
-            cnt += 1
+        upd += tableHash.update_many(items)
+        cnt += count
 
-            blockItem = tableBlock.get(hashItem["id"])
-            hashCT = tableHashCT.get(hashItem["id"])
-            blockData = _fuse.decompressData(_fuse.operations.getCompressionTypeName(hashCT["type_id"]), blockItem["data"])
-            newHash = _fuse.operations.do_hash(blockData)
-            res = tableHash.update(hashItem["id"], newHash)
+        _fuse.operations.getManager().setAutocommit(False)
+        tableHash.commit()
+        _fuse.operations.getManager().setAutocommit(True)
+
+        __set_option(tableOption, OPTION_LAST, "%i" % last_id)
+        __set_option(tableOption, OPTION_COUNT, "%i" % cnt)
+        __set_option(tableOption, OPTION_UPDATED, "%i" % upd)
+        __set_option(tableOption, OPTION_COLLISIONS, "%i" % collisions)
+        tableOption.commit()
+        return
+
+    try:
+        while True:
+
+            hashItems = tableHash.get_batch(start_id, BATCH_SIZE)
+
+            if hashItems:
+                start_id = hashItems[-1]["id"]
+                hash_ids = [ item["id"] for item in hashItems ]
+
+                types = tableHashCT.get_types_by_hash_ids(",".join(str(hash_id) for hash_id in hash_ids))
+                blocks = tableBlock.get_many(hash_ids)
+
+                items = []
+                local = []
+                for hash_id in hash_ids:
+                    blockItem = blocks.get(hash_id)
+                    type_id = types.get(hash_id)
+                    if not blockItem or type_id is None:
+                        # Hash without data - nothing to rehash
+                        continue
 
-            if res:
-                upd += 1
+                    method = _fuse.operations.getCompressionTypeName(type_id)
+                    if delta.is_delta_method(method) or _fuse.getCompressTool().getBaseMethod(method) == "zstd_dict":
+                        # Base blocks and dictionaries are in database
+                        blockData = _fuse.operations.decompressHashData(hash_id, blockItem["data"], type_id)
+                        local.append((hash_id, _fuse.operations.do_hash(blockData),))
+                        continue
 
-            if isVerbose:
-                if cnt >= cntNext:
-                    cntNext += cntNth
-                    prc = "%6.2f%%" % (cnt * 100.0 / hashCount)
+                    items.append((hash_id, method, blockItem["data"],))
+
+                pending.append((start_id, len(hashItems), local,
+                                items and pool.apply_async(_rehash_batch, (items,)) or None,))
+                readCnt += len(hashItems)
+
+                tableBlock.shrinkMemory()
+                tableHashCT.shrinkMemory()
+
+            # Keep processes busy, but not too much data in memory
+            while pending and (not hashItems or len(pending) > np * 2):
+                __write(*pending.popleft())
+
+            if not hashItems:
+                break
+
+            prc = "%6.2f%%" % (readCnt*100.0/max(hashCount, 1))
+            if prc != lastPrc:
+                lastPrc = prc
+                if isVerbose:
                     sys.stdout.write("\r%s " % prc)
                     sys.stdout.flush()
-
-        # For ends - hash commits
-        _fuse.operations.getManager().setAutocommit(False)
-        tableHash.commit()
-        tableHash.shrinkMemory()
-        tableHashCT.shrinkMemory()
-        tableBlock.shrinkMemory()
-        tableHash.begin()
-        _fuse.operations.getManager().setAutocommit(True)
+    finally:
+        pool.terminate()
+        pool.join()
 
     if isVerbose:
         sys.stdout.write("\n")
@@ -95,19 +239,28 @@ def do_rehash(options, _fuse):
     if isVerbose:
         print("Processed %s hashes, rehashed %s blocks." % (cnt, upd,))
 
-    if hashCount == cnt:
-        _fuse.operations.getManager().setAutocommit(False)
-        tableHash.commit()
-        _fuse.operations.getManager().setAutocommit(True)
-
-        tableOption.update("hash_function", options.rehash_function)
+    if collisions and options.rehash_function == curHashFunc:
+        # Reverted - these blocks were not changed by previous rehash
+        if isVerbose:
+            print("%s blocks with same hash as other blocks kept their values." % collisions)
+    elif collisions:
+        print("%s blocks have same %s hash as other blocks, they keep old hash values." % (
+            collisions, options.rehash_function,))
+        if collisionIds:
+            print("Hash ids: %s%s" % (
+                ",".join(str(hash_id) for hash_id in collisionIds[:100]), len(collisionIds) > 100 and ",..." or "",
+            ))
+        print("Hash function not changed! Rehash with %s to revert." % curHashFunc)
+        return 1
 
-        tableHash.vacuum()
-    else:
-        _fuse.operations.getManager().setAutocommit(False)
-        tableHash.rollback()
-        _fuse.operations.getManager().setAutocommit(True)
-        print("Something went wrong? Changes are rolled back!")
+    if hashCount != cnt:
+        print("Something went wrong? Rehashed blocks are kept, run again to continue.")
         return 1
 
+    tableOption.update("hash_function", options.rehash_function)
+    # All done, next run starts from beginning
+    __remove_options(tableOption)
+
+    tableHash.vacuum()
+
     return 0
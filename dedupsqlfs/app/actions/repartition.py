@@ -0,0 +1,242 @@
+# -*- coding: utf8 -*-
+
+"""
+Special action to change count of block data partitions
+
+Partition of block is hash_id % partitions count.
+New partition N uses same file block_NNN as old one,
+so only blocks which change partition are copied:
+
+    1. copy - every old partition is read by keyset batches,
+       blocks of other new partition are copied there (INSERT OR REPLACE).
+       Old layout stays valid, copied blocks are just extra rows for it.
+       Progress is saved into option table after every batch commit.
+    2. verify - count of blocks in right places must be equal for old and new layout.
+    3. switch - 'block_partitions' option updated.
+    4. cleanup - extra rows removed from new partitions, files of removed partitions deleted.
+
+Interrupted action continues from last saved batch on next run.
+"""
+
+__author__ = 'sergey'
+
+import os
+import sys
+import shutil
+from time import time
+
+from dedupsqlfs.my_formats import format_timespan
+from dedupsqlfs.lib import constants
+
+BATCH_SIZE = 1000
+
+OPTION_TO = "repartition_to"
+OPTION_STAGE = "repartition_stage"
+OPTION_LAST = "repartition_last_%03d"
+
+
+def __set_option(tableOption, name, value):
+    if tableOption.get(name) is None:
+        tableOption.insert(name, value)
+    else:
+        tableOption.update(name, value)
+    return
+
+
+def __remove_options(tableOption, oldParts):
+    cur = tableOption.getCursor()
+    names = [ OPTION_TO, OPTION_STAGE ]
+    for n in range(oldParts):
+        names.append(OPTION_LAST % n)
+    for name in names:
+        cur.execute("DELETE FROM `%s` WHERE name=?" % tableOption.getName(), (name,))
+    return
+
+
+def __commit(*tables):
+    for t in tables:
+        t.commit()
+        t.begin()
+    return
+
+
+def __copy_blocks(tableBlock, tableOption, oldParts, newParts, isVerbose):
+    """
+    @return: int - count of copied blocks
+    """
+    copied = 0
+    for p in range(oldParts):
+
+        start_id = tableOption.get(OPTION_LAST % p)
+        if start_id is None:
+            start_id = 0
+        start_id = int(start_id)
+
+        if isVerbose:
+            print("Partition %d: copy blocks from hash_id > %d" % (p, start_id,))
+
+        while True:
+            # Partition file may receive blocks from others
+            tableBlock.waitPart(p)
+            items = tableBlock.getPart(p).get_batch(start_id, BATCH_SIZE)
+            if not items:
+                break
+
+            for item in items:
+                n = item["hash_id"] % newParts
+                if n == p:
+                    continue
+                tableBlock.queueToPart(n, "replace", item["hash_id"], item["data"])
+                copied += 1
+
+            start_id = items[-1]["hash_id"]
+
+            # Progress is saved only after blocks are written
+            __commit(tableBlock)
+            __set_option(tableOption, OPTION_LAST % p, "%i" % start_id)
+            __commit(tableOption)
+
+            if isVerbose:
+                sys.stdout.write("\r  copied %d blocks, last hash_id %d " % (copied, start_id,))
+                sys.stdout.flush()
+
+        if isVerbose:
+            sys.stdout.write("\n")
+            sys.stdout.flush()
+
+    return copied
+
+
+def __count_blocks(tableBlock, nParts):
+    count = 0
+    for n in range(nParts):
+        tableBlock.waitPart(n)
+        count += tableBlock.getPart(n).get_count_in_partition(nParts, n)
+    return count
+
+
+def __cleanup(tableBlock, tableOption, oldParts, newParts, isVerbose):
+    for n in range(newParts):
+        if n < oldParts:
+            tableBlock.queueToPart(n, "remove_not_in_partition", newParts, n)
+
+    __commit(tableBlock)
+
+    # Files of removed partitions are not used anymore
+    tableBlock.n_parts = newParts
+
+    # Removed rows left garbage in packfile segments
+    tableBlock.compact()
+
+    removed = 0
+    for n in range(newParts, oldParts):
+        t = tableBlock.getPart(n)
+        t.close(True)
+        fn = t.getDbFilePath()
+        if os.path.isfile(fn):
+            os.unlink(fn)
+            removed += 1
+        if tableBlock.getStorage() == constants.BLOCK_STORAGE_PACKFILE:
+            shutil.rmtree(t.getSegmentsPath(), True)
+
+    __remove_options(tableOption, oldParts)
+    __commit(tableOption)
+
+    if isVerbose:
+        print("Removed %d partition files." % removed)
+    return
+
+
+def do_repartition(options, _fuse):
+    """
+    @param options: Commandline options
+    @type  options: object
+
+    @param _fuse: FUSE wrapper
+    @type  _fuse: dedupsqlfs.fuse.dedupfs.DedupFS
+    """
+
+    isVerbose = _fuse.getOption("verbosity") > 0
+
+    manager = _fuse.operations.getManager()
+    if manager.TYPE != "sqlite" or _fuse.getOption("block_data_storage_on_fs"):
+        print("Repartition supported only for block data in sqlite files or packfiles!")
+        return 1
+
+    newParts = int(options.repartition)
+    if newParts < 1:
+        print("Partitions count must be 1 or more!")
+        return 1
+
+    tableOption = _fuse.operations.getTable("option")
+    tableBlock = _fuse.operations.getTable("block")
+
+    oldParts = int(tableOption.get("block_partitions") or 1)
+
+    stage = tableOption.get(OPTION_STAGE)
+    resumeTo = tableOption.get(OPTION_TO)
+    if resumeTo is not None and int(resumeTo) != newParts:
+        print("Unfinished repartition to %s partitions found! Run it again with same count." % resumeTo)
+        return 1
+
+    if stage == "cleanup":
+        # Option already switched
+        oldParts = int(tableOption.get("block_partitions_old") or oldParts)
+    elif oldParts == newParts:
+        print("Block data stored in %d partitions already." % newParts)
+        return 0
+
+    start_time = time()
+
+    if isVerbose:
+        print("Repartition block data: %d -> %d partitions." % (oldParts, newParts,))
+
+    # Own transactions for every batch
+    manager.setAutocommit(False)
+    tableOption.begin()
+
+    __set_option(tableOption, OPTION_TO, "%i" % newParts)
+
+    # All files of both layouts, every file written by own thread
+    tableBlock.n_parts = max(oldParts, newParts)
+    tableBlock.create()
+    tableBlock.startWriters()
+    tableBlock.begin()
+
+    if stage != "cleanup":
+
+        __set_option(tableOption, OPTION_STAGE, "copy")
+        __commit(tableOption)
+
+        copied = __copy_blocks(tableBlock, tableOption, oldParts, newParts, isVerbose)
+
+        countOld = __count_blocks(tableBlock, oldParts)
+        countNew = __count_blocks(tableBlock, newParts)
+        if isVerbose:
+            print("Copied %d blocks. Blocks in old layout: %d, in new layout: %d." % (copied, countOld, countNew,))
+
+        if countOld != countNew:
+            tableBlock.close(True)
+            manager.setAutocommit(True)
+            print("Block counts differ! Partitions count not changed, run action again to continue.")
+            return 1
+
+        __set_option(tableOption, "block_partitions", "%i" % newParts)
+        __set_option(tableOption, "block_partitions_old", "%i" % oldParts)
+        __set_option(tableOption, OPTION_STAGE, "cleanup")
+        __commit(tableOption)
+
+    __cleanup(tableBlock, tableOption, oldParts, newParts, isVerbose)
+
+    cur = tableOption.getCursor()
+    cur.execute("DELETE FROM `%s` WHERE name=?" % tableOption.getName(), ("block_partitions_old",))
+    __commit(tableOption)
+
+    tableBlock.close(True)
+    manager.setAutocommit(True)
+    _fuse.operations.block_partitions = newParts
+
+    if isVerbose:
+        print("Done in %s." % format_timespan(time() - start_time))
+
+    return 0
@@ -0,0 +1,146 @@
+# -*- coding: utf8 -*-
+
+"""
+Special action to train compression dictionary from stored data blocks
+"""
+
+__author__ = 'sergey'
+
+import sys
+from time import time
+from dedupsqlfs.my_formats import format_size
+
+
+def do_train_dictionary(options, _fuse):
+    """
+    Sample blocks - small ones first: tail blocks, small files,
+    then any other, decompress and train zstd dictionary.
+    New dictionary is used for new data on next mount.
+
+    @param options: Commandline options
+    @type  options: object
+
+    @param _fuse: FUSE wrapper
+    @type  _fuse: dedupsqlfs.fuse.dedupfs.DedupFS
+    """
+
+    isVerbose = _fuse.getOption("verbosity") > 0
+
+    method = "zstd_dict"
+
+    tool = _fuse.getCompressTool()
+    if not tool.hasCompressor(method):
+        print("Compression method %r not available! Install 'zstandard' python module." % method)
+        return 1
+
+    tableDict = _fuse.operations.getTable("compression_dict")
+
+    samplesCount = _fuse.getOption("dictionary_samples")
+    dictSize = _fuse.getOption("dictionary_size")
+
+    samples = get_sample_blocks(_fuse, samplesCount)
+    samplesSize = sum(len(sample) for sample in samples)
+
+    if not samples:
+        print("No data blocks to train dictionary!")
+        return 1
+
+    if isVerbose:
+        print("Train dictionary of %s from %s samples (%s)." % (
+            format_size(dictSize), len(samples), format_size(samplesSize)))
+
+    comp = tool.getCompressor(method)
+
+    try:
+        dictId, dictData = comp.trainDictionary(samples, dictSize)
+    except Exception as e:
+        print("Dictionary training failed: %s" % e)
+        return 1
+
+    if tableDict.get(dictId):
+        print("Dictionary id=%s already exists, nothing changed." % dictId)
+        return 0
+
+    tableDict.insert(dictId, method, dictData, int(time()))
+    tableDict.commit()
+
+    print("Trained dictionary id=%s, size %s. It will be used for new data by %r compression method." % (
+        dictId, format_size(len(dictData)), method))
+
+    return 0
+
+
+def get_sample_blocks(_fuse, samplesCount, smallFirst=True):
+    """
+    Sample stored data blocks - small ones first: tail blocks, small files,
+    then any other, and decompress them.
+
+    @param _fuse: FUSE wrapper
+    @type  _fuse: dedupsqlfs.fuse.dedupfs.DedupFS
+
+    @param samplesCount: how many blocks to sample
+    @type  samplesCount: int
+
+    @param smallFirst: prefer small blocks, or sample all evenly
+    @type  smallFirst: bool
+
+    @return: list of bytes
+    """
+
+    isVerbose = _fuse.getOption("verbosity") > 0
+
+    tableOption = _fuse.operations.getTable("option")
+    tableHashCT = _fuse.operations.getTable("hash_compression_type")
+    tableHashSZ = _fuse.operations.getTable("hash_sizes")
+    tableBlock = _fuse.operations.getTable("block")
+
+    blockSize = tableOption.get("block_size")
+    if blockSize:
+        blockSize = int(blockSize)
+    else:
+        blockSize = _fuse.getOption("block_size")
+
+    hashIds = []
+    if smallFirst:
+        hashIds = tableHashSZ.get_sample_hash_ids(samplesCount, int(blockSize / 2))
+    if len(hashIds) < samplesCount:
+        for hashId in tableHashSZ.get_sample_hash_ids(samplesCount):
+            if len(hashIds) >= samplesCount:
+                break
+            if hashId not in hashIds:
+                hashIds.append(hashId)
+
+    if isVerbose:
+        print("Ready to read %s sample blocks." % len(hashIds))
+
+    samples = []
+    cnt = 0
+    lastPrc = ""
+
+    for hashId in hashIds:
+
+        cnt += 1
+
+        blockItem = tableBlock.get(hashId)
+        hashCT = tableHashCT.get(hashId)
+        if not blockItem or not hashCT:
+            continue
+
+        blockData = _fuse.operations.decompressHashData(hashId, blockItem["data"], hashCT["type_id"])
+        if not blockData:
+            continue
+
+        samples.append(blockData)
+
+        prc = "%6.2f%%" % (cnt*100.0/len(hashIds))
+        if prc != lastPrc:
+            lastPrc = prc
+            if isVerbose:
+                sys.stdout.write("\r%s " % prc)
+                sys.stdout.flush()
+
+    if isVerbose:
+        sys.stdout.write("\n")
+        sys.stdout.flush()
+
+    return samples
@@ -2,6 +2,9 @@
 
 """
 Special action to vacuum all databases
+
+Incremental vacuum removes only free pages of table files,
+without rewrite of whole files.
 """
 
 __author__ = 'sergey'
@@ -106,3 +109,52 @@ def do_vacuum(options, _fuse):
     """
     forced_vacuum(_fuse, options)
     return 0
+
+def incremental_vacuum(app, options):
+    """
+    @param app:
+    @type app: dedupsqlfs.fuse.dedupfs.DedupFS
+    @return: int - count of removed pages
+    """
+    start_time = time()
+    pages = int(options.vacuum_incremental)
+    app.getLogger().info("Performing incremental data vacuum, up to %d pages ..", pages)
+
+    manager = app.operations.getManager()
+
+    # Open all tables, subvolumes tables too
+    for table_name in manager.tables:
+        app.operations.getTable(table_name)
+    for subvol_id in app.operations.getTable('subvolume').get_ids():
+        for table_name in ("tree", "inode", "link", "xattr", "inode_hash_block", "inode_option",):
+            manager.getTable("%s_%d" % (table_name, subvol_id,))
+
+    dbsz = manager.getSize()
+    freed = manager.incrementalVacuum(pages)
+    sz = dbsz - manager.getSize()
+
+    elapsed_time = time() - start_time
+
+    if app.getOption("parsable"):
+        app.getLogger().info("Pages: %d", freed)
+        app.getLogger().info("Diff bytes: -%s", format_size(sz))
+        app.getLogger().info("Time: %s", format_timespan(elapsed_time))
+    else:
+        app.getLogger().info("Removed %d free pages, DB size change: -%.2f%% (-%s)",
+                             freed, sz * 100.0 / max(dbsz, 1), format_size(sz))
+        app.getLogger().info("Finished incremental data vacuum in %s.", format_timespan(elapsed_time))
+
+    return freed
+
+def do_vacuum_incremental(options, _fuse):
+    """
+    Remove free pages of table files, not more than selected count
+
+    @param options: Commandline options
+    @type  options: object
+
+    @param _fuse: FUSE wrapper
+    @type  _fuse: dedupsqlfs.fuse.dedupfs.DedupFS
+    """
+    incremental_vacuum(_fuse, options)
+    return 0
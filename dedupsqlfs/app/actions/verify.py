@@ -2,11 +2,89 @@
 
 """
 Special action to verify all data hashes
+
+Hashes are read by keyset batches of hash_id, with compression types
+and block data of whole batch - one query per block partition.
+Decompression and hashing of batches go in process pool,
+delta and dictionary compressed blocks need database - verified in main process.
+
+Last verified hash_id and counters are saved into option table after every batch,
+so interrupted action continues from there on next run.
 """
 
 __author__ = 'sergey'
 
 import sys
+import hashlib
+from time import time, sleep
+from collections import deque
+from multiprocessing import get_context, cpu_count
+
+from dedupsqlfs.my_formats import format_size, format_timespan
+from dedupsqlfs.fuse.compress import delta
+
+BATCH_SIZE = 1000
+
+OPTION_LAST = "verify_last_id"
+OPTION_COUNT = "verify_count"
+OPTION_EQUAL = "verify_equal"
+
+# Compression tool and hash function of worker process
+_tool = None
+_hash_function = None
+
+
+def __init_worker(tool, hash_function):
+    global _tool, _hash_function
+    _tool = tool
+    _hash_function = hash_function
+    return
+
+
+def _verify_batch(items):
+    """
+    @param items: list of tuples (hash_id, compression method, data, hash value)
+    @return: tuple (count, equal, bad hash ids, raw data size)
+    """
+    equal = 0
+    size = 0
+    bad = []
+    for hash_id, method, data, value in items:
+        try:
+            data = _tool.decompressData(method, data)
+        except Exception:
+            bad.append(hash_id)
+            continue
+        size += len(data)
+        if hashlib.new(_hash_function, data).digest() == value:
+            equal += 1
+        else:
+            bad.append(hash_id)
+    return len(items), equal, bad, size
+
+
+def __set_option(tableOption, name, value):
+    if tableOption.get(name) is None:
+        tableOption.insert(name, value)
+    else:
+        tableOption.update(name, value)
+    return
+
+
+def __remove_options(tableOption):
+    cur = tableOption.getCursor()
+    for name in (OPTION_LAST, OPTION_COUNT, OPTION_EQUAL,):
+        cur.execute("DELETE FROM `%s` WHERE name=?" % tableOption.getName(), (name,))
+    tableOption.commit()
+    return
+
+
+def __get_processes(_fuse):
+    np = cpu_count()
+    limit = _fuse.getOption("cpu_limit")
+    if limit and 0 < int(limit) < np:
+        np = int(limit)
+    return np
 
 
 def do_verify(options, _fuse):
@@ -18,6 +96,8 @@ def do_verify(options, _fuse):
     @type  _fuse: dedupsqlfs.fuse.dedupfs.DedupFS
     """
 
+    isVerbose = _fuse.getOption("verbosity") > 0
+
     tableOption = _fuse.operations.getTable("option")
 
     curHashFunc = tableOption.get("hash_function")
@@ -28,42 +108,146 @@ def do_verify(options, _fuse):
 
     _fuse.operations.hash_function = curHashFunc
 
+    # Rate limit of stored data reading, MB/s
+    rate = _fuse.getOption("verify_rate") or 0
+    rate *= 1024 * 1024
+
     hashCount = tableHash.get_count()
-    if _fuse.getOption("verbosity") > 0:
+
+    start_id = int(tableOption.get(OPTION_LAST) or 0)
+    cnt = int(tableOption.get(OPTION_COUNT) or 0)
+    equal = int(tableOption.get(OPTION_EQUAL) or 0)
+
+    if isVerbose:
         print("Ready to verify %s blocks." % hashCount)
+        if start_id:
+            print("Continue from hash_id > %d, %d blocks verified already." % (start_id, cnt,))
+
+    np = __get_processes(_fuse)
+    pool = get_context("fork").Pool(np, __init_worker, (_fuse.getCompressTool(), curHashFunc,))
 
-    cur = tableHash.getCursor(True)
-    cur.execute("SELECT * FROM `%s`" % tableHash.getName())
+    # Results of batches in order of hash_id: (last hash_id, AsyncResult | tuple)
+    pending = deque()
 
-    cnt = equal = 0
+    badIds = []
+    readSize = 0
+    rawSize = 0
+    start_time = time()
     lastPrc = ""
 
-    for hashItem in iter(cur.fetchone, None):
+    def __done(result):
+        nonlocal cnt, equal, rawSize
+        c, e, bad, size = result
+        cnt += c
+        equal += e
+        rawSize += size
+        badIds.extend(bad)
+        return
 
-        cnt += 1
+    def __checkpoint(last_id):
+        __set_option(tableOption, OPTION_LAST, "%i" % last_id)
+        __set_option(tableOption, OPTION_COUNT, "%i" % cnt)
+        __set_option(tableOption, OPTION_EQUAL, "%i" % equal)
+        tableOption.commit()
+        return
 
-        blockItem = tableBlock.get(hashItem["id"])
-        hashCT = tableHashCT.get(hashItem["id"])
-        blockData = _fuse.decompressData(_fuse.operations.getCompressionTypeName(hashCT["type_id"]), blockItem["data"])
+    try:
+        while True:
 
-        newHash = _fuse.operations.do_hash(blockData)
+            hashItems = tableHash.get_batch(start_id, BATCH_SIZE)
 
-        if newHash == hashItem["value"]:
-            equal += 1
+            if hashItems:
+                start_id = hashItems[-1]["id"]
+                hash_ids = [ item["id"] for item in hashItems ]
+
+                types = tableHashCT.get_types_by_hash_ids(",".join(str(hash_id) for hash_id in hash_ids))
+                blocks = tableBlock.get_many(hash_ids)
 
-        prc = "%6.2f%%" % (cnt*100.0/hashCount)
-        if prc != lastPrc:
-            lastPrc = prc
-            if _fuse.getOption("verbosity") > 0:
-                sys.stdout.write("\r%s " % prc)
-                sys.stdout.flush()
+                items = []
+                local = [0, 0, [], 0]
+                for hashItem in hashItems:
+                    hash_id = hashItem["id"]
+                    blockItem = blocks.get(hash_id)
+                    type_id = types.get(hash_id)
+                    if not blockItem or type_id is None:
+                        local[0] += 1
+                        local[2].append(hash_id)
+                        continue
 
-    if _fuse.getOption("verbosity") > 0:
+                    readSize += len(blockItem["data"])
+                    method = _fuse.operations.getCompressionTypeName(type_id)
+                    if delta.is_delta_method(method) or _fuse.getCompressTool().getBaseMethod(method) == "zstd_dict":
+                        # Base blocks and dictionaries are in database
+                        local[0] += 1
+                        try:
+                            blockData = _fuse.operations.decompressHashData(hash_id, blockItem["data"], type_id)
+                        except Exception:
+                            # Broken delta or missing base block
+                            local[2].append(hash_id)
+                            continue
+                        local[3] += len(blockData)
+                        if _fuse.operations.do_hash(blockData) == hashItem["value"]:
+                            local[1] += 1
+                        else:
+                            local[2].append(hash_id)
+                        continue
+
+                    items.append((hash_id, method, blockItem["data"], hashItem["value"],))
+
+                pending.append((start_id, tuple(local),))
+                if items:
+                    pending.append((start_id, pool.apply_async(_verify_batch, (items,)),))
+
+            # Keep processes busy, but not too much data in memory
+            while pending and (not hashItems or len(pending) > np * 2):
+                last_id, result = pending.popleft()
+                if not isinstance(result, tuple):
+                    result = result.get()
+                __done(result)
+                if not pending or pending[0][0] != last_id:
+                    __checkpoint(last_id)
+
+            if not hashItems:
+                break
+
+            if rate > 0:
+                # Throttle reading of stored data
+                elapsed = time() - start_time
+                wait = readSize / rate - elapsed
+                if wait > 0:
+                    sleep(wait)
+
+            prc = "%6.2f%%" % (cnt*100.0/max(hashCount, 1))
+            if prc != lastPrc:
+                lastPrc = prc
+                if isVerbose:
+                    elapsed = max(time() - start_time, 0.001)
+                    sys.stdout.write("\r%s %s/s " % (prc, format_size(readSize / elapsed),))
+                    sys.stdout.flush()
+    finally:
+        pool.terminate()
+        pool.join()
+
+    elapsed = max(time() - start_time, 0.001)
+
+    if isVerbose:
         sys.stdout.write("\n")
         sys.stdout.flush()
 
-    if _fuse.getOption("verbosity") > 0:
+    if isVerbose:
         print("Processed %s hashes, equal %s blocks." % (cnt, equal,))
+        print("Read %s of stored data (%s/s), verified %s of raw data (%s/s) in %s." % (
+            format_size(readSize), format_size(readSize / elapsed),
+            format_size(rawSize), format_size(rawSize / elapsed),
+            format_timespan(elapsed),
+        ))
+        if badIds:
+            print("Bad blocks hash ids: %s%s" % (
+                ",".join(str(hash_id) for hash_id in badIds[:100]), len(badIds) > 100 and ",..." or "",
+            ))
+
+    # All done, next run starts from beginning
+    __remove_options(tableOption)
 
     if hashCount != cnt:
         print("Something went wrong?")
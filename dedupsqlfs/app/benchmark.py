@@ -0,0 +1,116 @@
+# -*- coding: utf8 -*-
+"""
+Compression benchmark of data corpora,
+results are written as JSON
+
+@author: Sergey Dryabzhinsky
+"""
+
+import sys
+import json
+import logging
+import argparse
+import platform
+from time import time
+
+import dedupsqlfs
+from dedupsqlfs.lib import constants
+from dedupsqlfs.benchmark import CompressionBenchmark, make_corpus
+from dedupsqlfs.benchmark.corpus import CORPUS_TYPES
+
+
+def main():
+
+    parser = argparse.ArgumentParser(
+        prog="%s/%s benchmark python/%s" % (dedupsqlfs.__name__, dedupsqlfs.__version__, sys.version.split()[0]),
+        conflict_handler="resolve")
+
+    # Register some custom command line options with the option parser.
+    parser.add_argument('-h', '--help', action='help', help="show this help message and exit")
+    parser.add_argument('-v', '--verbose', action='count', dest='verbosity', default=0, help="increase verbosity")
+
+    # Dynamically check for supported compression methods.
+    compression_methods = []
+    for modname in constants.COMPRESSION_SUPPORTED:
+        try:
+            module = __import__(constants.COMPRESSION_MODULES.get(modname, modname))
+            if hasattr(module, 'compress') and hasattr(module, 'decompress'):
+                compression_methods.append(modname)
+        except ImportError:
+            pass
+
+    parser.add_argument('--method', dest='methods', metavar='METHOD', action='append', choices=compression_methods,
+                        help="Compression method to test, can be used multiple times: one of %s. Defaults to all of them." % (
+                            ', '.join('%r' % mth for mth in compression_methods)))
+    parser.add_argument('--level', dest='levels', metavar='LEVEL', action='append',
+                        help="Compression level to test, can be used multiple times: one of 'fast', 'default', 'normal', 'best'; or INT. Defaults to all named levels.")
+    parser.add_argument('--block-size', dest='block_sizes', metavar='BYTES', action='append', type=int,
+                        help="Block size to test, can be used multiple times. Defaults to %d." % constants.BLOCK_SIZE_DEFAULT)
+    parser.add_argument('--corpus', dest='corpora', metavar='CORPUS', action='append',
+                        help="Data corpus, can be used multiple times: one of %s. Use 'file:PATH' for any file, 'samples:PATH' for blocks exported by 'do.dedupsqlfs --export-samples'. Defaults to 'text', 'binary', 'random'." % (
+                            ', '.join('%r' % c for c in CORPUS_TYPES)))
+    parser.add_argument('--corpus-size', dest='corpus_size', metavar='BYTES', type=int, default=8*1024*1024,
+                        help="Size of generated corpus, maximum size of read one. Defaults to 8 MiB.")
+    parser.add_argument('--seed', dest='seed', metavar='INT', type=int, default=0,
+                        help="Seed for synthetic data generators. Defaults to 0.")
+    parser.add_argument('--rounds', dest='rounds', metavar='N', type=int, default=3,
+                        help="How many times to (de)compress every block. Defaults to 3.")
+    parser.add_argument('--compression-frame-size', dest='compression_frame_size', metavar='BYTES', type=int, default=0,
+                        help="Compress blocks by seekable sub-frames of BYTES size, like mount option does. Defaults to 0 - disabled.")
+    parser.add_argument('--output', dest='output', metavar='FILE',
+                        help="Write JSON results into FILE. Defaults to stdout.")
+
+    args = parser.parse_args()
+
+    logger = logging.getLogger("benchmark")
+    logger.addHandler(logging.StreamHandler(sys.stderr))
+    if args.verbosity > 1:
+        logger.setLevel(logging.DEBUG)
+    else:
+        logger.setLevel(logging.WARNING)
+
+    methods = args.methods or compression_methods
+    levels = args.levels or [
+        constants.COMPRESSION_LEVEL_FAST, constants.COMPRESSION_LEVEL_DEFAULT,
+        constants.COMPRESSION_LEVEL_NORM, constants.COMPRESSION_LEVEL_BEST,
+    ]
+    block_sizes = args.block_sizes or [ constants.BLOCK_SIZE_DEFAULT ]
+    corpora_specs = args.corpora or [ 'text', 'binary', 'random' ]
+
+    progress = None
+    if args.verbosity > 0:
+        def progress(message):
+            sys.stderr.write("%s\n" % message)
+            sys.stderr.flush()
+
+    corpora = []
+    for spec in corpora_specs:
+        corpus = make_corpus(spec, args.corpus_size, args.seed)
+        if progress:
+            progress("Corpus %s: %d bytes" % (corpus.name, corpus.getSize(),))
+        corpora.append(corpus)
+
+    bench = CompressionBenchmark(methods, levels, block_sizes, logger, args.compression_frame_size)
+    bench.rounds = args.rounds
+
+    report = {
+        "created": int(time()),
+        "version": dedupsqlfs.__version__,
+        "python": sys.version.split()[0],
+        "machine": platform.machine(),
+        "rounds": args.rounds,
+        "compression_frame_size": args.compression_frame_size,
+        "corpora": [ { "name": corpus.name, "bytes": corpus.getSize() } for corpus in corpora ],
+        "results": bench.run(corpora, progress),
+    }
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+
+    return 0
+
+# vim: ts=4 sw=4 et
@@ -132,6 +132,35 @@ def calc_subvol_diff(options, _fuse):
     _fuse.operations.destroy()
     return
 
+def recalculate_stats(options, _fuse):
+    """
+    @param options: Commandline options
+    @type  options: object
+
+    @param _fuse: FUSE wrapper
+    @type  _fuse: dedupsqlfs.fuse.dedupfs.DedupFS
+    """
+    _fuse.setReadonly(True)
+
+    from dedupsqlfs.fuse.subvolume import Subvolume
+    sv = Subvolume(_fuse.operations)
+
+    if options.recalculate_stats:
+        names = [ options.recalculate_stats.encode('utf8') ]
+    else:
+        tableSubvol = _fuse.operations.getTable('subvolume')
+        names = [ tableSubvol.get(subvol_id)["name"] for subvol_id in tableSubvol.get_ids('created_at') ]
+
+    for name in names:
+        sv.print_msg("Recalculate stats of %r ... " % name.decode())
+        usage = sv.recalculate_stats(name)
+        if usage:
+            sv.print_msg("apparent size: %s, unique size: %s\n" % (
+                format_size(usage["apparentSize"]), format_size(usage["uniqueSize"]),))
+
+    _fuse.operations.destroy()
+    return
+
 def decompress_subvol_tables(options, _fuse):
     """
     @param options: Commandline options
@@ -411,6 +440,42 @@ def recompress(options, _fuse):
     _fuse.operations.destroy()
     return ret
 
+def export_samples(options, _fuse):
+    """
+    @param options: Commandline options
+    @type  options: object
+
+    @param _fuse: FUSE wrapper
+    @type  _fuse: dedupsqlfs.fuse.dedupfs.DedupFS
+    """
+    _fuse.setOption("use_transactions", False)
+    _fuse.setOption("synchronous", False)
+    _fuse.setReadonly(True)
+
+    from dedupsqlfs.app.actions.export_samples import do_export_samples
+    ret = do_export_samples(options, _fuse)
+
+    _fuse.operations.destroy()
+    return ret
+
+def train_dictionary(options, _fuse):
+    """
+    @param options: Commandline options
+    @type  options: object
+
+    @param _fuse: FUSE wrapper
+    @type  _fuse: dedupsqlfs.fuse.dedupfs.DedupFS
+    """
+    _fuse.setOption("use_transactions", False)
+    _fuse.setOption("synchronous", False)
+    _fuse.setReadonly(True)
+
+    from dedupsqlfs.app.actions.train_dictionary import do_train_dictionary
+    ret = do_train_dictionary(options, _fuse)
+
+    _fuse.operations.destroy()
+    return ret
+
 def print_fs_stats(options, _fuse):
     _fuse.setReadonly(True)
     lvl = _fuse.getLogger().getEffectiveLevel()
@@ -434,6 +499,29 @@ def data_vacuum(options, _fuse):
     return ret
 
 
+def data_vacuum_incremental(options, _fuse):
+    _fuse.operations.init()
+
+    from dedupsqlfs.app.actions.vacuum import do_vacuum_incremental
+
+    ret = do_vacuum_incremental(options, _fuse)
+
+    _fuse.operations.destroy()
+    return ret
+
+
+def data_repartition(options, _fuse):
+    _fuse.setOption("use_transactions", False)
+    _fuse.operations.init()
+
+    from dedupsqlfs.app.actions.repartition import do_repartition
+
+    ret = do_repartition(options, _fuse)
+
+    _fuse.operations.destroy()
+    return ret
+
+
 def data_defragment(options, _fuse):
     _fuse.operations.init()
 
@@ -445,6 +533,18 @@ def data_defragment(options, _fuse):
     return ret
 
 
+def data_defragment_locality(options, _fuse):
+    _fuse.setOption("use_transactions", False)
+    _fuse.operations.init()
+
+    from dedupsqlfs.app.actions.defragment_locality import do_defragment_locality
+
+    ret = do_defragment_locality(options, _fuse)
+
+    _fuse.operations.destroy()
+    return ret
+
+
 def data_defragment_clustered(options, _fuse):
     _fuse.operations.init()
 
@@ -506,6 +606,12 @@ def do(options, compression_methods=None):
         if options.recompress_data:
             ret = recompress(options, _fuse)
 
+        if options.train_dictionary:
+            ret = train_dictionary(options, _fuse)
+
+        if options.export_samples:
+            ret = export_samples(options, _fuse)
+
         if options.subvol_create:
             create_subvolume(options, _fuse)
 
@@ -521,6 +627,9 @@ def do(options, compression_methods=None):
         if options.subvol_diff:
             calc_subvol_diff(options, _fuse)
 
+        if options.recalculate_stats is not None:
+            recalculate_stats(options, _fuse)
+
         if options.decompress_subvol_tables:
             decompress_subvol_tables(options, _fuse)
 
@@ -572,9 +681,18 @@ def do(options, compression_methods=None):
         if options.defragment_clustered:
             data_defragment_clustered(options, _fuse)
 
+        if options.defragment_locality:
+            ret = data_defragment_locality(options, _fuse)
+
+        if options.repartition:
+            ret = data_repartition(options, _fuse)
+
         if options.vacuum:
             data_vacuum(options, _fuse)
 
+        if options.vacuum_incremental:
+            data_vacuum_incremental(options, _fuse)
+
         if options.print_stats:
             print_fs_stats(options, _fuse)
 
@@ -629,13 +747,22 @@ def main(): # {{{1
     generic.add_argument('--data', dest='data', metavar='DIRECTORY', default="~/data", help="Specify the base location for the files in which metadata and blocks data is stored. Defaults to ~/data")
     generic.add_argument('--data-clustered', dest='data_clustered', metavar='DIRECTORY', default="~/data", help="Specify the base location for the files in which blocks, hash, names data is stored for multiple nodes backups. Defaults to ~/data, no clustering.")
     generic.add_argument('--block-partitions', dest='block_partitions', metavar='COUNT', default=1, type=int, help="Store block data across several (COUNT) tables to make them smaller. Default 1.")
+    generic.add_argument('--block-partition-path', dest='block_partition_path', metavar='N:DIRECTORY', action='append', help="Store block partition N file in other DIRECTORY, on other device for example. Can be used multiple times. Stored in filesystem options, stored directories are used always and can't be changed.")
+    generic.add_argument('--block-storage', dest='block_storage', metavar='TYPE', choices=constants.BLOCK_STORAGE_TYPES, default=None, help="Where block data is stored: 'sqlite' - rows of sqlite tables, 'packfile' - appended into segment files, indexed by sqlite table. Stored in filesystem options on creation, stored one is used always. Default for new filesystem: 'sqlite'.")
+    generic.add_argument('--packfile-segment-size', dest='packfile_segment_size', metavar='BYTES', default=constants.PACKFILE_SEGMENT_SIZE_DEFAULT, type=int, help="Size of packfile segment file, new one is started when it is full. Default: %d." % constants.PACKFILE_SEGMENT_SIZE_DEFAULT)
+    generic.add_argument('--hash-prefix-index', dest='hash_prefix_index', action='store_true', help="Index first 8 bytes of hash value as integer instead of whole value. Makes hash index smaller for huge count of blocks. Existing hash table is converted on mount.")
+    generic.add_argument('--hash-meta', dest='hash_meta', action='store_true', help="Keep compression type, sizes and references count of hashes also in one merged table, so block read needs one lookup instead of three. Once enabled, it is used always.")
+    generic.add_argument('--online-gc', dest='online_gc', action='store_true', help="Queue hashes of removed subvolume for online garbage collector, they are removed on next mount with --online-gc.")
     generic.add_argument('--name', dest='name', metavar='DATABASE', default="dedupsqlfs", help="Specify the name for the database directory in which metadata and blocks data is stored. Defaults to dedupsqlfs")
     generic.add_argument('--temp', dest='temp', metavar='DIRECTORY', help="Specify the location for the files in which temporary data is stored. By default honour TMPDIR environment variable value.")
     generic.add_argument('--no-transactions', dest='use_transactions', action='store_false', help="Don't use transactions when making multiple related changes, this might make the file system faster or slower (?).")
     generic.add_argument('--no-sync', dest='synchronous', action='store_false', help="Disable SQLite's normal synchronous behavior which guarantees that data is written to disk immediately, because it slows down the file system too much (this means you might lose data when the mount point isn't cleanly unmounted).")
 
     generic.add_argument('-b', '--block-size', dest='block_size', metavar='BYTES', default=1024*64, type=int, help="Specify the maximum block size in bytes" + option_stored_in_db + ". Defaults to 64kB.")
-    generic.add_argument('--journal-mode', dest='journal_mode', metavar='MODE (str)', choices=('wal','memory','off',), default='wal', help="Journal mode for files by engine sqlite. One of: wal, memory, off. Default - wal")
+    generic.add_argument('--journal-mode', dest='journal_mode', metavar='MODE (str)', choices=('wal','truncate','delete','memory','off',), default='wal', help="Journal mode for files by engine sqlite. One of: wal, truncate, delete, memory, off. Default - wal")
+    generic.add_argument('--sqlite-attach', dest='sqlite_attach', action='store_true', help="Attach sqlite files of tables to one connection, so every flush is one transaction across all of them. Atomic across files only with 'truncate' or 'delete' journal mode.")
+    generic.add_argument('--cache-size-per-table', dest='cache_size_per_table', metavar='BYTES', type=int, default=constants.SQLITE_CACHE_SIZE_DEFAULT, help="Page cache size of every sqlite table file. Block tables use it as is, hash index tables - twice more, metadata tables - half of it. Defaults to 64 MB.")
+    generic.add_argument('--sqlite-mmap-size', dest='sqlite_mmap_size', metavar='BYTES', type=int, default=constants.SQLITE_MMAP_SIZE_DEFAULT, help="Memory-mapped I/O size of sqlite block and hash index table files, reads go without copying into page cache. Set to 0 to disable. Defaults to 256 MB.")
     generic.add_argument('--auto-vacuum', dest='auto_vacuum', metavar='MODE (int)',type=int, choices=(0,1,2,),default=2, help="Auto vacuum mode for files (truncate if possible) by engine sqlite. One of: 0,1,2. Which is:0 - none,1 - full, 2 - incremental. Default: incremental - .")
     generic.add_argument('--memory-limit', dest='memory_limit', action='store_true', help="Use some lower values for less memory consumption.")
 
@@ -668,14 +795,18 @@ def main(): # {{{1
     data.add_argument('--check-tree-inodes', dest='check_tree_inodes', action='store_true', help="Check if inodes exists in fs tree on fs usage calculation. Applies to subvolume and snapshot stats calculation too.")
     data.add_argument('--defragment', dest='defragment', action='store_true', help="Defragment common stored data, do garbage collection.")
     data.add_argument('--defragment-clustered', dest='defragment_clustered', action='store_true', help="Defragment clustered stored data, do garbage collection.")
+    data.add_argument('--defragment-locality', dest='defragment_locality', metavar='SUBVOLUME', nargs='?', const=constants.ROOT_SUBVOLUME_NAME.decode(), help="Rewrite block data files so blocks of every file of SUBVOLUME go one after another, for sequential reads. Defaults to root subvolume. Prints seek distance before and after.")
+    data.add_argument('--repartition', dest='repartition', metavar='COUNT', type=int, default=0, help="Move block data into COUNT partitions. Only blocks which change partition are copied, by batches, in parallel. Interrupted action continues on next run with same COUNT.")
     data.add_argument('--vacuum', dest='vacuum', action='store_true', help="Optimize tables by size, force SQLite to 'vacuum' databases, MySQL to run OPTIMIZE on tables.")
     data.add_argument('--vacuum-if-last-time-more-than-days', dest='vacuum_older_than', metavar='DAYS_COUNT', type=int, default=0, help="Do vacuum only if last time was more than DAYS_COUNT ago. To disable check - set value less or equal 0.")
+    data.add_argument('--vacuum-incremental', dest='vacuum_incremental', metavar='PAGES', type=int, default=0, help="Remove up to PAGES free pages of SQLite files, tables with bigger part of free pages go first. Files are not rewritten, works only for 'incremental' auto vacuum mode.")
     data.add_argument('--new-block-size', dest='new_block_size', metavar='BYTES', default=constants.BLOCK_SIZE_DEFAULT, type=int, help="Specify the new block size in bytes. Defaults to 64kB. (@todo)")
     data.add_argument(
         '--maximum-block-size', dest='maximum_block_size', metavar='BYTES', default=constants.BLOCK_SIZE_MAX, type=int,
         help="R|Specify the maximum block size in bytes for defragmentation.\n Defaults to %dMB. (@todo)" % (constants.BLOCK_SIZE_MAX/1024/1024,))
 
-    data.add_argument('--verify', dest='verify', action='store_true', help="Verify all stored data hashes.")
+    data.add_argument('--verify', dest='verify', action='store_true', help="Verify all stored data hashes. Blocks are decompressed and hashed by process pool, see --cpu-limit. Interrupted verification continues from last verified block on next run.")
+    data.add_argument('--verify-rate', dest='verify_rate', metavar='MBPS', type=float, default=0, help="Limit reading of stored data by --verify to N megabytes per second. Defaults to 0 - no limit.")
 
     # Dynamically check for supported hashing algorithms.
     msg = "Specify the hashing algorithm that will be used to recognize duplicate data blocks: one of %s. Choose wisely - it can't be changed on the fly."
@@ -702,7 +833,7 @@ def main(): # {{{1
     compression_methods_cmd = [constants.COMPRESSION_TYPE_NONE]
     for modname in constants.COMPRESSION_SUPPORTED:
         try:
-            module = __import__(modname)
+            module = __import__(constants.COMPRESSION_MODULES.get(modname, modname))
             if hasattr(module, 'compress') and hasattr(module, 'decompress'):
                 compression_methods.append(modname)
                 if modname not in constants.COMPRESSION_READONLY:
@@ -725,6 +856,7 @@ def main(): # {{{1
     msg += "\nDefaults to %r." % constants.COMPRESSION_TYPE_NONE
 
     grp_compress.add_argument('--recompress', dest='recompress_data', action="store_true", help="Do compression of all data blocks again with selected compresstion methods by --compress param. It may take double block-table free system space!")
+    grp_compress.add_argument('--recompress-method', dest='recompress_methods', metavar='METHOD', action="append", help="Recompress by --recompress only blocks stored with this compression method, like 'zlib' or 'lzma,lz4'. Method level is not stored with block and ignored here. Option can be used many times.")
     grp_compress.add_argument(
         '--compress', dest='compression', metavar='METHOD', action="append",
         default=[constants.COMPRESSION_TYPE_NONE], help=msg)
@@ -735,6 +867,9 @@ def main(): # {{{1
 
     levels = (constants.COMPRESSION_LEVEL_DEFAULT, constants.COMPRESSION_LEVEL_FAST, constants.COMPRESSION_LEVEL_NORM, constants.COMPRESSION_LEVEL_BEST)
 
+    grp_compress.add_argument('--compression-frame-size', dest='compression_frame_size', metavar='BYTES', type=int, default=0,
+                        help="Compress blocks bigger than BYTES as independent sub-frames of BYTES size, in seekable format. Small random reads decompress only touched frames. Minimum %i. Defaults to 0 - disabled." % constants.COMPRESSION_FRAME_SIZE_MIN)
+
     grp_compress.add_argument('--compression-level', dest='compression_level', metavar="LEVEL", default=constants.COMPRESSION_LEVEL_DEFAULT,
                         help="Compression level ratio: one of %s; or INT. Defaults to %r. Not all methods support this option." % (
                             ', '.join('%r' % lvl for lvl in levels), constants.COMPRESSION_LEVEL_DEFAULT
@@ -742,6 +877,12 @@ def main(): # {{{1
     # Do not want 'best' after help setup
     grp_compress.add_argument('--recompress-path', dest='recompress_path', metavar='PATH', help="Compress file or entire directory with new compression method. (@todo)")
 
+    grp_compress.add_argument('--train-dictionary', dest='train_dictionary', action="store_true", help="Train new compression dictionary for 'zstd_dict' method from sampled stored data blocks, small ones first. Used for new data on next mount.")
+    grp_compress.add_argument('--dictionary-size', dest='dictionary_size', metavar='BYTES', type=int, default=112640, help="Maximum size of trained dictionary. Defaults to 110 KiB.")
+    grp_compress.add_argument('--dictionary-samples', dest='dictionary_samples', metavar='COUNT', type=int, default=10000, help="How many data blocks to sample for dictionary training. Defaults to 10000.")
+    grp_compress.add_argument('--export-samples', dest='export_samples', metavar='FILE', help="Export sampled stored data blocks into FILE, for 'benchmark.dedupsqlfs --corpus samples:FILE'.")
+    grp_compress.add_argument('--export-samples-count', dest='export_samples_count', metavar='COUNT', type=int, default=1000, help="How many data blocks to export. Defaults to 1000.")
+
     # Dynamically check for supported compression programs
     compression_progs = [constants.COMPRESSION_PROGS_NONE]
     for pname, opts in constants.COMPRESSION_PROGS.items():
@@ -777,11 +918,12 @@ def main(): # {{{1
 
     subvol = parser.add_argument_group('Subvolume')
     subvol.add_argument('--list-subvol', dest='subvol_list', action='store_true', help="Show list of all subvolumes")
-    subvol.add_argument('--list-subvol-with-stats', dest='subvol_list_with_stats', action='store_true', help="Show more statistics in subvolumes list. Slow.")
+    subvol.add_argument('--list-subvol-with-stats', dest='subvol_list_with_stats', action='store_true', help="Show more statistics in subvolumes list. Slow if usage counters are not calculated yet.")
     subvol.add_argument('--create-subvol', dest='subvol_create', metavar='NAME', help="Create new subvolume")
     subvol.add_argument('--remove-subvol', dest='subvol_remove', metavar='NAME', help="Remove selected subvolume")
     subvol.add_argument('--subvol-stats', dest='subvol_stats', metavar='NAME', help="Print information about selected subvolume")
     subvol.add_argument('--calc-subvol-diff', dest='subvol_diff', metavar='NAME', help="Recalculate information about difference between @root and selected subvolume")
+    subvol.add_argument('--recalculate-stats', dest='recalculate_stats', metavar='NAME', nargs='?', const='', default=None, help="Rebuild usage counters and statistics of selected subvolume or snapshot, all of them if NAME not set. Counters are changed by mounted FS after that, so stats are not calculated again.")
 
     subvol.add_argument('--decompress-subvol-tables', dest='decompress_subvol_tables', action='store_true', help="Decompress all subvolumes sqlite table files")
     subvol.add_argument('--compress-subvol-tables', dest='compress_subvol_tables', action='store_true', help="Compress all subvolumes sqlite table files")
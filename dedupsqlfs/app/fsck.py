@@ -116,7 +116,7 @@ def main(): # {{{1
     compression_methods_cmd = [constants.COMPRESSION_TYPE_NONE]
     for modname in constants.COMPRESSION_SUPPORTED:
         try:
-            module = __import__(modname)
+            module = __import__(constants.COMPRESSION_MODULES.get(modname, modname))
             if hasattr(module, 'compress') and hasattr(module, 'decompress'):
                 compression_methods.append(modname)
                 if modname not in constants.COMPRESSION_READONLY:
@@ -84,6 +84,11 @@ def main(): # {{{1
     parser.add_argument('--data', dest='data', metavar='DIRECTORY', default="~/data", help="Specify the base location for the files in which metadata and blocks data is stored. Defaults to ~/data")
     parser.add_argument('--data-clustered', dest='data_clustered', metavar='DIRECTORY', default="~/data", help="Specify the base location for the files in which blocks, hash, names data is stored for multiple nodes backups. Defaults to ~/data, no clustering.")
     parser.add_argument('--block-partitions', dest='block_partitions', metavar='COUNT', default=1, type=int, help="Store block data across several (COUNT) tables to make them smaller. Default 1.")
+    parser.add_argument('--block-partition-path', dest='block_partition_path', metavar='N:DIRECTORY', action='append', help="Store block partition N file in other DIRECTORY, on other device for example. Can be used multiple times. Stored in filesystem options, stored directories are used always and can't be changed.")
+    parser.add_argument('--block-storage', dest='block_storage', metavar='TYPE', choices=constants.BLOCK_STORAGE_TYPES, default=constants.BLOCK_STORAGE_SQLITE, help="Where block data is stored: 'sqlite' - rows of sqlite tables, 'packfile' - appended into segment files, indexed by sqlite table. Stored in filesystem options on creation. Default: 'sqlite'.")
+    parser.add_argument('--packfile-segment-size', dest='packfile_segment_size', metavar='BYTES', default=constants.PACKFILE_SEGMENT_SIZE_DEFAULT, type=int, help="Size of packfile segment file, new one is started when it is full. Default: %d." % constants.PACKFILE_SEGMENT_SIZE_DEFAULT)
+    parser.add_argument('--hash-prefix-index', dest='hash_prefix_index', action='store_true', help="Index first 8 bytes of hash value as integer instead of whole value. Makes hash index smaller for huge count of blocks. Existing hash table is converted on mount.")
+    parser.add_argument('--hash-meta', dest='hash_meta', action='store_true', help="Keep compression type, sizes and references count of hashes also in one merged table, so block read needs one lookup instead of three. Once enabled, it is used always.")
     parser.add_argument('--name', dest='name', metavar='DATABASE', default="dedupsqlfs", help="Specify the name for the database directory in which metadata and blocks data is stored. Defaults to dedupsqlfs")
     parser.add_argument('--temp', dest='temp', metavar='DIRECTORY', help="Specify the location for the files in which temporary data is stored. By default honour TMPDIR environment variable value.")
     parser.add_argument('-b', '--block-size', dest='block_size', metavar='BYTES', default=1024*64, type=int, help="Specify the maximum block size in bytes" + option_stored_in_db + ". Defaults to 64kB.")
@@ -131,7 +136,7 @@ def main(): # {{{1
     compression_methods_cmd = [constants.COMPRESSION_TYPE_NONE]
     for modname in constants.COMPRESSION_SUPPORTED:
         try:
-            module = __import__(modname)
+            module = __import__(constants.COMPRESSION_MODULES.get(modname, modname))
             if hasattr(module, 'compress') and hasattr(module, 'decompress'):
                 compression_methods.append(modname)
                 if modname not in constants.COMPRESSION_READONLY:
@@ -107,13 +107,23 @@ def main(): # {{{1
     generic.add_argument('--data', dest='data', metavar='DIRECTORY', default="~/data", help="Specify the base location for the files in which metadata and blocks data is stored. Defaults to ~/data")
     generic.add_argument('--data-in-memory', dest='data_in_memory', action='store_true', help="Enable FS only in memory storage for data (for tests).")
     generic.add_argument('--block-data-storage-on-fs', dest='block_data_storage_on_fs', action='store_true', help="Enable FS only storage for data (for tests).")
+    generic.add_argument('--block-fs-io-threads', dest='block_fs_io_threads', metavar='N', type=int, default=constants.BLOCK_FS_IO_THREADS_DEFAULT, help="Count of I/O threads to write, read and remove block files of FS storage. Default: %d." % constants.BLOCK_FS_IO_THREADS_DEFAULT)
     generic.add_argument('--data-clustered', dest='data_clustered', metavar='DIRECTORY', default=None, help="Specify the base location for the files in which blocks, hash, names data is stored for multiple nodes backups. Defaults to --data value, no clustering.")
     generic.add_argument('--block-partitions', dest='block_partitions', metavar='COUNT', default=1, type=int, help="Store block data across several (COUNT) tables to make them smaller. Default 1.")
+    generic.add_argument('--block-partition-path', dest='block_partition_path', metavar='N:DIRECTORY', action='append', help="Store block partition N file in other DIRECTORY, on other device for example. Can be used multiple times. Stored in filesystem options, stored directories are used always and can't be changed.")
+    generic.add_argument('--block-storage', dest='block_storage', metavar='TYPE', choices=constants.BLOCK_STORAGE_TYPES, default=None, help="Where block data is stored: 'sqlite' - rows of sqlite tables, 'packfile' - appended into segment files, indexed by sqlite table. Stored in filesystem options on creation, stored one is used always. Default for new filesystem: 'sqlite'.")
+    generic.add_argument('--packfile-segment-size', dest='packfile_segment_size', metavar='BYTES', default=constants.PACKFILE_SEGMENT_SIZE_DEFAULT, type=int, help="Size of packfile segment file, new one is started when it is full. Default: %d." % constants.PACKFILE_SEGMENT_SIZE_DEFAULT)
+    generic.add_argument('--hash-prefix-index', dest='hash_prefix_index', action='store_true', help="Index first 8 bytes of hash value as integer instead of whole value. Makes hash index smaller for huge count of blocks. Existing hash table is converted on mount.")
+    generic.add_argument('--hash-meta', dest='hash_meta', action='store_true', help="Keep compression type, sizes and references count of hashes also in one merged table, so block read needs one lookup instead of three. Once enabled, it is used always.")
+    generic.add_argument('--parallel-block-partitions', dest='parallel_block_partitions', action='store_true', help="Write every block partition by own thread and connection, so inserts and commits go in parallel. Makes sense with fast storage or partitions on different devices.")
     generic.add_argument('--name', dest='name', metavar='DATABASE', default="dedupsqlfs", help="Specify the name for the database directory in which metadata and blocks data is stored. Defaults to dedupsqlfs")
     generic.add_argument('--temp', dest='temp', metavar='DIRECTORY', help="Specify the location for the files in which temporary data is stored. By default honour TMPDIR environment variable value.")
     generic.add_argument('-b', '--block-size', dest='block_size', metavar='BYTES', default=1024*64, type=int, help="Specify the maximum block size in bytes" + option_stored_in_db + ". Defaults to 64kB.")
 
-    generic.add_argument('--journal-mode', dest='journal_mode', metavar='MODE (str)', choices=('wal','memory','off',), default='wal', help="Journal mode for files by engine sqlite. One of: wal, memory, off. Default - wal.")
+    generic.add_argument('--journal-mode', dest='journal_mode', metavar='MODE (str)', choices=('wal','truncate','delete','memory','off',), default='wal', help="Journal mode for files by engine sqlite. One of: wal, truncate, delete, memory, off. Default - wal.")
+    generic.add_argument('--sqlite-attach', dest='sqlite_attach', action='store_true', help="Attach sqlite files of tables to one connection, so every flush is one transaction across all of them. Atomic across files only with 'truncate' or 'delete' journal mode.")
+    generic.add_argument('--cache-size-per-table', dest='cache_size_per_table', metavar='BYTES', type=int, default=constants.SQLITE_CACHE_SIZE_DEFAULT, help="Page cache size of every sqlite table file. Block tables use it as is, hash index tables - twice more, metadata tables - half of it. Defaults to 64 MB.")
+    generic.add_argument('--sqlite-mmap-size', dest='sqlite_mmap_size', metavar='BYTES', type=int, default=constants.SQLITE_MMAP_SIZE_DEFAULT, help="Memory-mapped I/O size of sqlite block and hash index table files, reads go without copying into page cache. Set to 0 to disable. Defaults to 256 MB.")
     generic.add_argument('--auto-vacuum', dest='auto_vacuum', metavar='MODE (int)',type=int, choices=(0,1,2,),default=2, help="Auto vacuum mode for files (truncate if possible) by engine sqlite. One of: 0,1,2. Which is:0 - none,1 - full, 2 - incremental. Default: incremental - 2.")
     generic.add_argument('--mount-subvolume', dest='mounted_subvolume', metavar='NAME', default=None, help="Use subvolume NAME as root fs.")
 
@@ -174,6 +184,17 @@ def main(): # {{{1
                         default=1024*1024*1024,
                         help="Readed cache for blocks: potential size in BYTES. Set to -1 for infinite. Defaults to ~1024 MB.")
     grp_cache.add_argument('--flush-interval', dest='flush_interval', metavar="SECONDS", type=int, default=5, help="Call expired/flushed cache callector every Nth seconds on FUSE operations. Defaults to 5.")
+    grp_cache.add_argument('--checkpoint-interval', dest='checkpoint_interval', metavar="SECONDS", type=float, default=10, help="Check every Nth seconds if FS is idle and checkpoint sqlite WAL files in background. Only for 'wal' journal mode. Set to 0 to disable. Defaults to 10.")
+    grp_cache.add_argument('--checkpoint-idle', dest='checkpoint_idle', metavar="SECONDS", type=float, default=2, help="FS is idle if no changes were commited for N seconds. Defaults to 2.")
+    grp_cache.add_argument('--online-gc', dest='online_gc', action='store_true', help="Remove unused hashes and their data blocks while mounted, in idle time. Hashes are checked after references to them removed from block index.")
+    grp_cache.add_argument('--online-gc-interval', dest='online_gc_interval', metavar="SECONDS", type=float, default=10, help="Check every Nth seconds if FS is idle and collect unused hashes. Defaults to 10.")
+    grp_cache.add_argument('--online-gc-idle', dest='online_gc_idle', metavar="SECONDS", type=float, default=5, help="FS is idle for online garbage collector if no changes were commited for N seconds. Defaults to 5.")
+    grp_cache.add_argument('--online-gc-batch', dest='online_gc_batch', metavar="COUNT", type=int, default=1000, help="Count of hashes checked and removed at once by online garbage collector. Defaults to 1000.")
+    grp_cache.add_argument('--scrub-rate', dest='scrub_rate', metavar="BYTES", type=int, default=0, help="Verify stored blocks in background: read N bytes of stored data per second, decompress and check hash. Position is saved, next mount continues from there. Defaults to 0 - disabled.")
+    grp_cache.add_argument('--scrub-interval', dest='scrub_interval', metavar="SECONDS", type=float, default=1, help="Scrub next blocks every Nth seconds. Defaults to 1.")
+    grp_cache.add_argument('--vacuum-pages', dest='vacuum_pages', metavar="COUNT", type=int, default=1000, help="Remove up to N free pages of sqlite files at once in idle time. Only for 'incremental' auto vacuum mode. Set to 0 to disable. Defaults to 1000.")
+    grp_cache.add_argument('--vacuum-interval', dest='vacuum_interval', metavar="SECONDS", type=float, default=30, help="Check every Nth seconds if FS is idle and remove free pages of sqlite files. Defaults to 30.")
+    grp_cache.add_argument('--vacuum-idle', dest='vacuum_idle', metavar="SECONDS", type=float, default=10, help="FS is idle for incremental vacuum if no changes were commited for N seconds. Defaults to 10.")
 
 
     grp_compress = parser.add_argument_group('Compression')
@@ -195,7 +216,7 @@ def main(): # {{{1
                 lmod='__lzo'
             else:
                 lmod = modname
-            module = __import__(lmod)
+            module = __import__(constants.COMPRESSION_MODULES.get(modname, lmod))
 #            print(modname, dir(module))
             if hasattr(module, 'compress') and hasattr(module, 'decompress'):
                 compression_methods.append(modname)
@@ -228,6 +249,14 @@ def main(): # {{{1
 
     levels = (constants.COMPRESSION_LEVEL_DEFAULT, constants.COMPRESSION_LEVEL_FAST, constants.COMPRESSION_LEVEL_NORM, constants.COMPRESSION_LEVEL_BEST)
 
+    grp_compress.add_argument('--compression-frame-size', dest='compression_frame_size', metavar='BYTES', type=int, default=0,
+                        help="Compress blocks bigger than BYTES as independent sub-frames of BYTES size, in seekable format. Small random reads decompress only touched frames. Minimum %i. Defaults to 0 - disabled." % constants.COMPRESSION_FRAME_SIZE_MIN)
+
+    grp_compress.add_argument('--delta-compress', dest='delta_compression', action='store_true',
+                        help="Store new blocks similar to already stored ones as delta against them. Requires 'numpy' python module.")
+    grp_compress.add_argument('--delta-max-depth', dest='delta_max_depth', metavar='N', type=int, default=constants.COMPRESSION_DELTA_DEPTH_DEFAULT,
+                        help="Maximum length of delta blocks chain. Defaults to %i." % constants.COMPRESSION_DELTA_DEPTH_DEFAULT)
+
     grp_compress.add_argument('--compression-level', dest='compression_level', metavar="LEVEL", default=constants.COMPRESSION_LEVEL_DEFAULT,
                         help="Compression level ratio: one of %s; or INT. Defaults to %r. Not all methods support this option." % (
                             ', '.join('%r' % lvl for lvl in levels), constants.COMPRESSION_LEVEL_DEFAULT
@@ -255,6 +284,14 @@ def main(): # {{{1
 
     grp_compress.add_argument('--decompress-try-all', dest='decompress_try_all', action="store_true", help="Try to decompress blocks with every available method if stored one fails.")
 
+    msg = "R|Set compression policy for files which names match patterns. Saved in FS and used on next mounts."
+    msg += "\n- Syntax: <pattern>[,<pattern>...]:<method>[:<level>][,<method>[:<level>]...]"
+    msg += "\n- Example: '*.mp4,*.jpg:none' - store media files uncompressed, '*.log,*.txt:zstd:19' - strong compression for texts."
+    msg += "\n- Per inode policy from 'inode_option' table takes precedence."
+    msg += "\n- Use this option in command line for each policy."
+    grp_compress.add_argument('--compression-pattern', dest='compression_pattern', metavar='PATTERNS:POLICY', action="append",
+                        default=[], help=msg)
+
 
     grp_profile = parser.add_argument_group('Profiling')
     # Dynamically check for profiling support.
@@ -0,0 +1,13 @@
+# -*- coding: utf8 -*-
+"""
+Compression benchmark
+
+Drives real compression helpers through compression tool,
+same way as filesystem does, over different data corpora.
+Used to choose compression methods, levels and block size for mount.
+"""
+
+__author__ = 'sergey'
+
+from dedupsqlfs.benchmark.corpus import Corpus, make_corpus
+from dedupsqlfs.benchmark.runner import CompressionBenchmark
@@ -0,0 +1,201 @@
+# -*- coding: utf8 -*-
+"""
+Benchmark data corpora
+
+    text        - synthetic text: words, numbers, punctuation, lines
+    binary      - real executable and shared libraries of python, or synthetic records
+    random      - incompressible data
+    file:PATH   - any file content
+    samples:PATH - data blocks sampled from existing filesystem, see `do.dedupsqlfs --export-samples`
+
+Samples file format: sequence of records - block length (uint32) and block data.
+"""
+
+__author__ = 'sergey'
+
+import os
+import sys
+import random
+import struct
+
+CORPUS_TYPES = ('text', 'binary', 'random', 'file', 'samples',)
+
+SAMPLE_HEADER = struct.Struct("<I")
+
+_WORDS = (
+    "the", "of", "and", "to", "in", "is", "that", "for", "it", "as", "was", "with", "be", "by", "on",
+    "not", "he", "this", "are", "or", "his", "from", "at", "which", "but", "have", "an", "had", "they",
+    "you", "were", "their", "one", "all", "we", "can", "her", "has", "there", "been", "if", "more",
+    "when", "will", "would", "who", "so", "no", "data", "block", "file", "system", "table", "index",
+    "value", "error", "request", "server", "client", "config", "user", "time", "size", "process",
+)
+
+
+class Corpus(object):
+    """
+    Named data stream, split into blocks on demand
+    """
+
+    name = None
+    data = None
+
+    def __init__(self, name, data):
+        self.name = name
+        self.data = data
+        pass
+
+    def getSize(self):
+        return len(self.data)
+
+    def getBlocks(self, block_size):
+        """
+        @param block_size: block size in bytes
+        @type  block_size: int
+
+        @return: list of bytes, last block may be shorter
+        """
+        return [ self.data[start:start + block_size] for start in range(0, len(self.data), block_size) ]
+
+    pass
+
+
+def generate_text(size, seed=0):
+    """
+    Text like log files or documents - repeated words, numbers, short lines
+    """
+    rnd = random.Random(seed)
+    lines = []
+    length = 0
+    while length < size:
+        words = []
+        for n in range(rnd.randint(3, 16)):
+            r = rnd.random()
+            if r < 0.1:
+                words.append(str(rnd.randint(0, 100000)))
+            elif r < 0.15:
+                words.append(rnd.choice(_WORDS).capitalize() + rnd.choice((",", ".", ":", ";")))
+            else:
+                words.append(rnd.choice(_WORDS))
+        line = " ".join(words) + "\n"
+        lines.append(line)
+        length += len(line)
+    return "".join(lines).encode("utf8")[:size]
+
+
+def generate_binary(size, seed=0):
+    """
+    Executable code of python interpreter and its loaded libraries,
+    synthetic records if there is not enough
+    """
+    data = b''
+    paths = [ os.path.realpath(sys.executable) ]
+    for module in sys.modules.values():
+        path = getattr(module, "__file__", None)
+        if path and path.endswith(".so"):
+            paths.append(path)
+
+    for path in sorted(set(paths)):
+        if len(data) >= size:
+            break
+        try:
+            with open(path, "rb") as f:
+                data += f.read(size - len(data))
+        except OSError:
+            pass
+
+    if len(data) < size:
+        # Records of counters, timestamps, floats and short ids
+        rnd = random.Random(seed)
+        records = []
+        counter = rnd.randint(0, 1000)
+        stamp = 1500000000
+        length = len(data)
+        while length < size:
+            counter += rnd.randint(1, 3)
+            stamp += rnd.randint(0, 60)
+            record = struct.pack("<IQd8s", counter, stamp, rnd.random() * 100,
+                                 ("id%06d" % rnd.randint(0, 999999)).encode())
+            records.append(record)
+            length += len(record)
+        data += b"".join(records)
+
+    return data[:size]
+
+
+def generate_random(size):
+    return os.urandom(size)
+
+
+def read_file(path, size=None):
+    with open(path, "rb") as f:
+        if size:
+            return f.read(size)
+        return f.read()
+
+
+def read_samples(path, size=None):
+    """
+    @return: bytes - concatenated sample blocks
+    """
+    blocks = []
+    length = 0
+    with open(path, "rb") as f:
+        while not size or length < size:
+            header = f.read(SAMPLE_HEADER.size)
+            if len(header) < SAMPLE_HEADER.size:
+                break
+            block = f.read(SAMPLE_HEADER.unpack(header)[0])
+            blocks.append(block)
+            length += len(block)
+    data = b"".join(blocks)
+    if size:
+        return data[:size]
+    return data
+
+
+def write_samples(path, blocks):
+    """
+    @param blocks: iterable of bytes
+
+    @return: int - count of written blocks
+    """
+    count = 0
+    with open(path, "wb") as f:
+        for block in blocks:
+            f.write(SAMPLE_HEADER.pack(len(block)))
+            f.write(block)
+            count += 1
+    return count
+
+
+def make_corpus(spec, size, seed=0):
+    """
+    @param spec: corpus type, for files - type and path: "file:/path/to/file"
+    @type  spec: str
+
+    @param size: corpus size in bytes, for files - maximum size
+    @type  size: int
+
+    @rtype: L{Corpus}
+    """
+    path = None
+    name = spec
+    if spec.find(":") != -1:
+        name, path = spec.split(":", 1)
+
+    if name == "text":
+        data = generate_text(size, seed)
+    elif name == "binary":
+        data = generate_binary(size, seed)
+    elif name == "random":
+        data = generate_random(size)
+    elif name == "file":
+        data = read_file(path, size)
+        spec = "file:" + os.path.basename(path)
+    elif name == "samples":
+        data = read_samples(path, size)
+        spec = "samples:" + os.path.basename(path)
+    else:
+        raise ValueError("Unknown corpus type! %r" % name)
+
+    return Corpus(spec, data)
@@ -0,0 +1,189 @@
+# -*- coding: utf8 -*-
+"""
+Benchmark runner
+
+Every corpus is split into blocks of every block size,
+every block compressed one by one, like filesystem does on flush,
+by every method and level through compression tool.
+Compressed blocks are decompressed and checked back.
+"""
+
+__author__ = 'sergey'
+
+from time import perf_counter
+from dedupsqlfs.lib import constants
+from dedupsqlfs.fuse.compress.base import BaseCompressTool
+
+
+def percentile(values, p):
+    """
+    Nearest-rank percentile
+
+    @param values: sorted list of numbers
+    @param p: percent, 0..100
+
+    @return: number
+    """
+    if not values:
+        return 0
+    rank = int(round(p / 100.0 * len(values) + 0.5)) - 1
+    if rank < 0:
+        rank = 0
+    elif rank >= len(values):
+        rank = len(values) - 1
+    return values[rank]
+
+
+def latency_stats(timings):
+    """
+    @param timings: list of seconds
+
+    @return: dict of milliseconds
+    """
+    timings = sorted(timings)
+    return {
+        "p50": percentile(timings, 50) * 1000.0,
+        "p90": percentile(timings, 90) * 1000.0,
+        "p99": percentile(timings, 99) * 1000.0,
+        "max": (timings and timings[-1] or 0) * 1000.0,
+    }
+
+
+class CompressionBenchmark(object):
+
+    _tool = None
+    """
+    @ivar _tool: Compression tool
+    @type _tool: L{dedupsqlfs.fuse.compress.base.BaseCompressTool}
+    """
+
+    _methods = None
+    _levels = None
+    _block_sizes = None
+
+    rounds = 3
+
+    def __init__(self, methods, levels, block_sizes, logger, frame_size=0):
+        """
+        @param methods: compression methods
+        @type  methods: list
+
+        @param levels: compression levels - names (fast, default, normal, best) or numbers
+        @type  levels: list
+
+        @param block_sizes: block sizes in bytes
+        @type  block_sizes: list
+
+        @param frame_size: compress blocks by seekable sub-frames, 0 - disabled
+        @type  frame_size: int
+        """
+        self._methods = list(methods)
+        self._levels = list(levels)
+        self._block_sizes = list(block_sizes)
+
+        self._tool = BaseCompressTool()
+        for method in self._methods:
+            self._tool.appendCompression(method)
+
+        self._tool.setOption("compression", self._methods)
+        # Store compressed data always, even bad compressed
+        self._tool.setOption("compression_forced", True)
+        self._tool.setOption("compression_minimal_size", 0)
+        self._tool.setOption("compression_minimal_ratio", 0)
+        self._tool.setOption("compression_level", constants.COMPRESSION_LEVEL_DEFAULT)
+        self._tool.setOption("compression_frame_size", frame_size)
+        self._tool.init(logger)
+        pass
+
+    def getLevels(self, method):
+        """
+        Levels make sense for method
+        """
+        if not self._tool.getCompressor(method).hasCompressionLevelOptions():
+            return [ constants.COMPRESSION_LEVEL_DEFAULT ]
+        return self._levels
+
+    def _getPolicy(self, method, level):
+        if level in (constants.COMPRESSION_LEVEL_DEFAULT, constants.COMPRESSION_LEVEL_FAST,
+                     constants.COMPRESSION_LEVEL_NORM, constants.COMPRESSION_LEVEL_BEST,):
+            self._tool.setOption("compression_level", level)
+            return method
+        self._tool.setOption("compression_level", constants.COMPRESSION_LEVEL_DEFAULT)
+        return "%s:%s" % (method, level,)
+
+    def measure(self, blocks, method, level):
+        """
+        @param blocks: list of bytes
+
+        @return: dict
+        """
+        policy = self._getPolicy(method, level)
+        policies = { 0: policy }
+
+        ctimings = []
+        dtimings = []
+        compressed = []
+
+        for n in range(self.rounds):
+            for i, data in enumerate(blocks):
+                t = perf_counter()
+                for key, cItem in self._tool.compressData({ 0: data }, policies):
+                    pass
+                ctimings.append(perf_counter() - t)
+                if n == 0:
+                    compressed.append(cItem)
+
+        for n in range(self.rounds):
+            for i, cItem in enumerate(compressed):
+                cdata, cmethod = cItem
+                t = perf_counter()
+                data = self._tool.decompressData(cmethod, cdata)
+                dtimings.append(perf_counter() - t)
+                if n == 0 and data != blocks[i]:
+                    raise ValueError("Decompressed data differs from original! method=%r, level=%r, block=%d" % (
+                        method, level, i,))
+
+        size = sum(len(data) for data in blocks)
+        csize = sum(len(cItem[0]) for cItem in compressed)
+        ctime = sum(ctimings) / self.rounds
+        dtime = sum(dtimings) / self.rounds
+
+        return {
+            "method": method,
+            "level": level,
+            "blocks": len(blocks),
+            "compressed_blocks": len([ cItem for cItem in compressed if cItem[1] != constants.COMPRESSION_TYPE_NONE ]),
+            "bytes": size,
+            "compressed_bytes": csize,
+            "ratio": size and csize * 1.0 / size or 0,
+            "compress_mbps": ctime and size / ctime / 1024.0 / 1024.0 or 0,
+            "decompress_mbps": dtime and size / dtime / 1024.0 / 1024.0 or 0,
+            "compress_latency_ms": latency_stats(ctimings),
+            "decompress_latency_ms": latency_stats(dtimings),
+        }
+
+    def run(self, corpora, progress=None):
+        """
+        @param corpora: list of L{dedupsqlfs.benchmark.corpus.Corpus}
+        @param progress: function( message ) or None
+
+        @return: list of dict
+        """
+        results = []
+        for corpus in corpora:
+            for block_size in self._block_sizes:
+                blocks = corpus.getBlocks(block_size)
+                if not blocks:
+                    continue
+                for method in self._methods:
+                    for level in self.getLevels(method):
+                        if progress:
+                            progress("corpus=%s, block size=%d, method=%s, level=%s" % (
+                                corpus.name, block_size, method, level,))
+                        result = self.measure(blocks, method, level)
+                        result["corpus"] = corpus.name
+                        result["block_size"] = block_size
+                        results.append(result)
+        return results
+
+    pass
@@ -0,0 +1,151 @@
+# -*- coding: utf8 -*-
+
+__author__ = 'sergey'
+
+"""
+Class for Zstd compression helper with trained dictionaries
+
+Uses 'zstandard' module - bundled 'zstd' one has no dictionary support.
+Dictionary id is written into every compressed frame header,
+so decompression finds right dictionary by itself.
+Dictionary id 0 means - compressed without dictionary.
+"""
+
+from dedupsqlfs.compression import BaseCompression
+
+class ZstdDictCompression(BaseCompression):
+
+    _method_name = "zstandard"
+
+    _minimal_size = 18
+
+    _has_comp_level_options = True
+
+    _dict_id = 0
+    """
+    @ivar _dict_id: Dictionary id used for new compressed data
+    @type _dict_id: int
+    """
+
+    _dicts = None
+    """
+    @ivar _dicts: Loaded dictionaries cache: { dict_id: zstandard.ZstdCompressionDict }
+    @type _dicts: dict
+    """
+
+    _dict_loader = None
+    """
+    @ivar _dict_loader: Callable to load dictionary data by id
+    @type _dict_loader: callable
+    """
+
+    def __init__(self):
+        self._dicts = {}
+        super().__init__()
+        pass
+
+    def setDictionaryLoader(self, loader):
+        """
+        @param loader: function( dict_id ) -> bytes or None
+        """
+        self._dict_loader = loader
+        return self
+
+    def setCurrentDictionary(self, dict_id, data):
+        """
+        Select dictionary for new compressed data
+
+        @param dict_id: dictionary id
+        @type  dict_id: int
+
+        @param data: dictionary raw data
+        @type  data: bytes
+        """
+        self._dicts[ dict_id ] = self._module.ZstdCompressionDict(data)
+        self._dict_id = dict_id
+        return self
+
+    def getCurrentDictionaryId(self):
+        return self._dict_id
+
+    def getDictionary(self, dict_id):
+        """
+        @return: zstandard.ZstdCompressionDict
+        """
+        if dict_id not in self._dicts:
+            data = None
+            if self._dict_loader:
+                data = self._dict_loader(dict_id)
+            if not data:
+                raise ValueError("Compression dictionary %r not found!" % (dict_id,))
+            self._dicts[ dict_id ] = self._module.ZstdCompressionDict(data)
+        return self._dicts[ dict_id ]
+
+    def trainDictionary(self, samples, dict_size):
+        """
+        @param samples: list of bytes
+        @param dict_size: maximum dictionary size in bytes
+
+        @return: tuple (dict_id, dictionary data)
+        """
+        d = self._module.train_dictionary(dict_size, samples)
+        return d.dict_id(), d.as_bytes()
+
+    def getFastCompressionOptions(self):
+        return ( 1, )
+
+    def getNormCompressionOptions(self):
+        return ( 9, )
+
+    def getBestCompressionOptions(self):
+        return ( 18, )
+
+    def getDefaultCompressionOptions(self):
+        return ( 3, )
+
+    def getCustomCompressionOptions(self):
+        try:
+            level = int(self._custom_comp_level)
+            if level < -100:
+                level = -100
+            elif level > 20:
+                level = 20
+            opts = (level, )
+        except:
+            opts = False
+            pass
+        return opts
+
+    def compressData(self, data, comp_level=None):
+        """
+        @param  data: Data
+        @type   data: bytes
+
+        @param  comp_level: compression level - None (default), fast, normal, best
+        @type   comp_level: str
+
+        @return:    compressed data
+        @rtype:     bytes
+        """
+        opts = self.getCompressionLevelOptions(comp_level)
+        if not opts:
+            opts = self.getDefaultCompressionOptions()
+        level = opts[0]
+
+        if self._dict_id:
+            # Compressor objects are not thread-safe, dictionary is
+            d = self.getDictionary(self._dict_id)
+            cctx = self._module.ZstdCompressor(level=level, dict_data=d)
+        else:
+            cctx = self._module.ZstdCompressor(level=level)
+        return cctx.compress(data)
+
+    def decompressData(self, cdata):
+        dict_id = self._module.get_frame_parameters(cdata).dict_id
+        if dict_id:
+            dctx = self._module.ZstdDecompressor(dict_data=self.getDictionary(dict_id))
+        else:
+            dctx = self._module.ZstdDecompressor()
+        return dctx.decompress(cdata)
+
+    pass
@@ -0,0 +1,50 @@
+# -*- coding: utf8 -*-
+#
+# DB migration 001 by 2026-10-19
+#
+# Table `hash` : integer prefix of hash value indexed instead of whole value,
+# if enabled by --hash-prefix-index option
+#
+__author__ = 'sergey'
+
+__NUMBER__ = 20261019001
+
+def run(manager):
+    """
+    :param manager: Database manager
+    :type  manager: dedupsqlfs.db.sqlite.manager.DbManager|dedupsqlfs.db.mysql.manager.DbManager
+    :return: bool
+    """
+
+    try:
+        if manager.getAppOption("hash_prefix_index"):
+            table_h = manager.getTable("hash")
+            """
+            :type table_h: dedupsqlfs.db.sqlite.table.hash.TableHash |
+                            dedupsqlfs.db.mysql.table.hash.TableHash
+            """
+
+            manager.getLogger().info("Migration #%s" % (__NUMBER__,))
+
+            manager.getLogger().info("Add integer prefix index to `hash` table")
+            table_h.addPrefixIndex()
+
+    except Exception as e:
+        import traceback
+        manager.getLogger().error("Migration #%s error: %s" % (__NUMBER__, e,))
+        manager.getLogger().error("Migration #%s trace:\n%s" % (__NUMBER__, traceback.format_exc(),))
+        return False
+
+    table_opts = manager.getTable("option")
+
+    table_opts.getCursor()
+
+    mignumber = table_opts.get("migration")
+    if not mignumber:
+        table_opts.insert("migration", __NUMBER__)
+    else:
+        table_opts.update("migration", __NUMBER__)
+
+    table_opts.commit()
+
+    return True
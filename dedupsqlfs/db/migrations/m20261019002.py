@@ -0,0 +1,89 @@
+# -*- coding: utf8 -*-
+#
+# DB migration 002 by 2026-10-19
+#
+# Table `inode_hash_block` : sqlite WITHOUT ROWID layout,
+# rows are stored in primary key (inode_id, block_number) B-tree
+#
+__author__ = 'sergey'
+
+__NUMBER__ = 20261019002
+
+
+def __is_without_rowid(table):
+    cur = table.getCursor()
+    cur.execute("SELECT sql FROM %s WHERE type='table' AND name=?" % table._schema('sqlite_master'), (table.getName(),))
+    item = cur.fetchone()
+    if not item:
+        return True
+    return b"WITHOUT ROWID" in item["sql"].upper()
+
+
+def run(manager):
+    """
+    :param manager: Database manager
+    :type  manager: dedupsqlfs.db.sqlite.manager.DbManager|dedupsqlfs.db.mysql.manager.DbManager
+    :return: bool
+    """
+
+    try:
+        # InnoDB tables are clustered by primary key already
+        if manager.TYPE == "sqlite":
+
+            table_sv = manager.getTable("subvolume")
+            """
+            :type table_sv: dedupsqlfs.db.sqlite.table.TableSubvolume
+            """
+
+            manager.getLogger().info("Migration #%s" % (__NUMBER__,))
+
+            cur = table_sv.getCursor(True)
+
+            cur.execute("SELECT id FROM `%s`" % table_sv.getName())
+
+            for subvol in iter(cur.fetchone, None):
+
+                tname = "inode_hash_block_%d" % (subvol['id'],)
+                table_ihb = manager.getTable(tname, True)
+                """
+                :type table_ihb: dedupsqlfs.db.sqlite.table.TableInodeHashBlock
+                """
+
+                if __is_without_rowid(table_ihb):
+                    continue
+
+                manager.getLogger().info("Rebuild `%s` table without rowid" % tname)
+
+                name = table_ihb.getName()
+                cur_ihb = table_ihb.getCursor()
+                cur_ihb.execute("ALTER TABLE `%s` RENAME TO `%s_old`;" % (name, name,))
+                # Index keeps its name after rename, new table needs it
+                table_ihb.dropIndex("hash")
+
+                table_ihb.create()
+                cur_ihb.execute("INSERT INTO `%s` (inode_id, block_number, hash_id, real_size) " % name+
+                                "SELECT inode_id, block_number, hash_id, real_size FROM `%s_old`;" % name)
+                cur_ihb.execute("DROP TABLE `%s_old`;" % name)
+
+                table_ihb.commit()
+                table_ihb.close()
+
+    except Exception as e:
+        import traceback
+        manager.getLogger().error("Migration #%s error: %s" % (__NUMBER__, e,))
+        manager.getLogger().error("Migration #%s trace:\n%s" % (__NUMBER__, traceback.format_exc(),))
+        return False
+
+    table_opts = manager.getTable("option")
+
+    table_opts.getCursor()
+
+    mignumber = table_opts.get("migration")
+    if not mignumber:
+        table_opts.insert("migration", __NUMBER__)
+    else:
+        table_opts.update("migration", __NUMBER__)
+
+    table_opts.commit()
+
+    return True
@@ -64,15 +64,21 @@ class DbManager(object):
         "block",
         "xattr",
         "compression_type",
+        "compression_dict",
         "hash",
         "hash_compression_type",
         "hash_sizes",
+        "hash_delta",
+        "hash_sketch",
         "inode_hash_block",
         "subvolume",
     )
 
     _last_ping = 0
 
+    _commit_count = 0
+    _commit_files = 0
+
 
     def __init__( self, dbname = None, base_path=None, autocommit=None, synchronous=None ):
         if not (dbname is None):
@@ -232,6 +238,11 @@ class DbManager(object):
                 self._table[ name ] = TableCompressionType(self)
                 if cp != bp:
                     self._table[ name ].setClustered(True)
+            elif name == "compression_dict":
+                from dedupsqlfs.db.mysql.table.compression_dict import TableCompressionDict
+                self._table[ name ] = TableCompressionDict(self)
+                if cp != bp:
+                    self._table[ name ].setClustered(True)
             elif name == "hash_compression_type":
                 from dedupsqlfs.db.mysql.table.hash_compression_type import TableHashCompressionType
                 self._table[ name ] = TableHashCompressionType(self)
@@ -242,6 +253,21 @@ class DbManager(object):
                 self._table[ name ] = TableHashSizes(self)
                 if cp != bp:
                     self._table[ name ].setClustered(True)
+            elif name == "hash_meta":
+                from dedupsqlfs.db.mysql.table.hash_meta import TableHashMeta
+                self._table[ name ] = TableHashMeta(self)
+                if cp != bp:
+                    self._table[ name ].setClustered(True)
+            elif name == "hash_gc":
+                from dedupsqlfs.db.mysql.table.hash_gc import TableHashGc
+                self._table[ name ] = TableHashGc(self)
+                if cp != bp:
+                    self._table[ name ].setClustered(True)
+            elif name == "scrub_range":
+                from dedupsqlfs.db.mysql.table.scrub_range import TableScrubRange
+                self._table[ name ] = TableScrubRange(self)
+                if cp != bp:
+                    self._table[ name ].setClustered(True)
             elif name == "name_pattern_option":
                 from dedupsqlfs.db.mysql.table.name_pattern_option import TableNamePatternOption
                 self._table[ name ] = TableNamePatternOption(self)
@@ -257,6 +283,16 @@ class DbManager(object):
                 self._table[ name ] = TableHash(self)
                 if cp != bp:
                     self._table[ name ].setClustered(True)
+            elif name == "hash_delta":
+                from dedupsqlfs.db.mysql.table.hash_delta import TableHashDelta
+                self._table[ name ] = TableHashDelta(self)
+                if cp != bp:
+                    self._table[ name ].setClustered(True)
+            elif name == "hash_sketch":
+                from dedupsqlfs.db.mysql.table.hash_sketch import TableHashSketch
+                self._table[ name ] = TableHashSketch(self)
+                if cp != bp:
+                    self._table[ name ].setClustered(True)
             elif name == "hash_count":
                 from dedupsqlfs.db.mysql.table.hash_count import TableHashCount
                 self._table[ name ] = TableHashCount(self)
@@ -272,6 +308,9 @@ class DbManager(object):
             elif name == "subvolume":
                 from dedupsqlfs.db.mysql.table.subvolume import TableSubvolume
                 self._table[ name ] = TableSubvolume(self)
+            elif name == "subvolume_usage":
+                from dedupsqlfs.db.mysql.table.subvolume_usage import TableSubvolumeUsage
+                self._table[ name ] = TableSubvolumeUsage(self)
             elif name == "tmp_ids":
                 from dedupsqlfs.db.mysql.table.tmp_ids import TableTmpIds
                 self._table[ name ] = TableTmpIds(self)
@@ -759,10 +798,36 @@ class DbManager(object):
         return self
 
     def commit(self):
+        self._commit_count += 1
         for name, t in self._table.items():
             t.commit()
+            self._commit_files += 1
         return self
 
+    def setAttach(self, flag=True, first=None):
+        return self
+
+    def getAttach(self):
+        return False
+
+    def checkpoint(self, mode="PASSIVE"):
+        """
+        No WAL files here - server does checkpoints itself
+        """
+        return 0
+
+    def incrementalVacuum(self, pages):
+        """
+        No free pages lists here - server reuses them itself
+        """
+        return 0
+
+    def getCommitStats(self):
+        """
+        @return: tuple (manager commits, committed tables, skipped clean tables)
+        """
+        return self._commit_count, self._commit_files, 0
+
     def rollback(self):
         for name, t in self._table.items():
             t.rollback()
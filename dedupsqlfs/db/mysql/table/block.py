@@ -25,9 +25,10 @@ class TableBlock( Table ):
         )
         return
 
-    def insert( self, hash_id, data):
+    def insert( self, hash_id, data, digest=None):
         """
         :param data: bytes
+        :param digest: bytes - hash value, not used here
         :return: int
         """
         self.startTimer()
@@ -45,9 +46,10 @@ class TableBlock( Table ):
         self.stopTimer('insert')
         return item
 
-    def update( self, hash_id, data):
+    def update( self, hash_id, data, digest=None):
         """
         :param data: bytes
+        :param digest: bytes - hash value, not used here
         :return: int
         """
         self.startTimer()
@@ -83,6 +85,40 @@ class TableBlock( Table ):
         self.stopTimer('get')
         return item
 
+    def get_many( self, hash_ids):
+        """
+        :param hash_ids: list of int
+        :return: dict { hash_id: Row }
+        """
+        self.startTimer()
+        items = {}
+        id_str = ",".join(str(hash_id) for hash_id in hash_ids)
+        if id_str:
+            cur = self.getCursor()
+            cur.execute("SELECT * FROM `%s` " % self.getName()+
+                        " WHERE `hash_id` IN (%s)" % (id_str,))
+            for item in cur:
+                items[ item["hash_id"] ] = item
+        self.stopTimer('get_many')
+        return items
+
+    def open_blob( self, hash_id):
+        """
+        No incremental BLOB I/O here, data is read whole
+
+        :param hash_id: int
+        :return: None
+        """
+        return None
+
+    def compact( self ):
+        """
+        No packfile segments here
+
+        :return: int
+        """
+        return 0
+
     def remove_by_ids(self, id_str):
         self.startTimer()
         count = 0
@@ -8,8 +8,29 @@ class TableHash( Table ):
 
     _table_name = "hash"
 
+    _prefixed = None
+    """
+    @ivar _prefixed: Table has integer prefix column, indexed instead of value
+    @type _prefixed: bool|None
+    """
+
     def create( self ):
         cur = self.getCursor()
+
+        if self.getManager().getAppOption("hash_prefix_index"):
+            # Create table
+            cur.execute(
+                "CREATE TABLE IF NOT EXISTS `%s` (" % self.getName()+
+                    "`id` BIGINT UNSIGNED PRIMARY KEY AUTO_INCREMENT, "+
+                    "`prefix` BIGINT NOT NULL DEFAULT 0, "+
+                    "`value` VARBINARY(64) NOT NULL "+
+                ")"+
+                self._getCreationAppendString()
+            )
+            self.createIndexIfNotExists("prefix", ("prefix",))
+            self._prefixed = True
+            return
+
         # Create table
         cur.execute(
             "CREATE TABLE IF NOT EXISTS `%s` (" % self.getName()+
@@ -19,18 +40,64 @@ class TableHash( Table ):
             self._getCreationAppendString()
         )
         self.createIndexIfNotExists("value", ("value",), unique=True)
+        self._prefixed = False
         return
 
+    def getPrefix( self, value ):
+        """
+        First 8 bytes of hash value as signed 64-bit integer
+
+        @rtype: int
+        """
+        return int.from_bytes(value[:8], "big", signed=True)
+
+    def isPrefixed( self ):
+        if self._prefixed is None:
+            self._prefixed = self.hasField("prefix")
+        return self._prefixed
+
+    def addPrefixIndex( self ):
+        """
+        Convert table: add prefix column, index it instead of whole value
+
+        @return: bool - table converted
+        """
+        if self.isPrefixed():
+            return False
+
+        self.startTimer()
+        cur = self.getCursor()
+        cur.execute("ALTER TABLE `%s` ADD COLUMN `prefix` BIGINT NOT NULL DEFAULT 0 AFTER `id`" % self.getName())
+        # Unsigned value of first 8 bytes wraps to signed one
+        cur.execute("UPDATE `%s` SET `prefix`=CAST(CONV(HEX(LEFT(`value`, 8)), 16, 10) AS SIGNED)" % self.getName())
+        self.createIndexIfNotExists("prefix", ("prefix",))
+        self.dropIndex("value")
+        self.commit()
+
+        self._prefixed = True
+        self.stopTimer('addPrefixIndex')
+        return True
+
     def insert( self, value):
         self.startTimer()
         cur = self.getCursor()
-        cur.execute(
-            "INSERT INTO `%s` " %self.getName()+
-            " (`value`) VALUES (X%(value)s)",
-            {
-                'value': value.hex()
-            }
-        )
+        if self.isPrefixed():
+            cur.execute(
+                "INSERT INTO `%s` " %self.getName()+
+                " (`prefix`,`value`) VALUES (%(prefix)s, X%(value)s)",
+                {
+                    'prefix': self.getPrefix(value),
+                    'value': value.hex()
+                }
+            )
+        else:
+            cur.execute(
+                "INSERT INTO `%s` " %self.getName()+
+                " (`value`) VALUES (X%(value)s)",
+                {
+                    'value': value.hex()
+                }
+            )
         item = cur.lastrowid
         self.stopTimer('insert')
         return item
@@ -38,14 +105,25 @@ class TableHash( Table ):
     def insertRaw( self, rowId, value):
         self.startTimer()
         cur = self.getCursor()
-        cur.execute(
-            "INSERT INTO `%s` " %self.getName()+
-            " (`id`,`value`) VALUES (%(id)s, X%(value)s)",
-            {
-                'id': rowId,
-                'value': value.hex()
-            }
-        )
+        if self.isPrefixed():
+            cur.execute(
+                "INSERT INTO `%s` " %self.getName()+
+                " (`id`,`prefix`,`value`) VALUES (%(id)s, %(prefix)s, X%(value)s)",
+                {
+                    'id': rowId,
+                    'prefix': self.getPrefix(value),
+                    'value': value.hex()
+                }
+            )
+        else:
+            cur.execute(
+                "INSERT INTO `%s` " %self.getName()+
+                " (`id`,`value`) VALUES (%(id)s, X%(value)s)",
+                {
+                    'id': rowId,
+                    'value': value.hex()
+                }
+            )
         item = cur.lastrowid
         self.stopTimer('insertRaw')
         return item
@@ -57,18 +135,55 @@ class TableHash( Table ):
         """
         self.startTimer()
         cur = self.getCursor()
-        cur.execute(
-            "UPDATE `%s` " %self.getName()+
-            " SET `value`=X%(value)s WHERE `id`=%(id)s",
-            {
-                'value': value.hex(),
-                'id': item_id
-            }
-        )
+        if self.isPrefixed():
+            cur.execute(
+                "UPDATE `%s` " %self.getName()+
+                " SET `prefix`=%(prefix)s, `value`=X%(value)s WHERE `id`=%(id)s",
+                {
+                    'prefix': self.getPrefix(value),
+                    'value': value.hex(),
+                    'id': item_id
+                }
+            )
+        else:
+            cur.execute(
+                "UPDATE `%s` " %self.getName()+
+                " SET `value`=X%(value)s WHERE `id`=%(id)s",
+                {
+                    'value': value.hex(),
+                    'id': item_id
+                }
+            )
         count = cur.rowcount
         self.stopTimer('update')
         return count
 
+    def update_many( self, items ):
+        """
+        @param items: list of tuples (id, value)
+        @return: count updated rows
+        @rtype: int
+        """
+        self.startTimer()
+        count = 0
+        if items:
+            cur = self.getCursor()
+            if self.isPrefixed():
+                cur.executemany(
+                    "UPDATE `%s` " %self.getName()+
+                    " SET `prefix`=%s, `value`=X%s WHERE `id`=%s",
+                    [ (self.getPrefix(value), value.hex(), item_id,) for item_id, value in items ]
+                )
+            else:
+                cur.executemany(
+                    "UPDATE `%s` " %self.getName()+
+                    " SET `value`=X%s WHERE `id`=%s",
+                    [ (value.hex(), item_id,) for item_id, value in items ]
+                )
+            count = len(items)
+        self.stopTimer('update_many')
+        return count
+
     def get( self, item_id ):
         self.startTimer()
         cur = self.getCursor()
@@ -88,19 +203,57 @@ class TableHash( Table ):
     def find( self, value ):
         self.startTimer()
         cur = self.getCursor()
-        cur.execute(
-            "SELECT `id` FROM `%s` " % self.getName()+
-            " WHERE `value`=X%(value)s",
-            {
-                'value': value.hex()
-            }
-        )
+        if self.isPrefixed():
+            # Whole value compared only for rows with same prefix
+            cur.execute(
+                "SELECT `id` FROM `%s` " % self.getName()+
+                " WHERE `prefix`=%(prefix)s AND `value`=X%(value)s",
+                {
+                    'prefix': self.getPrefix(value),
+                    'value': value.hex()
+                }
+            )
+        else:
+            cur.execute(
+                "SELECT `id` FROM `%s` " % self.getName()+
+                " WHERE `value`=X%(value)s",
+                {
+                    'value': value.hex()
+                }
+            )
         item = cur.fetchone()
         if item:
             item = item["id"]
         self.stopTimer('find')
         return item
 
+    def find_many( self, values ):
+        """
+        @param values: list of bytes
+        @return: dict { value: id }
+        """
+        self.startTimer()
+        items = {}
+        values = set(values)
+        if values:
+            cur = self.getCursor()
+            if self.isPrefixed():
+                # Whole value compared only for rows with same prefix
+                cur.execute(
+                    "SELECT `id`, `value` FROM `%s` " % self.getName()+
+                    " WHERE `prefix` IN (%s)" % ",".join(str(self.getPrefix(value)) for value in values)
+                )
+            else:
+                cur.execute(
+                    "SELECT `id`, `value` FROM `%s` " % self.getName()+
+                    " WHERE `value` IN (%s)" % ",".join("X'%s'" % value.hex() for value in values)
+                )
+            for item in cur:
+                if bytes(item["value"]) in values:
+                    items[ bytes(item["value"]) ] = item["id"]
+        self.stopTimer('find_many')
+        return items
+
     def get_count(self):
         self.startTimer()
         cur = self.getCursor()
@@ -113,6 +266,21 @@ class TableHash( Table ):
         self.stopTimer('get_count')
         return item
 
+    def get_max_id(self):
+        """
+        :return: int - 0 if no hashes
+        """
+        self.startTimer()
+        cur = self.getCursor()
+        cur.execute("SELECT MAX(`id`) as `max_id` FROM `%s`" % self.getName())
+        item = cur.fetchone()
+        if item and item["max_id"]:
+            item = item["max_id"]
+        else:
+            item = 0
+        self.stopTimer('get_max_id')
+        return item
+
     def get_hash_ids(self, start_id, end_id):
         self.startTimer()
         cur = self.getCursor()
@@ -122,6 +290,22 @@ class TableHash( Table ):
         self.stopTimer('get_hash_ids')
         return nameIds
 
+    def get_batch(self, start_id, limit):
+        """
+        Keyset pagination by id
+
+        :param start_id: int - last id of previous batch, 0 - from start
+        :param limit: int
+        :return: list of Row
+        """
+        self.startTimer()
+        cur = self.getCursor()
+        cur.execute("SELECT `id`, `value` FROM `%s` " % self.getName()+
+                    " WHERE `id`>%s ORDER BY `id` LIMIT %s", (start_id, limit,))
+        items = list(cur)
+        self.stopTimer('get_batch')
+        return items
+
     def remove_by_ids(self, id_str):
         self.startTimer()
         count = 0
@@ -60,6 +60,24 @@ class TableHashCompressionType( Table ):
         self.stopTimer('update')
         return count
 
+    def update_many( self, items):
+        """
+        :param items: list of tuples (hash_id, type_id)
+        :return: int
+        """
+        self.startTimer()
+        count = 0
+        if items:
+            cur = self.getCursor()
+            cur.executemany(
+                "UPDATE `%s` " % self.getName() +
+                " SET `type_id`=%s WHERE `hash_id`=%s",
+                [ (type_id, hash_id,) for hash_id, type_id in items ]
+            )
+            count = len(items)
+        self.stopTimer('update_many')
+        return count
+
     def get( self, hash_id):
         """
         :param hash_id: int
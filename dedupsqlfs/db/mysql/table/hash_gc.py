@@ -0,0 +1,76 @@
+# -*- coding: utf8 -*-
+"""
+Queue of hashes which may be unused now:
+references to them removed from block index.
+Online garbage collector checks them and removes unused ones.
+"""
+
+__author__ = 'sergey'
+
+from dedupsqlfs.db.mysql.table import Table
+
+class TableHashGc( Table ):
+
+    _table_name = "hash_gc"
+
+    def create( self ):
+        cur = self.getCursor()
+
+        # Create table
+        cur.execute(
+            "CREATE TABLE IF NOT EXISTS `%s` (" % self.getName()+
+                "`hash_id` BIGINT UNSIGNED PRIMARY KEY "+
+            ")"+
+            self._getCreationAppendString()
+        )
+        return
+
+    def add_many( self, hash_ids):
+        """
+        :param hash_ids: iterable of int
+        :return: int
+        """
+        self.startTimer()
+        cur = self.getCursor()
+        cur.executemany("INSERT IGNORE INTO `%s` (`hash_id`) VALUES (%%s)" % self.getName(),
+                        [ (hash_id,) for hash_id in hash_ids ])
+        count = cur.rowcount
+        self.stopTimer('add_many')
+        return count
+
+    def get_batch( self, limit):
+        """
+        :param limit: int
+        :return: list of int
+        """
+        self.startTimer()
+        cur = self.getCursor()
+        cur.execute("SELECT `hash_id` FROM `%s` ORDER BY `hash_id` LIMIT %%s" % self.getName(), (limit,))
+        items = [ item["hash_id"] for item in cur ]
+        self.stopTimer('get_batch')
+        return items
+
+    def get_count(self):
+        self.startTimer()
+        cur = self.getCursor()
+        cur.execute("SELECT COUNT(1) as `cnt` FROM `%s`" % self.getName())
+        item = cur.fetchone()
+        if item:
+            item = item["cnt"]
+        else:
+            item = 0
+        self.stopTimer('get_count')
+        return item
+
+    def remove_by_ids(self, id_str):
+        self.startTimer()
+        count = 0
+        if id_str:
+            cur = self.getCursor()
+            cur.execute("DELETE FROM `%s` " % self.getName()+
+                        " WHERE `hash_id` IN (%s)" % (id_str,))
+            count = cur.rowcount
+        self.stopTimer('remove_by_ids')
+        return count
+
+    pass
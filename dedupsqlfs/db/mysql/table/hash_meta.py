@@ -0,0 +1,165 @@
+# -*- coding: utf8 -*-
+"""
+Merged metadata of hash: compression type, sizes, references count.
+Same data as in hash_compression_type, hash_sizes and hash_count tables,
+so block read needs only one lookup here.
+"""
+
+__author__ = 'sergey'
+
+from dedupsqlfs.db.mysql.table import Table
+
+class TableHashMeta( Table ):
+
+    _table_name = "hash_meta"
+
+    def create( self ):
+        cur = self.getCursor()
+
+        # Create table
+        cur.execute(
+            "CREATE TABLE IF NOT EXISTS `%s` (" % self.getName()+
+                "`hash_id` BIGINT UNSIGNED PRIMARY KEY, "+
+                "`type_id` INT UNSIGNED NOT NULL DEFAULT 0, "+
+                "`writed_size` INT UNSIGNED NOT NULL DEFAULT 0, "+
+                "`compressed_size` INT UNSIGNED NOT NULL DEFAULT 0, "+
+                "`refcount` BIGINT NOT NULL DEFAULT 0 "+
+            ")"+
+            self._getCreationAppendString()
+        )
+        return
+
+    def set_type( self, hash_id, type_id):
+        """
+        :return: int
+        """
+        self.startTimer()
+        cur = self.getCursor()
+        cur.execute(
+            "INSERT INTO `%s` " % self.getName()+
+            " (`hash_id`, `type_id`) VALUES (%(id)s, %(type)s) "+
+            " ON DUPLICATE KEY UPDATE `type_id`=VALUES(`type_id`)",
+            {
+                "id": hash_id,
+                "type": type_id
+            }
+        )
+        self.stopTimer('set_type')
+        return 1
+
+    def set_sizes( self, hash_id, writed_size, compressed_size):
+        """
+        :return: int
+        """
+        self.startTimer()
+        cur = self.getCursor()
+        cur.execute(
+            "INSERT INTO `%s` " % self.getName()+
+            " (`hash_id`, `writed_size`, `compressed_size`) VALUES (%(id)s, %(ws)s, %(cs)s) "+
+            " ON DUPLICATE KEY UPDATE `writed_size`=VALUES(`writed_size`), `compressed_size`=VALUES(`compressed_size`)",
+            {
+                "id": hash_id,
+                "ws": writed_size,
+                "cs": compressed_size
+            }
+        )
+        self.stopTimer('set_sizes')
+        return 1
+
+    def inc( self, hash_id):
+        """
+        Increase references counter
+
+        :param hash_id: int
+        :return: int
+        """
+        self.startTimer()
+        cur = self.getCursor()
+        cur.execute(
+            "INSERT INTO `%s` " % self.getName()+
+            " (`hash_id`, `refcount`) VALUES (%(id)s, 1) "+
+            " ON DUPLICATE KEY UPDATE `refcount`=`refcount`+1",
+            {
+                "id": hash_id
+            }
+        )
+        self.stopTimer('inc')
+        return 1
+
+    def dec( self, hash_id):
+        """
+        Decrease references counter
+
+        :param hash_id: int
+        :return: int
+        """
+        self.startTimer()
+        cur = self.getCursor()
+        cur.execute(
+            "UPDATE `%s` " % self.getName()+
+            " SET `refcount`=`refcount`-1 WHERE `hash_id`=%(id)s",
+            {
+                "id": hash_id
+            }
+        )
+        count = cur.rowcount
+        self.stopTimer('dec')
+        return count
+
+    def get( self, hash_id):
+        """
+        :param hash_id: int
+        :return: Row
+        """
+        self.startTimer()
+        cur = self.getCursor()
+        cur.execute(
+            "SELECT * FROM `%s` " % self.getName()+
+            " WHERE `hash_id`=%(id)s",
+            {
+                "id": hash_id
+            }
+        )
+        item = cur.fetchone()
+        self.stopTimer('get')
+        return item
+
+    def remove_by_ids(self, id_str):
+        self.startTimer()
+        count = 0
+        if id_str:
+            cur = self.getCursor()
+            cur.execute("DELETE FROM `%s` " % self.getName()+
+                        " WHERE `hash_id` IN (%s)" % (id_str,))
+            count = cur.rowcount
+        self.stopTimer('remove_by_ids')
+        return count
+
+    def fill( self ):
+        """
+        Copy data of hash_compression_type, hash_sizes and hash_count tables
+
+        :return: int - count of hashes
+        """
+        self.startTimer()
+        self.clean()
+
+        manager = self.getManager()
+        tHCT = manager.getTable("hash_compression_type").getName()
+        tHSZ = manager.getTable("hash_sizes").getName()
+        tHCnt = manager.getTable("hash_count").getName()
+
+        cur = self.getCursor()
+        cur.execute(
+            "INSERT INTO `%s` (`hash_id`, `type_id`, `writed_size`, `compressed_size`, `refcount`) " % self.getName()+
+            " SELECT t.`hash_id`, t.`type_id`, COALESCE(s.`writed_size`, 0), COALESCE(s.`compressed_size`, 0), COALESCE(c.`cnt`, 0) "+
+            " FROM `%s` t " % tHCT+
+            " LEFT JOIN `%s` s ON s.`hash_id`=t.`hash_id` " % tHSZ+
+            " LEFT JOIN `%s` c ON c.`hash_id`=t.`hash_id`" % tHCnt
+        )
+        count = cur.rowcount
+        self.commit()
+        self.stopTimer('fill')
+        return count
+
+    pass
@@ -63,6 +63,24 @@ class TableHashSizes( Table ):
         self.stopTimer('update')
         return count
 
+    def update_many( self, items):
+        """
+        :param items: list of tuples (hash_id, writed_size, compressed_size)
+        :return: int
+        """
+        self.startTimer()
+        count = 0
+        if items:
+            cur = self.getCursor()
+            cur.executemany(
+                "UPDATE `%s` " % self.getName() +
+                " SET `compressed_size`=%s, `writed_size`=%s WHERE `hash_id`=%s",
+                [ (compressed_size, writed_size, hash_id,) for hash_id, writed_size, compressed_size in items ]
+            )
+            count = len(items)
+        self.stopTimer('update_many')
+        return count
+
     def get( self, hash_id):
         """
         :param hash_id: int
@@ -105,6 +123,37 @@ class TableHashSizes( Table ):
         self.stopTimer('get_sizes_by_hash_ids')
         return items
 
+    def get_sample_hash_ids(self, limit, max_size=None):
+        """
+        Random sample of hash ids, for compression dictionary training
+
+        :param limit: int - how many ids to select
+        :param max_size: int - select only blocks with written size not bigger
+        :return: list
+        """
+        self.startTimer()
+        cur = self.getCursor()
+        if max_size:
+            cur.execute(
+                "SELECT `hash_id` FROM `%s` " % self.getName()+
+                " WHERE `writed_size`<=%(size)s ORDER BY RAND() LIMIT %(limit)s",
+                {
+                    "size": max_size,
+                    "limit": limit,
+                }
+            )
+        else:
+            cur.execute(
+                "SELECT `hash_id` FROM `%s` " % self.getName()+
+                " ORDER BY RAND() LIMIT %(limit)s",
+                {
+                    "limit": limit,
+                }
+            )
+        items = [ item["hash_id"] for item in cur ]
+        self.stopTimer('get_sample_hash_ids')
+        return items
+
     def get_median_compressed_size(self):
         self.startTimer()
         self.stopTimer('get_median_compressed_size')
@@ -0,0 +1,77 @@
+# -*- coding: utf8 -*-
+
+__author__ = 'sergey'
+
+from dedupsqlfs.db.mysql.table import Table
+
+class TableHashSketch( Table ):
+    """
+    Resemblance sketch index: block super-features
+    """
+
+    _table_name = "hash_sketch"
+
+    def create( self ):
+        cur = self.getCursor()
+
+        # Create table
+        cur.execute(
+            "CREATE TABLE IF NOT EXISTS `%s` (" % self.getName()+
+                "`feature` BIGINT UNSIGNED NOT NULL, "+
+                "`hash_id` BIGINT UNSIGNED NOT NULL "+
+            ")"+
+            self._getCreationAppendString()
+        )
+        self.createIndexIfNotExists("feature", ("feature",))
+        self.createIndexIfNotExists("hash", ("hash_id",))
+        return
+
+    def insert( self, hash_id, features):
+        """
+        :param features: list of int
+        :return: int
+        """
+        self.startTimer()
+        cur = self.getCursor()
+
+        cur.executemany(
+            "INSERT INTO `%s` " % self.getName()+
+            " (`feature`, `hash_id`) VALUES (%(feature)s, %(id)s)",
+            [ {"feature": f, "id": hash_id} for f in features ]
+        )
+        count = cur.rowcount
+        self.stopTimer('insert')
+        return count
+
+    def find( self, features):
+        """
+        Find block with most of equal super-features
+
+        :param features: list of int
+        :return: int|None - hash id
+        """
+        self.startTimer()
+        item = None
+        if features:
+            cur = self.getCursor()
+            cur.execute("SELECT `hash_id`, COUNT(1) AS `cnt` FROM `%s` " % self.getName()+
+                        " WHERE `feature` IN (%s) " % ",".join(str(int(f)) for f in features)+
+                        " GROUP BY `hash_id` ORDER BY `cnt` DESC, `hash_id` DESC LIMIT 1")
+            item = cur.fetchone()
+            if item:
+                item = item["hash_id"]
+        self.stopTimer('find')
+        return item
+
+    def remove_by_ids(self, id_str):
+        self.startTimer()
+        count = 0
+        if id_str:
+            cur = self.getCursor()
+            cur.execute("DELETE FROM `%s` " % self.getName()+
+                        " WHERE `hash_id` IN (%s)" % (id_str,))
+            count = cur.rowcount
+        self.stopTimer('remove_by_ids')
+        return count
+
+    pass
@@ -207,6 +207,23 @@ class TableInode( Table ):
         self.stopTimer('get_sizes_by_id')
         return items
 
+    def get_sizes_nlinks_by_ids(self, inode_ids):
+        """
+        :param inode_ids: iterable of int
+        :return: dict { inode_id: (size, nlinks) }
+        """
+        self.startTimer()
+        items = {}
+        id_str = ",".join(str(i) for i in inode_ids)
+        if id_str:
+            cur = self.getCursor()
+            cur.execute("SELECT `id`,`size`,`nlinks` FROM `%s` " % self.getName()+
+                        " WHERE `id` IN (%s)" % id_str)
+            for item in cur:
+                items[ item["id"] ] = (item["size"], item["nlinks"],)
+        self.stopTimer('get_sizes_nlinks_by_ids')
+        return items
+
     def get_sizes_by_inodes(self, inodes):
         self.startTimer()
 
@@ -164,7 +164,7 @@ class TableInodeHashBlock(Table):
         self.startTimer()
         cur = self.getCursor()
         cur.execute(
-            "SELECT block_number FROM `%s` " % self.getName() +
+            "SELECT block_number, hash_id FROM `%s` " % self.getName() +
             " WHERE `inode_id`=%(inode)s AND `block_number`>%(block)s",
             {
                 "inode": inode,
@@ -197,6 +197,24 @@ class TableInodeHashBlock(Table):
         return item
 
 
+    def get_batch_ordered(self, start_inode, start_block, limit):
+        """
+        Keyset pagination in order of file blocks
+
+        :param start_inode: int - inode_id of last row of previous batch, 0 - from start
+        :param start_block: int - block_number of last row of previous batch, -1 - from start
+        :return: list of Row
+        """
+        self.startTimer()
+        cur = self.getCursor()
+        cur.execute("SELECT `inode_id`, `block_number`, `hash_id` FROM `%s` " % self.getName()+
+                    " WHERE `inode_id`>%s OR (`inode_id`=%s AND `block_number`>%s) "+
+                    " ORDER BY `inode_id`, `block_number` LIMIT %s",
+                    (start_inode, start_inode, start_block, limit,))
+        items = list(cur)
+        self.stopTimer('get_batch_ordered')
+        return items
+
     def get_uniq_hashes(self):
         self.startTimer()
         cur = self.getCursor()
@@ -219,6 +237,42 @@ class TableInodeHashBlock(Table):
         self.stopTimer('count_hashes_by_hashes')
         return count
 
+    def count_by_hashes(self, hash_ids):
+        """
+        Count of references to every hash
+
+        :param hash_ids: iterable of int
+        :return: dict { hash_id: count }, no key - not used
+        """
+        self.startTimer()
+        items = {}
+        id_str = ",".join(str(hid) for hid in hash_ids)
+        if id_str:
+            cur = self.getCursor()
+            cur.execute("SELECT `hash_id`, COUNT(1) as `cnt` FROM `%s` " % self.getName()+
+                        " WHERE `hash_id` IN (%s) GROUP BY `hash_id`" % (id_str,))
+            for item in cur:
+                items[ item["hash_id"] ] = item["cnt"]
+        self.stopTimer('count_by_hashes')
+        return items
+
+    def get_used_hashes(self, id_str):
+        """
+        Which of hash ids are referenced by blocks
+
+        :param id_str: str - comma separated hash ids
+        :return: set
+        """
+        self.startTimer()
+        hashes = set()
+        if id_str:
+            cur = self.getCursor()
+            cur.execute("SELECT DISTINCT `hash_id` FROM `%s` " % self.getName()+
+                        " WHERE `hash_id` IN (%s)" % (id_str,))
+            hashes = set(item["hash_id"] for item in cur)
+        self.stopTimer('get_used_hashes')
+        return hashes
+
     def count_realsize_by_hashes(self, hash_ids):
         self.startTimer()
         count = 0
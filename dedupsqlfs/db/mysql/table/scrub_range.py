@@ -0,0 +1,69 @@
+# -*- coding: utf8 -*-
+"""
+Background scrubber progress: when every range of hash ids
+was verified last time and how many bad blocks found there.
+"""
+
+__author__ = 'sergey'
+
+from dedupsqlfs.db.mysql.table import Table
+
+class TableScrubRange( Table ):
+
+    _table_name = "scrub_range"
+
+    def create( self ):
+        cur = self.getCursor()
+
+        # Create table
+        cur.execute(
+            "CREATE TABLE IF NOT EXISTS `%s` (" % self.getName()+
+                "`range_id` BIGINT UNSIGNED PRIMARY KEY, "+
+                "`scrubbed_at` INT UNSIGNED NOT NULL, "+
+                "`blocks` INT UNSIGNED NOT NULL DEFAULT 0, "+
+                "`errors` INT UNSIGNED NOT NULL DEFAULT 0 "+
+            ")"+
+            self._getCreationAppendString()
+        )
+        return
+
+    def set( self, range_id, scrubbed_at, blocks, errors):
+        """
+        :param range_id: int - hash_id // range size
+        :param scrubbed_at: int - unix time
+        :return: int
+        """
+        self.startTimer()
+        cur = self.getCursor()
+        cur.execute(
+            "REPLACE INTO `%s` " % self.getName()+
+            " (`range_id`, `scrubbed_at`, `blocks`, `errors`) VALUES (%(id)s, %(at)s, %(blocks)s, %(errors)s)",
+            {
+                "id": range_id,
+                "at": scrubbed_at,
+                "blocks": blocks,
+                "errors": errors
+            }
+        )
+        self.stopTimer('set')
+        return 1
+
+    def get( self, range_id):
+        """
+        :param range_id: int
+        :return: Row
+        """
+        self.startTimer()
+        cur = self.getCursor()
+        cur.execute(
+            "SELECT * FROM `%s` " % self.getName()+
+            " WHERE `range_id`=%(id)s",
+            {
+                "id": range_id
+            }
+        )
+        item = cur.fetchone()
+        self.stopTimer('get')
+        return item
+
+    pass
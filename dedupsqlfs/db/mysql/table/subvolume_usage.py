@@ -0,0 +1,87 @@
+# -*- coding: utf8 -*-
+"""
+Usage counters of subvolumes: apparent, data, unique and compressed sizes.
+Mounted FS changes them by deltas of written, truncated and removed blocks,
+so statistics are read without scan of subvolume tables.
+No row - counters are not calculated yet.
+"""
+
+__author__ = 'sergey'
+
+from dedupsqlfs.db.mysql.table import Table
+
+class TableSubvolumeUsage( Table ):
+
+    _table_name = "subvolume_usage"
+
+    def create( self ):
+        cur = self.getCursor()
+
+        # Create table
+        cur.execute(
+            "CREATE TABLE IF NOT EXISTS `%s` (" % self.getName()+
+                "`subvol_id` INT UNSIGNED PRIMARY KEY, "+
+                "`apparent_size` BIGINT NOT NULL DEFAULT 0, "+
+                "`data_size` BIGINT NOT NULL DEFAULT 0, "+
+                "`unique_size` BIGINT NOT NULL DEFAULT 0, "+
+                "`compressed_size` BIGINT NOT NULL DEFAULT 0, "+
+                "`compressed_unique_size` BIGINT NOT NULL DEFAULT 0"+
+            ")"+
+            self._getCreationAppendString()
+        )
+        return
+
+    def set_usage( self, subvol_id, apparent_size=0, data_size=0, unique_size=0, compressed_size=0, compressed_unique_size=0):
+        """
+        :param subvol_id: int
+        :return: int
+        """
+        self.startTimer()
+        cur = self.getCursor()
+        cur.execute("REPLACE INTO `%s` " % self.getName()+
+                    "(`subvol_id`, `apparent_size`, `data_size`, `unique_size`, `compressed_size`, `compressed_unique_size`) "+
+                    "VALUES (%s, %s, %s, %s, %s, %s)",
+                    (subvol_id, apparent_size, data_size, unique_size, compressed_size, compressed_unique_size,))
+        item = cur.rowcount
+        self.stopTimer('set_usage')
+        return item
+
+    def add( self, subvol_id, apparent_size=0, data_size=0, unique_size=0, compressed_size=0, compressed_unique_size=0):
+        """
+        Change counters by deltas, nothing if counters are not calculated
+
+        :param subvol_id: int
+        :return: int
+        """
+        self.startTimer()
+        cur = self.getCursor()
+        cur.execute("UPDATE `%s` SET " % self.getName()+
+                    "`apparent_size`=`apparent_size`+%s, `data_size`=`data_size`+%s, `unique_size`=`unique_size`+%s, "+
+                    "`compressed_size`=`compressed_size`+%s, `compressed_unique_size`=`compressed_unique_size`+%s "+
+                    "WHERE `subvol_id`=%s",
+                    (apparent_size, data_size, unique_size, compressed_size, compressed_unique_size, subvol_id,))
+        item = cur.rowcount
+        self.stopTimer('add')
+        return item
+
+    def get( self, subvol_id):
+        """
+        :param subvol_id: int
+        :return: dict | None
+        """
+        self.startTimer()
+        cur = self.getCursor()
+        cur.execute("SELECT * FROM `%s` WHERE `subvol_id`=%%s" % self.getName(), (subvol_id,))
+        item = cur.fetchone()
+        self.stopTimer('get')
+        return item
+
+    def delete( self, subvol_id):
+        self.startTimer()
+        cur = self.getCursor()
+        cur.execute("DELETE FROM `%s` WHERE `subvol_id`=%%s" % self.getName(), (subvol_id,))
+        item = cur.rowcount
+        self.stopTimer('delete')
+        return item
+
+    pass
@@ -4,7 +4,9 @@ __author__ = 'sergey'
 
 import os
 import shutil
+import platform
 from dedupsqlfs.lib import constants
+from dedupsqlfs.db.sqlite.row import dict_factory
 
 class DbManager( object ):
 
@@ -22,6 +24,26 @@ class DbManager( object ):
 
     _compression_prog = None
 
+    _commit_count = 0
+    _commit_files = 0
+    _commit_skipped = 0
+
+    _attach = False
+    """
+    @ivar _attach: Attach table files to one shared connection,
+                   so all changes are commited in one transaction
+    """
+
+    _attach_conn = None
+    _attach_changes = 0
+
+    _journal_mode = None
+
+    _attached = None
+    """
+    @ivar _attached: Attached table files: { table name: database name }
+    """
+
     tables = (
         "option",
         "tree",
@@ -33,9 +55,12 @@ class DbManager( object ):
         "block",
         "xattr",
         "compression_type",
+        "compression_dict",
         "hash",
         "hash_compression_type",
         "hash_sizes",
+        "hash_delta",
+        "hash_sketch",
         "inode_hash_block",
         "subvolume",
     )
@@ -50,6 +75,7 @@ class DbManager( object ):
         if not (synchronous is None):
             self._synchronous = synchronous == True
         self._table = {}
+        self._attached = {}
         pass
 
     def setLogger(self, logger):
@@ -83,6 +109,216 @@ class DbManager( object ):
     def getAutocommit(self):
         return self._autocommit
 
+    def setAttach(self, flag=True, first=None):
+        """
+        Switch table files to shared connection.
+        Tables are reopened on next use.
+
+        @param first: Tables attached before any other - changed by every flush,
+                      so they must be commited in one transaction.
+                      If all of them can't be attached - shared connection is not used.
+        @type  first: list | tuple | None
+        """
+        flag = flag == True
+        if flag == self._attach:
+            return self
+        self.commit()
+        for name, t in self._table.items():
+            t.close(True)
+        if not flag:
+            self.closeAttachConnection()
+        self._attach = flag
+        if flag and first:
+            self.attachFirst(first)
+        return self
+
+    def attachFirst(self, tables):
+        """
+        Attach tables in given order, block partitions - every one of them
+
+        @param tables: list of L{dedupsqlfs.db.sqlite.table.Table}
+
+        @return: bool - all of them fit in limit of attached databases
+        """
+        files = []
+        for t in tables:
+            if hasattr(t, "getPart"):
+                files.extend(t.getPart(n) for n in range(t.n_parts))
+            else:
+                files.append(t)
+
+        limit = self.getAttachLimit()
+        if len(self._attached) + len(files) > limit:
+            # Up to compile time maximum of sqlite library
+            limit = self.setAttachLimit(len(self._attached) + len(files))
+        if len(self._attached) + len(files) > limit:
+            self.getLogger().warning(
+                "DbManager::attachFirst - %i table files must be in one transaction, "
+                "but only %i databases can be attached. Tables use own connections!",
+                len(files), limit - len(self._attached))
+            self._attach = False
+            self.closeAttachConnection()
+            return False
+
+        for t in files:
+            t.getConnection()
+        return True
+
+    def getAttach(self):
+        return self._attach
+
+    def getAttachConnection(self):
+        """
+        Shared connection, table files are attached to it
+
+        @rtype: sqlite3.Connection
+        """
+        if self._attach_conn is None:
+            import sqlite3
+
+            conn = sqlite3.connect(":memory:", check_same_thread=False)
+
+            conn.row_factory = dict_factory
+            conn.text_factory = bytes
+
+            # Dirty hack again for pypy
+            isPyPy = platform.python_implementation() == 'PyPy'
+            if isPyPy:
+                self.setAutocommit(True)
+
+            if not self.getAutocommit():
+                conn.execute("PRAGMA read_uncommitted=ON")
+                conn.isolation_level = "DEFERRED"
+            else:
+                conn.isolation_level = None
+
+            # Applies to all attached databases
+            conn.execute('PRAGMA locking_mode=EXCLUSIVE')
+            conn.execute("PRAGMA temp_store=FILE")
+
+            self._attach_conn = conn
+            self._attach_changes = 0
+        return self._attach_conn
+
+    def getAttachLimit(self):
+        import sqlite3
+        conn = self.getAttachConnection()
+        if hasattr(conn, "getlimit"):
+            return conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)
+        # SQLite default
+        return 10
+
+    def setAttachLimit(self, count):
+        """
+        @return: int - new limit, not bigger than SQLITE_MAX_ATTACHED
+        """
+        import sqlite3
+        conn = self.getAttachConnection()
+        if hasattr(conn, "setlimit"):
+            conn.setlimit(sqlite3.SQLITE_LIMIT_ATTACHED, count)
+        return self.getAttachLimit()
+
+    def attachTable(self, table):
+        """
+        Attach table file to shared connection
+
+        @param table: L{dedupsqlfs.db.sqlite.table.Table}
+
+        @return: sqlite3.Connection or None - if table can't be attached
+        """
+        name = table.getName()
+        schema = table.getSchemaName()
+
+        # Same table name in other file - unqualified queries will be ambiguous
+        if name in self._attached:
+            return None
+        if len(self._attached) >= self.getAttachLimit():
+            self.getLogger().debug("DbManager::attachTable - limit of attached databases reached, %r uses own connection", schema)
+            return None
+
+        conn = self.getAttachConnection()
+
+        # ATTACH is not allowed inside transaction
+        inTransaction = conn.in_transaction
+        if inTransaction:
+            conn.commit()
+            self._attach_changes = conn.total_changes
+
+        conn.execute("ATTACH DATABASE ? AS `%s`" % schema, (table.getDbFilePath(),))
+        conn.execute("PRAGMA `%s`.journal_size_limit=-1" % schema)
+        if not self.getSynchronous():
+            conn.execute("PRAGMA `%s`.synchronous=OFF" % schema)
+        else:
+            conn.execute("PRAGMA `%s`.synchronous=NORMAL" % schema)
+        conn.execute("PRAGMA `%s`.cache_size=%i" % (schema, self.getTableCacheSize(table.getRole()) / table.calcFilePageSize()))
+        conn.execute("PRAGMA `%s`.mmap_size=%i" % (schema, self.getTableMmapSize(table.getRole())))
+        if self._journal_mode:
+            # Not all modes are stored in file
+            conn.execute("PRAGMA `%s`.journal_mode=%s" % (schema, self._journal_mode.upper(),))
+
+        if inTransaction:
+            conn.execute("BEGIN")
+
+        self._attached[ name ] = schema
+        return conn
+
+    def detachTable(self, table):
+        name = table.getName()
+        if self._attached.get(name) != table.getSchemaName():
+            return self
+        conn = self.getAttachConnection()
+        if conn.in_transaction:
+            conn.commit()
+            self._attach_changes = conn.total_changes
+        conn.execute("DETACH DATABASE `%s`" % table.getSchemaName())
+        del self._attached[ name ]
+        return self
+
+    def isAttachedDirty(self):
+        if self._attach_conn is None:
+            return False
+        return self._attach_conn.total_changes != self._attach_changes
+
+    def setAttachedClean(self):
+        if self._attach_conn is not None:
+            self._attach_changes = self._attach_conn.total_changes
+        return self
+
+    def closeAttachConnection(self):
+        if self._attach_conn is not None:
+            self._attach_conn.close()
+            self._attach_conn = None
+        self._attached = {}
+        return self
+
+    def getTableCacheSize(self, role):
+        """
+        Page cache size of table file by its role
+
+        @param role: table role, see constants.TABLE_ROLE_*
+        @type  role: str
+
+        @return: int - bytes
+        """
+        size = self.getAppOption("cache_size_per_table")
+        if size is None:
+            size = constants.SQLITE_CACHE_SIZE_DEFAULT
+        return int(size * constants.SQLITE_CACHE_SIZE_ROLE_FACTOR.get(role, 1.0))
+
+    def getTableMmapSize(self, role):
+        """
+        Memory-mapped I/O size of table file by its role, 0 - disabled
+
+        @param role: table role, see constants.TABLE_ROLE_*
+        @type  role: str
+
+        @return: int - bytes
+        """
+        size = self.getAppOption("sqlite_mmap_size")
+        if size is None:
+            size = constants.SQLITE_MMAP_SIZE_DEFAULT
+        return int(size * constants.SQLITE_MMAP_SIZE_ROLE_FACTOR.get(role, 0))
+
     def setTableEngine(self, engine):
         return self
 
@@ -178,6 +414,11 @@ class DbManager( object ):
                 self._table[ name ] = TableCompressionType(self)
                 if cp != bp:
                     self._table[ name ].setClustered(True)
+            elif name == "compression_dict":
+                from dedupsqlfs.db.sqlite.table.compression_dict import TableCompressionDict
+                self._table[ name ] = TableCompressionDict(self)
+                if cp != bp:
+                    self._table[ name ].setClustered(True)
             elif name == "hash_compression_type":
                 from dedupsqlfs.db.sqlite.table.hash_compression_type import TableHashCompressionType
                 self._table[ name ] = TableHashCompressionType(self)
@@ -188,6 +429,21 @@ class DbManager( object ):
                 self._table[ name ] = TableHashSizes(self)
                 if cp != bp:
                     self._table[ name ].setClustered(True)
+            elif name == "hash_meta":
+                from dedupsqlfs.db.sqlite.table.hash_meta import TableHashMeta
+                self._table[ name ] = TableHashMeta(self)
+                if cp != bp:
+                    self._table[ name ].setClustered(True)
+            elif name == "hash_gc":
+                from dedupsqlfs.db.sqlite.table.hash_gc import TableHashGc
+                self._table[ name ] = TableHashGc(self)
+                if cp != bp:
+                    self._table[ name ].setClustered(True)
+            elif name == "scrub_range":
+                from dedupsqlfs.db.sqlite.table.scrub_range import TableScrubRange
+                self._table[ name ] = TableScrubRange(self)
+                if cp != bp:
+                    self._table[ name ].setClustered(True)
             elif name == "name_pattern_option":
                 from dedupsqlfs.db.sqlite.table.name_pattern_option import TableNamePatternOption
                 self._table[ name ] = TableNamePatternOption(self)
@@ -203,6 +459,16 @@ class DbManager( object ):
                 self._table[ name ] = TableHash(self)
                 if cp != bp:
                     self._table[ name ].setClustered(True)
+            elif name == "hash_delta":
+                from dedupsqlfs.db.sqlite.table.hash_delta import TableHashDelta
+                self._table[ name ] = TableHashDelta(self)
+                if cp != bp:
+                    self._table[ name ].setClustered(True)
+            elif name == "hash_sketch":
+                from dedupsqlfs.db.sqlite.table.hash_sketch import TableHashSketch
+                self._table[ name ] = TableHashSketch(self)
+                if cp != bp:
+                    self._table[ name ].setClustered(True)
             elif name == "hash_count":
                 from dedupsqlfs.db.sqlite.table.hash_count import TableHashCount
                 self._table[ name ] = TableHashCount(self)
@@ -223,6 +489,9 @@ class DbManager( object ):
             elif name == "subvolume":
                 from dedupsqlfs.db.sqlite.table.subvolume import TableSubvolume
                 self._table[ name ] = TableSubvolume(self)
+            elif name == "subvolume_usage":
+                from dedupsqlfs.db.sqlite.table.subvolume_usage import TableSubvolumeUsage
+                self._table[ name ] = TableSubvolumeUsage(self)
             elif name == "tmp_ids":
                 from dedupsqlfs.db.sqlite.table.tmp_ids import TableTmpIds
                 self._table[ name ] = TableTmpIds(self)
@@ -236,6 +505,7 @@ class DbManager( object ):
                 self._table[name].setFileName(":memory:")
             if not nocreate:
                 if not self._table[ name ].hasTable():
+                    self._table[ name ].setDirty()
                     self._table[ name ].create()
                     # Ugly fix for pypy3
                     self._table[ name ].commit()
@@ -256,10 +526,62 @@ class DbManager( object ):
         return self
 
     def commit(self):
+        """
+        Commit only tables with changes - every commit of sqlite file may do fsync.
+        Attached tables are commited all at once by first of them.
+        """
+        self._commit_count += 1
         for name, t in self._table.items():
-            t.commit()
+            if t.isDirty():
+                t.commit()
+                self._commit_files += 1
+            else:
+                self._commit_skipped += 1
         return self
 
+    def checkpoint(self, mode="PASSIVE"):
+        """
+        Checkpoint WAL files of opened tables
+
+        @return: int - count of checkpointed pages
+        """
+        pages = 0
+        for name, t in self._table.items():
+            pages += t.checkpoint(mode)
+        return pages
+
+    def incrementalVacuum(self, pages):
+        """
+        Remove free pages of opened tables in 'incremental' auto vacuum mode.
+        Tables with bigger part of free pages go first.
+
+        @param pages: max count of removed pages for all tables
+        @type  pages: int
+
+        @return: int - count of removed pages
+        """
+        tables = []
+        for name, t in self._table.items():
+            if t.getAutoVacuum() != 2:
+                continue
+            free = t.getFreelistCount()
+            if free > 0:
+                tables.append((free * 1.0 / max(t.getPageCount(), 1), name, t,))
+        tables.sort(key=lambda item: item[0], reverse=True)
+
+        freed = 0
+        for ratio, name, t in tables:
+            if freed >= pages:
+                break
+            freed += t.incrementalVacuum(pages - freed)
+        return freed
+
+    def getCommitStats(self):
+        """
+        @return: tuple (manager commits, committed table files, skipped clean table files)
+        """
+        return self._commit_count, self._commit_files, self._commit_skipped
+
     def rollback(self):
         for name, t in self._table.items():
             t.rollback()
@@ -274,6 +596,7 @@ class DbManager( object ):
     def close(self):
         for name, t in self._table.items():
             t.close()
+        self.closeAttachConnection()
         return self
 
     def getSize(self):
@@ -288,6 +611,7 @@ class DbManager( object ):
         return self
 
     def setJournalMode(self, mode):
+        self._journal_mode = mode
         for name, t in self._table.items():
             t.setJournalMode(mode)
         return self
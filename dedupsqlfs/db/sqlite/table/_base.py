@@ -42,6 +42,32 @@ class Table( object ):
 
     _enable_timers = False
 
+    _dirty = False
+    """
+    @ivar _dirty: Explicitly marked as changed - for statements not counted by sqlite, like DDL
+    """
+
+    _committed_changes = 0
+    """
+    @ivar _committed_changes: Connection total changes count on last commit
+    """
+
+    _attached = False
+    """
+    @ivar _attached: Table file attached to shared manager connection
+    """
+
+    _base_path = None
+    """
+    @ivar _base_path: Own directory for table file instead of manager base or cluster path
+    """
+
+    _table_role = constants.TABLE_ROLE_META
+    """
+    @ivar _table_role: What table stores - block data, hash index or metadata.
+                       Page cache and mmap sizes depend on it.
+    """
+
     def __init__(self, manager):
         if self._table_name is None:
             raise AttributeError("Define non-empty class variable '_table_name'")
@@ -143,6 +169,8 @@ class Table( object ):
             bp = self.getManager().getBasePath()
             if self.getClustered():
                 bp = self.getManager().getClusterPath()
+            if self._base_path:
+                bp = self._base_path
 
             self._db_file_path = os.path.join(
                 bp,
@@ -152,6 +180,14 @@ class Table( object ):
             self._db_file_path = os.path.abspath(self._db_file_path)
         return self._db_file_path
 
+    def setBasePath(self, base_path):
+        self._base_path = base_path
+        self._db_file_path = None
+        return self
+
+    def getBasePath(self):
+        return self._base_path
+
     def setPageSize(self, page_size):
         # Sqlite support 512-65536 byte pages
         for n in range(9,17):
@@ -267,6 +303,9 @@ class Table( object ):
     def connect( self ):
         import sqlite3
 
+        if self.getManager().getAttach() and self._attach():
+            return
+
         db_path = self.getDbFilePath()
 #        print("%s->connect(%s)" % (self._table_name, db_path))
         if db_path!=':memory:':
@@ -278,9 +317,11 @@ class Table( object ):
 
         pageSize = self.calcFilePageSize()
 
-        cacheSize = 64*1024*1024 / pageSize
+        cacheSize = self.getManager().getTableCacheSize(self._table_role) / pageSize
+        mmapSize = self.getManager().getTableMmapSize(self._table_role)
 
-        conn = sqlite3.connect(db_path)
+        # Idle checkpoint thread uses connection under FUSE global lock
+        conn = sqlite3.connect(db_path, check_same_thread=False)
 
         conn.row_factory = dict_factory
         conn.text_factory = bytes
@@ -313,6 +354,7 @@ class Table( object ):
         self.getLogger().debug("Table: pageSize=%r" % pageSize)
         conn.execute("PRAGMA page_size=%i" % pageSize)
         conn.execute("PRAGMA cache_size=%i" % cacheSize)
+        conn.execute("PRAGMA mmap_size=%i" % mmapSize)
 
         self._conn = conn
         return
@@ -332,31 +374,101 @@ class Table( object ):
         return cur
 
     def getDbPageSize(self):
-        result = self.getConnection().execute('PRAGMA page_size').fetchone()
+        result = self.getConnection().execute('PRAGMA %s' % self._schema('page_size')).fetchone()
         # print("%s::getPageSize()=%r" % (self.getName(), result,))
         return result["page_size"]
 
     def getPageCount(self):
-        result = self.getConnection().execute('PRAGMA page_count').fetchone()
+        result = self.getConnection().execute('PRAGMA %s' % self._schema('page_count')).fetchone()
         # print("%s::getPageCount()=%r" % (self.getName(), result,))
         return result["page_count"]
 
+    def getFreelistCount(self):
+        result = self.getConnection().execute('PRAGMA %s' % self._schema('freelist_count')).fetchone()
+        return result["freelist_count"]
+
+    def getAutoVacuum(self):
+        result = self.getConnection().execute('PRAGMA %s' % self._schema('auto_vacuum')).fetchone()
+        return result["auto_vacuum"]
+
     def shrinkMemory(self):
         self.getConnection().execute('PRAGMA shrink_memory')
         return self
 
+    def getRole(self):
+        return self._table_role
+
+    def checkpoint(self, mode="PASSIVE"):
+        """
+        Move pages from WAL file into database file.
+        Open transaction is commited before and started again after.
+
+        @param mode: PASSIVE, FULL, RESTART or TRUNCATE
+        @type  mode: str
+
+        @return: int - count of checkpointed pages
+        """
+        if self._conn is None:
+            return 0
+
+        self.startTimer()
+        conn = self._conn
+        inTransaction = conn.in_transaction
+        if inTransaction:
+            self.commit()
+
+        result = conn.execute('PRAGMA %s(%s)' % (self._schema('wal_checkpoint'), mode.upper(),)).fetchone()
+
+        if inTransaction:
+            self.begin()
+        self.stopTimer("checkpoint")
+
+        # Not in WAL mode: -1
+        if not result or result["checkpointed"] < 0:
+            return 0
+        return result["checkpointed"]
+
+    def incrementalVacuum(self, pages):
+        """
+        Remove free pages from end of file, only for 'incremental' auto vacuum mode.
+        Open transaction is commited before and started again after.
+
+        @param pages: max count of removed pages
+        @type  pages: int
+
+        @return: int - count of removed pages
+        """
+        if pages <= 0:
+            return 0
+
+        self.startTimer()
+        conn = self.getConnection()
+        inTransaction = conn.in_transaction
+        if inTransaction:
+            self.commit()
+
+        before = self.getFreelistCount()
+        # Statement must be stepped to the end, execute() does only one step
+        conn.executescript('PRAGMA %s(%d);' % (self._schema('incremental_vacuum'), pages,))
+        freed = before - self.getFreelistCount()
+
+        if inTransaction:
+            self.begin()
+        self.stopTimer("incrementalVacuum")
+        return freed
+
     def setJournalMode(self, mode):
         if mode=='off':
           self.getLogger().warning("Warning: Disabling journal, you might lose data!")
-        self.getConnection().execute('PRAGMA journal_mode=%s' % (mode.upper(),))
+        self.getConnection().execute('PRAGMA %s=%s' % (self._schema('journal_mode'), mode.upper(),))
         return self
 
     def setAutoVacuum(self, mode):
-        self.getConnection().execute('PRAGMA auto_vacuum=%d' % (mode,))
+        self.getConnection().execute('PRAGMA %s=%d' % (self._schema('auto_vacuum'), mode,))
         return self
 
     def hasTable(self):
-        result = self.getConnection().execute("SELECT name FROM sqlite_master WHERE type = 'table';").fetchall()
+        result = self.getConnection().execute("SELECT name FROM %s WHERE type = 'table';" % self._schema('sqlite_master')).fetchall()
         has = False
         for item in result:
             if item["name"].decode() == self.getName():
@@ -371,7 +483,7 @@ class Table( object ):
         :type  fname: str
         :return: bool
         """
-        result = self.getConnection().execute("PRAGMA table_info('%s');" % self.getName()).fetchall()
+        result = self.getConnection().execute("PRAGMA %s('%s');" % (self._schema('table_info'), self.getName(),)).fetchall()
         has = False
         for item in result:
             if item["name"].decode() == fname:
@@ -402,10 +514,90 @@ class Table( object ):
     def create( self ):
         raise NotImplemented
 
+    def setDirty(self, flag=True):
+        self._dirty = flag is True
+        return self
+
+    def isDirty(self):
+        """
+        Table has uncommitted changes?
+        Rows changed by INSERT/UPDATE/DELETE are counted by sqlite itself.
+
+        @rtype: bool
+        """
+        if self._dirty:
+            return True
+        if self._conn is None:
+            return False
+        if self._attached:
+            return self.getManager().isAttachedDirty()
+        return self._conn.total_changes != self._committed_changes
+
+    def _setClean(self):
+        self._dirty = False
+        if self._conn is not None:
+            if self._attached:
+                self.getManager().setAttachedClean()
+            self._committed_changes = self._conn.total_changes
+        return self
+
+    def isAttached(self):
+        return self._attached
+
+    def getSchemaName(self):
+        """
+        Database name on shared connection
+        """
+        return self.getFileName()
+
+    def _schema(self, name):
+        """
+        Qualify pragma or index name with attached database name
+
+        @param name: pragma or index name
+        @type  name: str
+
+        @return: str
+        """
+        if self._attached:
+            return "`%s`.%s" % (self.getSchemaName(), name,)
+        return name
+
+    def _attach(self):
+        """
+        Use shared connection of manager if table file exists already.
+        New files are created by own connection - CREATE statements are not qualified.
+
+        @return: bool
+        """
+        db_path = self.getDbFilePath()
+        if db_path == ':memory:':
+            return False
+
+        self._decompress()
+
+        if not os.path.isfile(db_path) or not os.path.getsize(db_path):
+            return False
+
+        conn = self.getManager().attachTable(self)
+        if conn is None:
+            return False
+
+        self._conn = conn
+        self._attached = True
+        self._committed_changes = 0
+        return True
+
     def begin( self ):
         if not self.getManager().getAutocommit():
-            cur = self.getCursor()
-            cur.execute("BEGIN")
+            # Closed tables are opened on demand, DML starts transaction by itself
+            if self._conn is None:
+                return self
+            conn = self._conn
+            # Clean tables are not committed - transaction still open
+            if not conn.in_transaction:
+                cur = self.getCursor()
+                cur.execute("BEGIN")
         return self
 
     def commit(self):
@@ -418,6 +610,7 @@ class Table( object ):
                 self.getLogger().debug("EEE: Exception on commit? %s" % e)
                 pass
             self.stopTimer("commit")
+        self._setClean()
         return self
 
     def rollback(self):
@@ -425,6 +618,7 @@ class Table( object ):
             self.startTimer()
             self.getConnection().rollback()
             self.stopTimer("rollback")
+        self._setClean()
         return self
 
     def vacuum(self):
@@ -494,8 +688,15 @@ class Table( object ):
             self._curr.close()
             self._curr = None
         if self._conn:
-            self._conn.close()
+            if self._attached:
+                # Shared connection stays open
+                self.getManager().detachTable(self)
+                self._attached = False
+            else:
+                self._conn.close()
             self._conn = None
+        self._dirty = False
+        self._committed_changes = 0
         if not nocompress:
             self._compress()
         return self
@@ -554,8 +755,9 @@ class Table( object ):
 
             fullIndexName = tableName + "_" + indexName
             cur = self.getCursor()
+            self.setDirty()
             cur.execute(
-                "CREATE "+_u+" INDEX `%s` " % fullIndexName+
+                "CREATE "+_u+" INDEX %s " % self._schema("`%s`" % fullIndexName)+
                 " ON `%s` " % tableName+
                 "("+_f+")")
 
@@ -568,7 +770,8 @@ class Table( object ):
         fullIndexName = tableName + "_" + indexName
         if self.hasIndexOnTable(tableName, indexName):
             cur = self.getCursor()
-            cur.execute("DROP INDEX `%s`;" % fullIndexName)
+            self.setDirty()
+            cur.execute("DROP INDEX %s;" % self._schema("`%s`" % fullIndexName))
         return self
 
     def hasIndex(self, indexName):
@@ -580,8 +783,8 @@ class Table( object ):
         fullIndexName = tableName + "_" + indexName
 
         cur.execute(
-            "PRAGMA index_info(`%s`);" %
-            fullIndexName
+            "PRAGMA %s(`%s`);" %
+            (self._schema("index_info"), fullIndexName,)
         )
         row = cur.fetchone()
 
@@ -2,13 +2,18 @@
 
 __author__ = 'sergey'
 
-from sqlite3 import Binary
+import os
+import sqlite3
+from sqlite3 import Binary, OperationalError
 from dedupsqlfs.db.sqlite.table import Table
+from dedupsqlfs.lib import constants
 
 class TableBlock( Table ):
 
     _table_name = "block"
 
+    _table_role = constants.TABLE_ROLE_BLOCK
+
     def create( self ):
         c = self.getCursor()
 
@@ -21,10 +26,11 @@ class TableBlock( Table ):
         )
         return
 
-    def insert( self, hash_id, data):
+    def insert( self, hash_id, data, digest=None):
         """
         :param hash_id: int
         :param data: bytes
+        :param digest: bytes - hash value, used by file storage only
         :return: int
         """
         self.startTimer()
@@ -38,10 +44,11 @@ class TableBlock( Table ):
         self.stopTimer('insert')
         return item
 
-    def update( self, hash_id, data):
+    def update( self, hash_id, data, digest=None):
         """
         :param hash_id: int
         :param data: bytes
+        :param digest: bytes - hash value, used by file storage only
         :return: int
         """
         self.startTimer()
@@ -55,18 +62,265 @@ class TableBlock( Table ):
         self.stopTimer('update')
         return count
 
+    def _open_blob(self, hash_id):
+        """
+        hash_id is INTEGER PRIMARY KEY - rowid, so blob is opened without index lookup.
+        Incremental BLOB I/O needs Python 3.11+.
+
+        :param hash_id: int
+        :return: sqlite3.Blob | None - if not supported or no such row
+        """
+        conn = self.getConnection()
+        if not hasattr(conn, "blobopen"):
+            return None
+        schema = "main"
+        if self._attached:
+            schema = self.getSchemaName()
+        try:
+            return conn.blobopen(self._table_name, "data", hash_id, readonly=True, name=schema)
+        except OperationalError:
+            return None
+
+    def open_blob(self, hash_id):
+        """
+        Open block data for reading by parts: blob[start:end], blob.read(size).
+        Close it after use - with statement.
+
+        :param hash_id: int
+        :return: sqlite3.Blob | None - if not supported or no such row
+        """
+        self.startTimer()
+        blob = self._open_blob(hash_id)
+        self.stopTimer('open_blob')
+        return blob
+
     def get( self, hash_id):
         """
         :param hash_id: int
         :return: Row
         """
         self.startTimer()
+        blob = self._open_blob(hash_id)
+        if blob is not None:
+            # Read data directly, without row building
+            with blob:
+                item = {"hash_id": hash_id, "data": blob.read()}
+        else:
+            cur = self.getCursor()
+            cur.execute("SELECT * FROM `%s` WHERE hash_id=?" % self._table_name, (hash_id,))
+            item = cur.fetchone()
+        self.stopTimer('get')
+        return item
+
+    def get_many( self, hash_ids):
+        """
+        :param hash_ids: list of int
+        :return: dict { hash_id: Row }
+        """
+        self.startTimer()
+        items = {}
+        id_str = ",".join(str(hash_id) for hash_id in hash_ids)
+        if id_str:
+            cur = self.getCursor()
+            cur.execute("SELECT * FROM `%s` WHERE hash_id IN (%s)" % (self._table_name, id_str,))
+            for item in cur.fetchall():
+                items[ item["hash_id"] ] = item
+        self.stopTimer('get_many')
+        return items
+
+    def get_locations( self, hash_ids):
+        """
+        Place of blocks in file, by pages of table b-tree from 'dbstat' virtual table.
+        Rows of table go in order of hash_id, every leaf page holds NCELL of them,
+        big blocks continue in overflow pages of their cell.
+
+        :param hash_ids: list of int
+        :return: dict { hash_id: (offset, length) } | None - no 'dbstat' in sqlite
+        """
+        self.startTimer()
+        wanted = set(hash_ids)
+        pageSize = self.getDbPageSize()
+        schema = self._attached and self.getSchemaName() or "main"
+
+        conn = self.getConnection()
+        try:
+            stat = conn.execute("SELECT path, pageno, pagetype, ncell FROM dbstat "+
+                                " WHERE name=? AND schema=?", (self._table_name, schema,))
+        except OperationalError:
+            self.stopTimer('get_locations')
+            return None
+        ids = conn.execute("SELECT hash_id FROM `%s` ORDER BY hash_id" % self._table_name)
+
+        locations = {}
+        cells = {}
+        for item in stat:
+            pagetype = item["pagetype"]
+            if isinstance(pagetype, bytes):
+                pagetype = pagetype.decode()
+            if pagetype == "leaf":
+                cells = {}
+                for cell in range(item["ncell"]):
+                    hash_id = ids.fetchone()["hash_id"]
+                    cells[ cell ] = hash_id
+                    if hash_id in wanted:
+                        locations[ hash_id ] = (item["pageno"] * pageSize, 0,)
+            elif pagetype == "overflow":
+                path = item["path"]
+                if isinstance(path, bytes):
+                    path = path.decode()
+                cellPath, n = path.rsplit("+", 1)
+                hash_id = cells.get(int(cellPath.rsplit("/", 1)[1], 16))
+                if hash_id in locations:
+                    offset, length = locations[ hash_id ]
+                    if int(n, 16) == 0:
+                        offset = item["pageno"] * pageSize
+                    locations[ hash_id ] = (offset, length + pageSize,)
+        self.stopTimer('get_locations')
+        return locations
+
+    def rewrite_ordered( self, hash_ids, batch=1000):
+        """
+        Rewrite table file: blocks of HASH_IDS first, in their order, then other blocks.
+        Pages of new rows are allocated in order of inserts,
+        so blocks read one by one stay close in file.
+
+        :param hash_ids: iterable of int
+        :return: int - count of blocks written in order
+        """
+        self.startTimer()
+        self.commit()
+
+        fn = self.getDbFilePath()
+        tmp_fn = fn + ".locality"
+        if os.path.isfile(tmp_fn):
+            os.unlink(tmp_fn)
+
+        conn = self.getConnection()
+        sql = conn.execute("SELECT sql FROM %s WHERE type='table' AND name=?" % self._schema("sqlite_master"),
+                           (self._table_name,)).fetchone()["sql"]
+        if isinstance(sql, bytes):
+            sql = sql.decode()
+
+        new = sqlite3.connect(tmp_fn)
+        new.execute("PRAGMA page_size=%i" % self.getDbPageSize())
+        new.execute("PRAGMA auto_vacuum=%i" % self.getAutoVacuum())
+        new.execute("PRAGMA journal_mode=OFF")
+        new.execute("PRAGMA synchronous=OFF")
+        new.execute(sql)
+
+        insert = "INSERT OR IGNORE INTO `%s`(hash_id, data) VALUES (?,?)" % self._table_name
+
+        def _copy(ids):
+            items = self.get_many(ids)
+            new.executemany(insert, ((hash_id, items[ hash_id ]["data"],) for hash_id in ids if hash_id in items))
+            return
+
+        chunk = []
+        for hash_id in hash_ids:
+            chunk.append(hash_id)
+            if len(chunk) >= batch:
+                _copy(chunk)
+                chunk = []
+        if chunk:
+            _copy(chunk)
+        count = new.total_changes
+
+        # Other blocks - in order of hash_id
+        cur = self.getCursor(True)
+        cur.execute("SELECT hash_id, data FROM `%s` ORDER BY hash_id" % self._table_name)
+        while True:
+            rows = cur.fetchmany(batch)
+            if not rows:
+                break
+            new.executemany(insert, ((row["hash_id"], row["data"],) for row in rows))
+        cur.close()
+
+        new.commit()
+        new.close()
+
+        # Journal is off - new file must be on disk before it replaces old one
+        fd = os.open(tmp_fn, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+        self.close(True)
+        os.replace(tmp_fn, fn)
+
+        # And rename itself
+        fd = os.open(os.path.dirname(fn) or ".", os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        self.stopTimer('rewrite_ordered')
+        return count
+
+    def replace( self, hash_id, data):
+        """
+        Insert or overwrite, for repeated copy of same data
+        :param hash_id: int
+        :param data: bytes
+        :return: int
+        """
+        self.startTimer()
         cur = self.getCursor()
-        cur.execute("SELECT * FROM `%s` WHERE hash_id=?" % self._table_name, (hash_id,))
+
+        bdata = Binary(data)
+
+        cur.execute("INSERT OR REPLACE INTO `%s`(hash_id, data) VALUES (?,?)" % self._table_name,
+                    (hash_id, bdata,))
+        item = cur.lastrowid
+        self.stopTimer('replace')
+        return item
+
+    def get_batch( self, start_id, limit):
+        """
+        Keyset pagination by hash_id
+
+        :param start_id: int - last hash_id of previous batch, 0 - from start
+        :param limit: int
+        :return: list of Row
+        """
+        self.startTimer()
+        cur = self.getCursor()
+        cur.execute("SELECT * FROM `%s` WHERE hash_id>? ORDER BY hash_id LIMIT ?" % self._table_name,
+                    (start_id, limit,))
+        items = cur.fetchall()
+        self.stopTimer('get_batch')
+        return items
+
+    def get_count_in_partition( self, n_parts, n):
+        """
+        Count rows which belong to partition N of N_PARTS
+        :return: int
+        """
+        self.startTimer()
+        cur = self.getCursor()
+        cur.execute("SELECT COUNT(1) as `cnt` FROM `%s` WHERE hash_id %% ? = ?" % self._table_name,
+                    (n_parts, n,))
         item = cur.fetchone()
-        self.stopTimer('get')
+        if item:
+            item = item["cnt"]
+        else:
+            item = 0
+        self.stopTimer('get_count_in_partition')
         return item
 
+    def remove_not_in_partition( self, n_parts, n):
+        """
+        Remove rows which belong to other partitions than N of N_PARTS
+        :return: int
+        """
+        self.startTimer()
+        cur = self.getCursor()
+        cur.execute("DELETE FROM `%s` WHERE hash_id %% ? != ?" % self._table_name,
+                    (n_parts, n,))
+        count = cur.rowcount
+        self.stopTimer('remove_not_in_partition')
+        return count
+
     def remove_by_ids(self, id_str):
         self.startTimer()
         count = 0
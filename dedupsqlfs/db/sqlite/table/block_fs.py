@@ -1,77 +1,200 @@
 # -*- coding: utf8 -*-
 
+"""
+Block data in files, one file per block
+
+File path is built from hash digest: DIR/xxxx/xxxx/xxxx/xxxx/DIGEST
+
+Files are written, read and removed by I/O thread pool,
+caller waits for them only on commit or read of same block.
+"""
+
 __author__ = 'sergey'
 
 import os
 from textwrap import wrap
-import shutil
+from concurrent.futures import ThreadPoolExecutor
 from dedupsqlfs.db.sqlite.table import Table
 from dedupsqlfs.lib.timers_ops import TimersOps
+from dedupsqlfs.lib import constants
 from dedupsqlfs.fs import mymakedirs
 
+
+def _write_file(path, data):
+    with open(path, "wb") as f:
+        return f.write(data)
+
+def _read_file(path):
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+def _remove_file(path):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        return 0
+    # Only empty directory, it may hold other blocks
+    try:
+        os.rmdir(os.path.dirname(path))
+    except OSError:
+        pass
+    return 1
+
+def _fsync_path(path):
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except FileNotFoundError:
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    return
+
+
 class TableBlockFs( Table, TimersOps ):
 
     _table_name="blocks"
 
-    def insert( self, hash_id, data):
+    _pool = None
+    """
+    @ivar _pool: I/O threads
+    @type _pool: concurrent.futures.ThreadPoolExecutor
+    """
+
+    _pending = None
+    """
+    @ivar _pending: Not finished writes - { hash_id: (future, data) }
+    """
+
+    _dirs = None
+    """
+    @ivar _dirs: Fan-out directories already created
+    """
+
+    _digests = None
+    """
+    @ivar _digests: hash_id -> digest, not to query hash table again
+    """
+
+    _written = None
+    """
+    @ivar _written: Paths written after last commit, for fsync
+    """
+
+    def getPool(self):
+        if self._pool is None:
+            threads = self.getManager().getAppOption("block_fs_io_threads")
+            if not threads:
+                threads = constants.BLOCK_FS_IO_THREADS_DEFAULT
+            self._pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="BlockFs-io")
+            self._pending = {}
+            self._dirs = set()
+            self._written = set()
+        return self._pool
+
+    def insert( self, hash_id, data, digest=None):
         """
         :param hash_id: int
         :param data: bytes
+        :param digest: bytes - hash value, queried by hash_id if not set
         :return: int
         """
         self.startTimer()
-        datap = self.hashToPath(hash_id)
-        print(datap)
-        dn = os.path.dirname(datap)
-        print(dn)
-        if not os.path.isdir(dn):
-          mymakedirs(dn, mode=0o777, exist_ok=True)
-        self.writeData(datap, data)
+        datap = self.hashToPath(hash_id, digest)
+        self.makeDir(os.path.dirname(datap))
+        self.writeData(hash_id, datap, data)
         self.stopTimer('insert')
         return hash_id
 
-    def writeData(self, path, data):
+    def makeDir(self, dn):
+        self.getPool()
+        if dn not in self._dirs:
+            os.makedirs(dn, mode=0o777, exist_ok=True)
+            self._dirs.add(dn)
+        return
+
+    def writeData(self, hash_id, path, data):
         self.startTimer()
-        f = open(path,"wb")
-#        print("try to write %d bytes" % len(data))
-        written=f.write(data)
-#        print("wrote %d bytes" % written )
-        f.flush()
-        f.close()
+        pool = self.getPool()
+        self._waitPending(hash_id)
+        self._pending[ hash_id ] = (pool.submit(_write_file, path, data), data,)
+        self._written.add(path)
         self.stopTimer('writeData')
-        return written
- 
+        return len(data)
+
     def readData(self, path):
         self.startTimer()
-        f = open(path,"rb")
-        data=f.read()
-        f.close()
+        data = _read_file(path)
         self.stopTimer('readData')
         return data
- 
-    def hashToPath(self, hash_id):
+
+    def _waitPending(self, hash_id):
+        """
+        Wait for write of block, raise its error
+        """
+        if self._pending and hash_id in self._pending:
+            future, data = self._pending.pop(hash_id)
+            future.result()
+        return
+
+    def _waitAllPending(self):
+        if not self._pending:
+            return
+        pending = self._pending
+        self._pending = {}
+        error = None
+        for future, data in pending.values():
+            e = future.exception()
+            if e is not None:
+                self.getLogger().error("Block file write: %s" % e)
+                error = e
+        if error is not None:
+            raise error
+        return
+
+    def hashToPath(self, hash_id, digest=None):
         self.startTimer()
+        if self._digests is None:
+            self._digests = {}
+        if digest is None:
+            digest = self._digests.get(hash_id)
+        if digest is None:
+            digest = self._manager.getTable("hash").get(hash_id)
+        if digest is None:
+            # Hash removed already, file can't be found
+            self.stopTimer('hashToPath')
+            return None
+        if len(self._digests) >= constants.BLOCK_FS_DIGESTS_CACHE_SIZE:
+            self._digests.clear()
+        self._digests[ hash_id ] = digest
+
         db_path = self.getDbFilePath()
         p = os.path.join(db_path, self._table_name)
-        hashdigest = self._manager.getTable("hash").get(hash_id).hex()
+        hashdigest = digest.hex()
         hexp = wrap(hashdigest,4)[:4]
         fp = os.path.join(p, hexp[0], hexp[1], hexp[2], hexp[3], hashdigest)
         self.stopTimer('hashToPath')
         return fp
 
-    def update( self, hash_id, data):
+    def update( self, hash_id, data, digest=None):
         """
         :param hash_id: int
         :param data: bytes
+        :param digest: bytes - hash value, queried by hash_id if not set
         :return: int
         """
         self.startTimer()
 
-        datap = self.hashToPath(hash_id)
-        if not os.path.isfile(datap):
+        datap = self.hashToPath(hash_id, digest)
+        if not (self._pending and hash_id in self._pending) and not os.path.isfile(datap):
             # nothing to update, insert first
+            self.stopTimer('update')
             return 0
-        self.writeData(datap, data)
+        self.writeData(hash_id, datap, data)
         self.stopTimer('update')
         return 1
 
@@ -81,28 +204,138 @@ class TableBlockFs( Table, TimersOps ):
         :return: Row
         """
         self.startTimer()
-        datap = self.hashToPath(hash_id)
-        if not os.path.isfile(datap):
-            # nothing to update, insert first
-            return None
-        value = self.readData(datap)
+        if self._pending and hash_id in self._pending:
+            # Not written yet, or just written
+            value = self._pending[ hash_id ][1]
+        else:
+            value = None
+            datap = self.hashToPath(hash_id)
+            if datap:
+                value = self.readData(datap)
         self.stopTimer('get')
-        return {"hash_id": hash_id, "value":value}
+        if value is None:
+            return None
+        return {"hash_id": hash_id, "data": value}
+
+    def get_many( self, hash_ids):
+        """
+        Read many blocks by I/O threads
+
+        :param hash_ids: list of int
+        :return: dict { hash_id: Row }
+        """
+        self.startTimer()
+        pool = self.getPool()
+        items = {}
+        futures = {}
+        for hash_id in hash_ids:
+            if hash_id in self._pending:
+                items[ hash_id ] = {"hash_id": hash_id, "data": self._pending[ hash_id ][1]}
+            else:
+                datap = self.hashToPath(hash_id)
+                if datap:
+                    futures[ hash_id ] = pool.submit(_read_file, datap)
+        for hash_id, future in futures.items():
+            value = future.result()
+            if value is not None:
+                items[ hash_id ] = {"hash_id": hash_id, "data": value}
+        self.stopTimer('get_many')
+        return items
+
+    def get_locations( self, hash_ids):
+        """
+        Every block is in own file
+
+        :return: None
+        """
+        return None
+
+    def rewrite_ordered( self, hash_ids, batch=1000):
+        """
+        Files are placed by file system
+
+        :return: int
+        """
+        return 0
+
+    def open_blob( self, hash_id):
+        """
+        Data files are read whole
+
+        :param hash_id: int
+        :return: None
+        """
+        return None
 
     def remove_by_ids(self, id_str):
         self.startTimer()
         count = 0
         if id_str:
+            pool = self.getPool()
+            paths = []
             for hash_id in id_str.split(","):
+                hash_id = int(hash_id)
+                self._waitPending(hash_id)
                 datap = self.hashToPath(hash_id)
-                if os.path.isfile(datap):
-                  os.unlink(datap)
-                  dn = os.path.dirname(datap)
-                  shutil.rmtree(dn, ignore_errors=True)
-                  count +=1
+                if not datap:
+                    continue
+                self._written.discard(datap)
+                self._dirs.discard(os.path.dirname(datap))
+                self._digests.pop(hash_id, None)
+                paths.append(datap)
+            count = sum(pool.map(_remove_file, paths))
         self.stopTimer('remove_by_ids')
         return count
 
+    def commit(self):
+        """
+        Wait for all writes, fsync written files together
+        """
+        self.startTimer()
+        self._waitAllPending()
+        if self._written:
+            if self.getManager().getSynchronous():
+                dirs = set(os.path.dirname(path) for path in self._written)
+                list(self.getPool().map(_fsync_path, self._written))
+                list(self.getPool().map(_fsync_path, dirs))
+            self._written = set()
+        self.stopTimer('commit')
+        return self
+
+    def begin(self):
+        return self
+
+    def rollback(self):
+        # Files are written already
+        self._waitAllPending()
+        return self
+
+    def isDirty(self):
+        return bool(self._written)
+
+    def checkpoint(self, mode="PASSIVE"):
+        return 0
+
+    def getPageCount(self):
+        return 0
+
+    def getFreelistCount(self):
+        return 0
+
+    def getAutoVacuum(self):
+        return 0
+
+    def incrementalVacuum(self, pages):
+        # Block files are removed at once
+        return 0
+
+    def close(self, nocompress=False):
+        if self._pool is not None:
+            self.commit()
+            self._pool.shutdown()
+            self._pool = None
+        return self
+
     def getDbFilePath(self):
         if self._table_file_name==":memory:":
             self._db_file_path = ":memory:"
@@ -118,6 +351,16 @@ class TableBlockFs( Table, TimersOps ):
             self._db_file_path = os.path.abspath(self._db_file_path)
         return self._db_file_path
 
+    def connect(self):
+        # No sqlite file here
+        return
+
+    def hasTable(self):
+        return os.path.isdir(self.getDbFilePath())
+
+    def getDbPageSize(self):
+        return self.getPageSize()
+
     def create(self):
       self.startTimer()
       p = db_path = self.getDbFilePath()
@@ -127,6 +370,8 @@ class TableBlockFs( Table, TimersOps ):
       self.stopTimer('create')
 
     def shrinkMemory(self):
+      if self._digests:
+          self._digests.clear()
       pass
 
     pass
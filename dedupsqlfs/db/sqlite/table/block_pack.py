@@ -0,0 +1,516 @@
+# -*- coding: utf8 -*-
+
+"""
+Block data in append-only segment files
+
+Compressed blocks are appended to current segment file,
+new segment is started when it grows over segment size.
+Index table in sqlite file: hash_id -> (segment, offset, length).
+
+Updated or removed blocks leave garbage in segments,
+compaction rewrites live blocks of mostly dead segments and removes them.
+"""
+
+__author__ = 'sergey'
+
+import os
+import shutil
+from dedupsqlfs.db.sqlite.table import Table
+from dedupsqlfs.lib import constants
+
+
+class PackBlob(object):
+    """
+    Block data in segment file, read by parts like sqlite3.Blob: blob[start:end]
+    """
+
+    _fd = None
+    _offset = 0
+    _length = 0
+
+    def __init__(self, fd, offset, length):
+        self._fd = fd
+        self._offset = offset
+        self._length = length
+        pass
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            raise TypeError("Only slices of block data are supported")
+        start, stop, step = key.indices(self._length)
+        if stop <= start:
+            return b''
+        return os.pread(self._fd, stop - start, self._offset + start)
+
+    def read(self):
+        return self[0:self._length]
+
+    def close(self):
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+    pass
+
+
+class TableBlockPack( Table ):
+
+    _table_name = "block_pack"
+
+    _table_role = constants.TABLE_ROLE_BLOCK
+
+    _write_file = None
+    """
+    @ivar _write_file: Current segment, opened for append
+    """
+    _write_segment = None
+    _write_offset = 0
+
+    _unsynced = False
+    """
+    @ivar _unsynced: Data appended after last fsync
+    """
+
+    _read_fds = None
+
+    def getSegmentSize(self):
+        size = self.getManager().getAppOption("packfile_segment_size")
+        if not size:
+            size = constants.PACKFILE_SEGMENT_SIZE_DEFAULT
+        return size
+
+    def getSegmentsPath(self):
+        return self.getDbFilePath()[:-len(".sqlite3")] + ".segments"
+
+    def getSegmentPath(self, segment):
+        return os.path.join(self.getSegmentsPath(), "%06d.pack" % segment)
+
+    def getSegments(self):
+        """
+        @return: list of segment numbers, existing files
+        """
+        segments = []
+        path = self.getSegmentsPath()
+        if not os.path.isdir(path):
+            return segments
+        for fn in os.listdir(path):
+            if fn.endswith(".pack"):
+                segments.append(int(fn[:-len(".pack")]))
+        segments.sort()
+        return segments
+
+    def create( self ):
+        c = self.getCursor()
+
+        # Create table
+        c.execute(
+            "CREATE TABLE IF NOT EXISTS `%s` (" % self._table_name+
+                "hash_id INTEGER PRIMARY KEY, "+
+                "segment INTEGER NOT NULL, "+
+                "offset INTEGER NOT NULL, "+
+                "length INTEGER NOT NULL"+
+            ");"
+        )
+        self.createIndexIfNotExists("segment", ("segment",))
+
+        path = self.getSegmentsPath()
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        return
+
+    def _getReadFd(self, segment):
+        if self._read_fds is None:
+            self._read_fds = {}
+        if segment not in self._read_fds:
+            self._read_fds[ segment ] = os.open(self.getSegmentPath(segment), os.O_RDONLY)
+        return self._read_fds[ segment ]
+
+    def _closeReadFd(self, segment):
+        if self._read_fds and segment in self._read_fds:
+            os.close(self._read_fds.pop(segment))
+        return
+
+    def _closeWriteFile(self):
+        if self._write_file is not None:
+            self._sync()
+            self._write_file.close()
+            self._write_file = None
+            self._write_segment = None
+        return
+
+    def _openWriteFile(self, segment):
+        self._closeWriteFile()
+        path = self.getSegmentsPath()
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        # Unbuffered - appended data is seen by readers at once
+        self._write_file = open(self.getSegmentPath(segment), "ab", buffering=0)
+        self._write_segment = segment
+        self._write_offset = os.fstat(self._write_file.fileno()).st_size
+        return
+
+    def getWriteSegment(self):
+        """
+        Segment for appended data - last one
+        """
+        if self._write_file is None:
+            segments = self.getSegments()
+            if segments:
+                self._openWriteFile(segments[-1])
+            else:
+                self._openWriteFile(1)
+        return self._write_segment
+
+    def _append(self, data):
+        """
+        @return: tuple (segment, offset)
+        """
+        self.getWriteSegment()
+        if self._write_offset and self._write_offset + len(data) > self.getSegmentSize():
+            self._openWriteFile(self._write_segment + 1)
+
+        segment, offset = self._write_segment, self._write_offset
+        self._write_file.write(data)
+        self._write_offset += len(data)
+        self._unsynced = True
+        return segment, offset
+
+    def _sync(self):
+        """
+        One fsync for all appended blocks - before index commit
+        """
+        if self._unsynced and self._write_file is not None:
+            if self.getManager().getSynchronous():
+                os.fsync(self._write_file.fileno())
+            self._unsynced = False
+        return
+
+    def _getLocation(self, hash_id):
+        cur = self.getCursor()
+        cur.execute("SELECT segment, offset, length FROM `%s` WHERE hash_id=?" % self._table_name, (hash_id,))
+        return cur.fetchone()
+
+    def _readData(self, item):
+        return os.pread(self._getReadFd(item["segment"]), item["length"], item["offset"])
+
+    def insert( self, hash_id, data, digest=None):
+        """
+        :param hash_id: int
+        :param data: bytes
+        :param digest: bytes - hash value, used by file storage only
+        :return: int
+        """
+        self.startTimer()
+        segment, offset = self._append(data)
+        cur = self.getCursor()
+        cur.execute("INSERT INTO `%s`(hash_id, segment, offset, length) VALUES (?,?,?,?)" % self._table_name,
+                    (hash_id, segment, offset, len(data),))
+        self.stopTimer('insert')
+        return hash_id
+
+    def update( self, hash_id, data, digest=None):
+        """
+        :param hash_id: int
+        :param data: bytes
+        :param digest: bytes - hash value, used by file storage only
+        :return: int
+        """
+        self.startTimer()
+        segment, offset = self._append(data)
+        cur = self.getCursor()
+        cur.execute("UPDATE `%s` SET segment=?, offset=?, length=? WHERE hash_id=?" % self._table_name,
+                    (segment, offset, len(data), hash_id,))
+        count = cur.rowcount
+        self.stopTimer('update')
+        return count
+
+    def replace( self, hash_id, data):
+        """
+        :param hash_id: int
+        :param data: bytes
+        :return: int
+        """
+        self.startTimer()
+        segment, offset = self._append(data)
+        cur = self.getCursor()
+        cur.execute("INSERT OR REPLACE INTO `%s`(hash_id, segment, offset, length) VALUES (?,?,?,?)" % self._table_name,
+                    (hash_id, segment, offset, len(data),))
+        self.stopTimer('replace')
+        return hash_id
+
+    def get( self, hash_id):
+        """
+        :param hash_id: int
+        :return: Row
+        """
+        self.startTimer()
+        item = self._getLocation(hash_id)
+        if item:
+            item = {"hash_id": hash_id, "data": self._readData(item)}
+        self.stopTimer('get')
+        return item
+
+    def get_many( self, hash_ids):
+        """
+        Blocks are read in order of their place in segments
+
+        :param hash_ids: list of int
+        :return: dict { hash_id: Row }
+        """
+        self.startTimer()
+        items = {}
+        id_str = ",".join(str(hash_id) for hash_id in hash_ids)
+        if id_str:
+            cur = self.getCursor()
+            cur.execute("SELECT * FROM `%s` WHERE hash_id IN (%s) ORDER BY segment, offset" % (self._table_name, id_str,))
+            for item in cur.fetchall():
+                items[ item["hash_id"] ] = {"hash_id": item["hash_id"], "data": self._readData(item)}
+        self.stopTimer('get_many')
+        return items
+
+    def open_blob( self, hash_id):
+        """
+        :param hash_id: int
+        :return: PackBlob | None
+        """
+        self.startTimer()
+        blob = None
+        item = self._getLocation(hash_id)
+        if item:
+            blob = PackBlob(self._getReadFd(item["segment"]), item["offset"], item["length"])
+        self.stopTimer('open_blob')
+        return blob
+
+    def get_batch( self, start_id, limit):
+        """
+        Keyset pagination by hash_id
+
+        :param start_id: int - last hash_id of previous batch, 0 - from start
+        :param limit: int
+        :return: list of Row
+        """
+        self.startTimer()
+        cur = self.getCursor()
+        cur.execute("SELECT * FROM `%s` WHERE hash_id>? ORDER BY hash_id LIMIT ?" % self._table_name,
+                    (start_id, limit,))
+        items = [ {"hash_id": item["hash_id"], "data": self._readData(item)} for item in cur.fetchall() ]
+        self.stopTimer('get_batch')
+        return items
+
+    def get_count_in_partition( self, n_parts, n):
+        """
+        Count blocks which belong to partition N of N_PARTS
+        :return: int
+        """
+        self.startTimer()
+        cur = self.getCursor()
+        cur.execute("SELECT COUNT(1) as `cnt` FROM `%s` WHERE hash_id %% ? = ?" % self._table_name,
+                    (n_parts, n,))
+        item = cur.fetchone()
+        if item:
+            item = item["cnt"]
+        else:
+            item = 0
+        self.stopTimer('get_count_in_partition')
+        return item
+
+    def remove_not_in_partition( self, n_parts, n):
+        """
+        Remove blocks which belong to other partitions than N of N_PARTS
+        :return: int
+        """
+        self.startTimer()
+        cur = self.getCursor()
+        cur.execute("DELETE FROM `%s` WHERE hash_id %% ? != ?" % self._table_name,
+                    (n_parts, n,))
+        count = cur.rowcount
+        self.stopTimer('remove_not_in_partition')
+        return count
+
+    def remove_by_ids(self, id_str):
+        self.startTimer()
+        count = 0
+        if id_str:
+            cur = self.getCursor()
+            cur.execute("DELETE FROM `%s` " % self.getName()+
+                        " WHERE `hash_id` IN (%s)" % (id_str,))
+            count = cur.rowcount
+        self.stopTimer('remove_by_ids')
+        return count
+
+    def get_segments_usage(self):
+        """
+        @return: dict { segment: live bytes }
+        """
+        self.startTimer()
+        cur = self.getCursor()
+        cur.execute("SELECT segment, SUM(length) as `live` FROM `%s` GROUP BY segment" % self._table_name)
+        usage = {}
+        for item in cur.fetchall():
+            usage[ item["segment"] ] = item["live"]
+        self.stopTimer('get_segments_usage')
+        return usage
+
+    def compact(self, live_ratio=constants.PACKFILE_COMPACT_LIVE_RATIO):
+        """
+        Rewrite live blocks of segments with less than LIVE_RATIO live data,
+        remove these segments.
+
+        @return: int - freed bytes
+        """
+        self.startTimer()
+
+        writeSegment = self.getWriteSegment()
+        usage = self.get_segments_usage()
+
+        freed = 0
+        for segment in self.getSegments():
+            if segment >= writeSegment:
+                continue
+
+            size = os.path.getsize(self.getSegmentPath(segment))
+            live = usage.get(segment, 0)
+            if live >= size * live_ratio:
+                continue
+
+            cur = self.getCursor(True)
+            cur.execute("SELECT * FROM `%s` WHERE segment=?" % self._table_name, (segment,))
+            for item in cur.fetchall():
+                nsegment, noffset = self._append(self._readData(item))
+                self.getCursor().execute("UPDATE `%s` SET segment=?, offset=? WHERE hash_id=?" % self._table_name,
+                            (nsegment, noffset, item["hash_id"],))
+            cur.close()
+
+            # Index points to new place now
+            self.commit()
+            self.begin()
+
+            self._closeReadFd(segment)
+            os.unlink(self.getSegmentPath(segment))
+            freed += size - live
+
+            self.getLogger().debug("Block pack '%s': segment %d compacted, %d bytes freed" % (self.getName(), segment, size - live,))
+
+        self.stopTimer('compact')
+        return freed
+
+    def get_locations( self, hash_ids):
+        """
+        Place of blocks, segments go one after another
+
+        :param hash_ids: list of int
+        :return: dict { hash_id: (offset, length) }
+        """
+        self.startTimer()
+        segmentSize = self.getSegmentSize()
+        locations = {}
+        id_str = ",".join(str(hash_id) for hash_id in hash_ids)
+        if id_str:
+            cur = self.getCursor()
+            cur.execute("SELECT * FROM `%s` WHERE hash_id IN (%s)" % (self._table_name, id_str,))
+            for item in cur.fetchall():
+                locations[ item["hash_id"] ] = (item["segment"] * segmentSize + item["offset"], item["length"],)
+        self.stopTimer('get_locations')
+        return locations
+
+    def rewrite_ordered( self, hash_ids, batch=1000):
+        """
+        Rewrite segments: blocks of HASH_IDS first, in their order, then other blocks.
+        Blocks are appended into new segments, old segments are removed.
+
+        :param hash_ids: iterable of int
+        :return: int - count of blocks written in order
+        """
+        self.startTimer()
+
+        oldSegments = set(self.getSegments())
+        self._openWriteFile(max(oldSegments or (0,)) + 1)
+
+        def _move(items):
+            moved = 0
+            cur = self.getCursor()
+            for item in items:
+                if item["segment"] not in oldSegments:
+                    # Moved already
+                    continue
+                nsegment, noffset = self._append(self._readData(item))
+                cur.execute("UPDATE `%s` SET segment=?, offset=? WHERE hash_id=?" % self._table_name,
+                            (nsegment, noffset, item["hash_id"],))
+                moved += 1
+            # Index points to new place now
+            self.commit()
+            self.begin()
+            return moved
+
+        def _locate(ids):
+            cur = self.getCursor()
+            cur.execute("SELECT * FROM `%s` WHERE hash_id IN (%s)" % (
+                self._table_name, ",".join(str(hash_id) for hash_id in ids),))
+            items = dict((item["hash_id"], item,) for item in cur.fetchall())
+            return [ items[ hash_id ] for hash_id in ids if hash_id in items ]
+
+        count = 0
+        chunk = []
+        for hash_id in hash_ids:
+            chunk.append(hash_id)
+            if len(chunk) >= batch:
+                count += _move(_locate(chunk))
+                chunk = []
+        if chunk:
+            count += _move(_locate(chunk))
+
+        # Other blocks - in their old order
+        for segment in sorted(oldSegments):
+            cur = self.getCursor(True)
+            cur.execute("SELECT * FROM `%s` WHERE segment=? ORDER BY offset" % self._table_name, (segment,))
+            items = cur.fetchall()
+            cur.close()
+            _move(items)
+
+            self._closeReadFd(segment)
+            os.unlink(self.getSegmentPath(segment))
+
+        self.stopTimer('rewrite_ordered')
+        return count
+
+    def commit(self):
+        self._sync()
+        return super().commit()
+
+    def vacuum(self):
+        freed = self.compact()
+        diff = super().vacuum()
+        if not isinstance(diff, int):
+            # Index not vacuumed
+            diff = 0
+        return diff - freed
+
+    def close(self, nocompress=False):
+        self._closeWriteFile()
+        if self._read_fds:
+            for segment in list(self._read_fds.keys()):
+                self._closeReadFd(segment)
+        return super().close(nocompress)
+
+    def drop(self):
+        """
+        Remove index file and segments
+        """
+        super().drop()
+        shutil.rmtree(self.getSegmentsPath(), True)
+        return self
+
+    def getFileSize(self):
+        size = super().getFileSize()
+        for segment in self.getSegments():
+            size += os.path.getsize(self.getSegmentPath(segment))
+        return size
+
+    pass
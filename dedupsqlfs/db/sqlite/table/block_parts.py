@@ -2,10 +2,15 @@
 
 __author__ = 'sergey'
 
+import os
+from threading import Thread
+from queue import Queue
 from sqlite3 import Binary
 from dedupsqlfs.db.sqlite.table import Table
 from dedupsqlfs.db.sqlite.table.block import TableBlock
 from dedupsqlfs.db.sqlite.table.block_fs import TableBlockFs
+from dedupsqlfs.db.sqlite.table.block_pack import TableBlockPack
+from dedupsqlfs.lib import constants
 
 class TableBlockPartitions( Table ):
 
@@ -15,25 +20,231 @@ class TableBlockPartitions( Table ):
 
     _table_name = 'block_parts'
 
+    _threads = None
+    """
+    @ivar _threads: Writer thread for every partition, or None - all done in caller thread
+    @type _threads: list[ Thread,.. ] | None
+    """
+
+    _storage = None
+    """
+    @ivar _storage: Block storage type, once read from options
+    @type _storage: str | None
+    """
+
+    _paths = None
+    """
+    @ivar _paths: Directories of partitions, once read from options
+    @type _paths: dict | None
+    """
+
+    _task_queues = None
+    _results = None
+    _errors = None
+
+
+    def getPartitionPaths(self):
+        """
+        Partition files directories: "N:DIRECTORY" items of command line option.
+        They are stored in option table, so later runs without option use same files.
+        Directory of stored partition can't be changed, new partitions are added.
+
+        @return: dict { partition number: directory }
+        """
+        if self._paths is not None:
+            return self._paths
+
+        paths = self._parsePartitionPaths(self._manager.getAppOption("block_partition_path") or ())
+
+        tableOption = self._manager.getTable("option")
+        if not tableOption.hasTable():
+            return paths
+
+        value = tableOption.get("block_partition_path")
+        stored = {}
+        if value:
+            stored = self._parsePartitionPaths(value.split("\n"))
+
+        for n, path in paths.items():
+            if n in stored and stored[ n ] != path:
+                raise ValueError("Block partition %i is stored in %r, can't use %r!" % (n, stored[ n ], path,))
+
+        if set(paths) - set(stored):
+            stored.update(paths)
+            value_new = "\n".join("%i:%s" % (n, stored[ n ],) for n in sorted(stored))
+            if value is None:
+                tableOption.insert("block_partition_path", value_new)
+            else:
+                tableOption.update("block_partition_path", value_new)
+            tableOption.commit()
+
+        self._paths = stored
+        return self._paths
+
+    def _parsePartitionPaths(self, items):
+        paths = {}
+        for item in items:
+            n, path = item.split(":", 1)
+            paths[ int(n) ] = os.path.abspath(os.path.expanduser(path))
+        return paths
+
+
+    def getStorage(self):
+        """
+        Where block data stored: sqlite files, fs files or packfile segments.
+        Storage chosen on creation of filesystem is stored in option table,
+        command line option is used only for new filesystem.
+
+        @rtype: str
+        """
+        if self._manager.getAppOption("block_data_storage_on_fs"):
+            return constants.BLOCK_STORAGE_FS
+        if self._storage is None:
+            tableOption = self._manager.getTable("option")
+            if tableOption.hasTable():
+                self._storage = tableOption.get("block_storage")
+            if not self._storage:
+                self._storage = self._manager.getAppOption("block_storage") or constants.BLOCK_STORAGE_SQLITE
+        return self._storage
 
 
     def getPart(self, n):
         if self.parts is None:
             self.parts = {}
-        
+
         if n not in self.parts:
-            if self._manager.getAppOption("block_data_storage_on_fs"):
+            storage = self.getStorage()
+            name = "block_%03d" % n
+            if storage == constants.BLOCK_STORAGE_FS:
                 self.parts[n] = TableBlockFs(self._manager)
+            elif storage == constants.BLOCK_STORAGE_PACKFILE:
+                self.parts[n] = TableBlockPack(self._manager)
+                name = "block_pack_%03d" % n
             else:
                 self.parts[n] = TableBlock(self._manager)
             self.parts[n].setClustered( self._clustered )
-            self.parts[n].setName( "block_%03d" % n )
-            self.parts[n].setFileName( "block_%03d" % n )
+            self.parts[n].setName( name )
+            self.parts[n].setFileName( name )
+            path = self.getPartitionPaths().get(n)
+            if path:
+                self.parts[n].setBasePath( path )
 
         return self.parts[n]
 
 
+    def startWriters(self):
+        """
+        Start writer thread for every partition.
+        Every partition file has own connection, so inserts and commits
+        of different partitions go in parallel - sqlite releases GIL on I/O.
+        Connection of partition is used only by its thread,
+        caller waits for queued writes before reading or commit.
+        """
+        if self._threads is not None or self.n_parts < 2:
+            return self
+        # Shared connection and hash lookups of fs storage can't be used by many threads
+        if self._manager.getAttach() or self.getStorage() == constants.BLOCK_STORAGE_FS:
+            return self
+
+        self._threads = []
+        self._task_queues = []
+        self._results = {}
+        self._errors = {}
+
+        for n in range(self.n_parts):
+            tq = Queue()
+            self._task_queues.append(tq)
+            p = Thread(target=self._worker, name="BlockPartition-%03d" % n, args=(n, tq,))
+            p.daemon = True
+            p.start()
+            self._threads.append(p)
+        return self
+
+    def stopWriters(self):
+        if self._threads is None:
+            return self
+
+        self._waitWriters(False)
+        for n in range(len(self._threads)):
+            self._task_queues[ n ].put_nowait("stop")
+        for t in self._threads:
+            t.join()
+
+        self._threads = None
+        self._task_queues = None
+        return self
+
+    def _worker(self, n, tq):
+        while True:
+            task = tq.get()
+            if task == "stop":
+                tq.task_done()
+                break
+            func, args = task
+            try:
+                self._results[ n ] = func(*args)
+            except Exception as e:
+                self.getLogger().error("Block partition %d writer: %s" % (n, e,))
+                self._errors[ n ] = e
+            tq.task_done()
+        return
+
+    def _waitWriter(self, n, reraise=True):
+        """
+        Wait for queued tasks of partition, raise error of them if any
+        """
+        if self._threads is None:
+            return self
+        self._task_queues[ n ].join()
+        if n in self._errors:
+            e = self._errors.pop(n)
+            if reraise:
+                raise e
+        return self
+
+    def _waitWriters(self, reraise=True):
+        if self._threads is None:
+            return self
+        for n in range(len(self._threads)):
+            self._waitWriter(n, reraise)
+        return self
+
+    def _forEachPart(self, method, *args):
+        """
+        Call method of every partition - in parallel if writers started
+
+        @return: list of results
+        """
+        if self._threads is None:
+            return [ getattr(self.getPart(i), method)(*args) for i in range(0, self.n_parts) ]
+
+        for i in range(0, self.n_parts):
+            self._task_queues[ i ].put_nowait((getattr(self.getPart(i), method), args,))
+        self._waitWriters()
+        return [ self._results[ i ] for i in range(0, self.n_parts) ]
+
+
+    def queueToPart(self, n, method, *args):
+        """
+        Call method of partition N - in its writer thread if started
+
+        @return: method result, None if queued
+        """
+        t = self.getPart(n)
+        if self._threads is None:
+            return getattr(t, method)(*args)
+        self._task_queues[ n ].put_nowait((getattr(t, method), args,))
+        return None
+
+    def waitPart(self, n):
+        """
+        Wait for queued tasks of partition N, before use of it directly
+        """
+        return self._waitWriter(n)
+
+
     def getDbPageSize( self ):
+        self._waitWriters()
         for i in range(0, self.n_parts):
             t = self.getPart(i)
             return t.getDbPageSize()
@@ -55,9 +266,7 @@ class TableBlockPartitions( Table ):
 
 
     def shrinkMemory( self ):
-        for i in range(0, self.n_parts):
-            t = self.getPart(i)
-            t.shrinkMemory()
+        self._forEachPart("shrinkMemory")
         return
 
 
@@ -66,6 +275,7 @@ class TableBlockPartitions( Table ):
 
 
     def hasTable( self ):
+        self._waitWriters()
         has = True
         for i in range(0, self.n_parts):
             t = self.getPart(i)
@@ -75,69 +285,123 @@ class TableBlockPartitions( Table ):
 
 
     def create( self ):
-        for i in range(0, self.n_parts):
-            t = self.getPart(i)
-            t.create()
+        self._forEachPart("create")
         return
 
     def begin( self ):
-        for i in range(0, self.n_parts):
-            t = self.getPart(i)
-            t.begin()
+        self._forEachPart("begin")
         return self
 
     def rollback( self ):
-        for i in range(0, self.n_parts):
-            t = self.getPart(i)
-            t.rollback()
+        self._forEachPart("rollback")
         return self
 
     def commit( self ):
+        self._forEachPart("commit")
+        return self
+
+    def isDirty( self ):
+        self._waitWriters()
         for i in range(0, self.n_parts):
             t = self.getPart(i)
-            t.commit()
-        return self
+            if t.isDirty():
+                return True
+        return False
+
+    def checkpoint( self, mode="PASSIVE" ):
+        return sum(self._forEachPart("checkpoint", mode))
 
     def vacuum( self ):
-        retsz = 0
+        return sum(self._forEachPart("vacuum"))
+
+    def getPageCount( self ):
+        return sum(self._forEachPart("getPageCount"))
+
+    def getFreelistCount( self ):
+        return sum(self._forEachPart("getFreelistCount"))
+
+    def getAutoVacuum( self ):
         for i in range(0, self.n_parts):
             t = self.getPart(i)
-            retsz += t.vacuum()
-        return retsz
+            return t.getAutoVacuum()
+        return 0
+
+    def incrementalVacuum( self, pages ):
+        """
+        Parts with more free pages go first
 
-    def close( self ):
+        @return: int - count of removed pages
+        """
+        self._waitWriters()
+        freed = 0
+        parts = [ self.getPart(i) for i in range(0, self.n_parts) ]
+        for t in sorted(parts, key=lambda t: t.getFreelistCount(), reverse=True):
+            if freed >= pages:
+                break
+            freed += t.incrementalVacuum(pages - freed)
+        return freed
+
+    def compact( self ):
+        """
+        Remove garbage from packfile segments
+
+        @return: int - freed bytes
+        """
+        if self.getStorage() != constants.BLOCK_STORAGE_PACKFILE:
+            return 0
+        return sum(self._forEachPart("compact"))
+
+    def getFileSize( self ):
+        self._waitWriters()
+        size = 0
+        for i in range(0, self.n_parts):
+            size += self.getPart(i).getFileSize()
+        return size
+
+    def close( self, nocompress=False ):
+        self.stopWriters()
         for i in range(0, self.n_parts):
             t = self.getPart(i)
-            t.close()
+            t.close(nocompress)
         return
 
 
-    def insert( self, hash_id, data):
+    def insert( self, hash_id, data, digest=None):
         """
         :param hash_id: int
         :param data: bytes
+        :param digest: bytes - hash value, used by file storage only
         :return: int
         """
         self.startTimer()
 
         p = hash_id % self.n_parts
         t = self.getPart(p)
-        item = t.insert(hash_id, data)
+        if self._threads is not None:
+            self._task_queues[ p ].put_nowait((t.insert, (hash_id, data, digest,),))
+            item = hash_id
+        else:
+            item = t.insert(hash_id, data, digest)
 
         self.stopTimer('insert')
         return item
 
-    def update( self, hash_id, data):
+    def update( self, hash_id, data, digest=None):
         """
         :param hash_id: int
         :param data: bytes
-        :return: int
+        :param digest: bytes - hash value, used by file storage only
+        :return: int - with writers started: 1, real count is unknown yet
         """
         self.startTimer()
 
         p = hash_id % self.n_parts
         t = self.getPart(p)
-        count = t.update(hash_id, data)
+        if self._threads is not None:
+            self._task_queues[ p ].put_nowait((t.update, (hash_id, data, digest,),))
+            count = 1
+        else:
+            count = t.update(hash_id, data, digest)
 
         self.stopTimer('update')
         return count
@@ -150,20 +414,49 @@ class TableBlockPartitions( Table ):
         self.startTimer()
 
         p = hash_id % self.n_parts
+        self._waitWriter(p)
         t = self.getPart(p)
         item = t.get(hash_id)
 
         self.stopTimer('get')
         return item
 
+    def get_many( self, hash_ids):
+        """
+        One query for blocks of every partition
+
+        :param hash_ids: list of int
+        :return: dict { hash_id: Row }
+        """
+        self.startTimer()
+
+        parts = {}
+        for hash_id in hash_ids:
+            parts.setdefault(hash_id % self.n_parts, []).append(hash_id)
+
+        items = {}
+        for p, ids in parts.items():
+            self._waitWriter(p)
+            items.update(self.getPart(p).get_many(ids))
+
+        self.stopTimer('get_many')
+        return items
+
+    def open_blob( self, hash_id):
+        """
+        :param hash_id: int
+        :return: sqlite3.Blob | None
+        """
+        p = hash_id % self.n_parts
+        self._waitWriter(p)
+        t = self.getPart(p)
+        return t.open_blob(hash_id)
+
     def remove_by_ids(self, id_str):
         self.startTimer()
         count = 0
         if id_str:
-
-            for i in range(0, self.n_parts):
-                t = self.getPart(i)
-                count += t.remove_by_ids(id_str)
+            count = sum(self._forEachPart("remove_by_ids", id_str))
 
         self.stopTimer('remove_by_ids')
         return count
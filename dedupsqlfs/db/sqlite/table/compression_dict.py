@@ -0,0 +1,88 @@
+# -*- coding: utf8 -*-
+
+__author__ = 'sergey'
+
+from dedupsqlfs.db.sqlite.table import Table
+
+class TableCompressionDict( Table ):
+    """
+    Trained compression dictionaries.
+    Dictionary id is stored in compressed data frames,
+    so old dictionaries must be kept while blocks use them.
+    """
+
+    _table_name = "compression_dict"
+
+    def create( self ):
+        c = self.getCursor()
+
+        # Create table
+        c.execute(
+            "CREATE TABLE IF NOT EXISTS `%s` (" % self.getName()+
+                "`id` INTEGER PRIMARY KEY, "+
+                "`method` CHAR(32) NOT NULL, "+
+                "`created_at` INTEGER NOT NULL, "+
+                "`data` BLOB NOT NULL"+
+            ")"
+        )
+        self.createIndexIfNotExists("method", ("method", "created_at",))
+        return
+
+    def insert( self, dict_id, method, data, created_at ):
+        """
+        :param dict_id: int - dictionary id
+        :param data: bytes
+        :return: int
+        """
+        self.startTimer()
+        cur = self.getCursor()
+        cur.execute(
+            "INSERT INTO `%s` " % self.getName()+
+            "(`id`, `method`, `created_at`, `data`) VALUES (?, ?, ?, ?)",
+            (dict_id, method, created_at, data,)
+        )
+        item = cur.lastrowid
+        self.stopTimer('insert')
+        return item
+
+    def get( self, dict_id ):
+        """
+        :param dict_id: int
+        :return: bytes|None
+        """
+        self.startTimer()
+        cur = self.getCursor()
+        cur.execute("SELECT `data` FROM `%s` WHERE `id`=?" % self.getName(), (dict_id,))
+        item = cur.fetchone()
+        if item:
+            item = item["data"]
+        self.stopTimer('get')
+        return item
+
+    def get_last( self, method ):
+        """
+        Get last trained dictionary for method
+
+        :param method: str
+        :return: Row|None
+        """
+        self.startTimer()
+        cur = self.getCursor()
+        cur.execute(
+            "SELECT * FROM `%s` WHERE `method`=? " % self.getName()+
+            " ORDER BY `created_at` DESC LIMIT 1",
+            (method,)
+        )
+        item = cur.fetchone()
+        self.stopTimer('get_last')
+        return item
+
+    def get_ids( self ):
+        self.startTimer()
+        cur = self.getCursor()
+        cur.execute("SELECT `id` FROM `%s`" % self.getName())
+        items = (item["id"] for item in cur.fetchall())
+        self.stopTimer('get_ids')
+        return items
+
+    pass
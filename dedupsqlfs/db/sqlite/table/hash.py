@@ -4,14 +4,36 @@ __author__ = 'sergey'
 
 from sqlite3 import Binary
 from dedupsqlfs.db.sqlite.table import Table
+from dedupsqlfs.lib import constants
 
 class TableHash( Table ):
 
     _table_name = "hash"
 
+    _table_role = constants.TABLE_ROLE_INDEX
+
+    _prefixed = None
+    """
+    @ivar _prefixed: Table has integer prefix column, indexed instead of value
+    @type _prefixed: bool|None
+    """
+
     def create( self ):
         c = self.getCursor()
 
+        if self.getManager().getAppOption("hash_prefix_index"):
+            # Create table
+            c.execute(
+                "CREATE TABLE IF NOT EXISTS `%s` (" % self.getName()+
+                    "id INTEGER PRIMARY KEY AUTOINCREMENT, "+
+                    "prefix INTEGER NOT NULL DEFAULT 0, "+
+                    "value VARBINARY(64) NOT NULL"+
+                ")"
+            )
+            self.createIndexIfNotExists('prefix', ('prefix',))
+            self._prefixed = True
+            return
+
         # Create table
         c.execute(
             "CREATE TABLE IF NOT EXISTS `%s` (" % self.getName()+
@@ -20,14 +42,56 @@ class TableHash( Table ):
             ")"
         )
         self.createIndexIfNotExists('value', ('value',), True)
+        self._prefixed = False
         return
 
+    def getPrefix( self, value ):
+        """
+        First 8 bytes of hash value as signed 64-bit integer
+
+        @rtype: int
+        """
+        return int.from_bytes(value[:8], "big", signed=True)
+
+    def isPrefixed( self ):
+        if self._prefixed is None:
+            self._prefixed = self.hasField("prefix")
+        return self._prefixed
+
+    def addPrefixIndex( self ):
+        """
+        Convert table: add prefix column, index it instead of whole value
+
+        @return: bool - table converted
+        """
+        if self.isPrefixed():
+            return False
+
+        self.startTimer()
+        conn = self.getConnection()
+        conn.create_function("hash_prefix", 1, self.getPrefix, deterministic=True)
+
+        cur = self.getCursor()
+        cur.execute("ALTER TABLE `%s` ADD COLUMN prefix INTEGER NOT NULL DEFAULT 0" % self.getName())
+        cur.execute("UPDATE `%s` SET prefix=hash_prefix(value)" % self.getName())
+        self.createIndexIfNotExists('prefix', ('prefix',))
+        self.dropIndex('value')
+        self.commit()
+
+        self._prefixed = True
+        self.stopTimer('addPrefixIndex')
+        return True
+
     def insert( self, value):
         self.startTimer()
         cur = self.getCursor()
         bvalue = Binary(value)
-        cur.execute("INSERT INTO `%s`(value) VALUES (?)" % self.getName(),
-                    (bvalue,))
+        if self.isPrefixed():
+            cur.execute("INSERT INTO `%s`(prefix,value) VALUES (?,?)" % self.getName(),
+                        (self.getPrefix(value),bvalue,))
+        else:
+            cur.execute("INSERT INTO `%s`(value) VALUES (?)" % self.getName(),
+                        (bvalue,))
         item = cur.lastrowid
         self.stopTimer('insert')
         return item
@@ -36,8 +100,12 @@ class TableHash( Table ):
         self.startTimer()
         cur = self.getCursor()
         bvalue = Binary(value)
-        cur.execute("INSERT INTO `%s`(id,value) VALUES (?,?)" % self.getName(),
-                    (rowId,bvalue,))
+        if self.isPrefixed():
+            cur.execute("INSERT INTO `%s`(id,prefix,value) VALUES (?,?,?)" % self.getName(),
+                        (rowId,self.getPrefix(value),bvalue,))
+        else:
+            cur.execute("INSERT INTO `%s`(id,value) VALUES (?,?)" % self.getName(),
+                        (rowId,bvalue,))
         item = cur.lastrowid
         self.stopTimer('insertRaw')
         return item
@@ -50,12 +118,36 @@ class TableHash( Table ):
         self.startTimer()
         cur = self.getCursor()
         bvalue = Binary(value)
-        cur.execute("UPDATE `%s` SET value=? WHERE id=?" % self.getName(),
-                    (bvalue, item_id))
+        if self.isPrefixed():
+            cur.execute("UPDATE `%s` SET prefix=?, value=? WHERE id=?" % self.getName(),
+                        (self.getPrefix(value), bvalue, item_id))
+        else:
+            cur.execute("UPDATE `%s` SET value=? WHERE id=?" % self.getName(),
+                        (bvalue, item_id))
         count = cur.rowcount
         self.stopTimer('update')
         return count
 
+    def update_many( self, items ):
+        """
+        @param items: list of tuples (id, value)
+        @return: count updated rows
+        @rtype: int
+        """
+        self.startTimer()
+        count = 0
+        if items:
+            cur = self.getCursor()
+            if self.isPrefixed():
+                cur.executemany("UPDATE `%s` SET prefix=?, value=? WHERE id=?" % self.getName(),
+                                ((self.getPrefix(value), Binary(value), item_id,) for item_id, value in items))
+            else:
+                cur.executemany("UPDATE `%s` SET value=? WHERE id=?" % self.getName(),
+                                ((Binary(value), item_id,) for item_id, value in items))
+            count = len(items)
+        self.stopTimer('update_many')
+        return count
+
     def get( self, item_id ):
         self.startTimer()
         cur = self.getCursor()
@@ -70,13 +162,46 @@ class TableHash( Table ):
         self.startTimer()
         cur = self.getCursor()
         bvalue = Binary(value)
-        cur.execute("SELECT id FROM `%s` WHERE value=?" % self.getName(), (bvalue,))
+        if self.isPrefixed():
+            # Whole value compared only for rows with same prefix
+            cur.execute("SELECT id FROM `%s` WHERE prefix=? AND value=?" % self.getName(),
+                        (self.getPrefix(value), bvalue,))
+        else:
+            cur.execute("SELECT id FROM `%s` WHERE value=?" % self.getName(), (bvalue,))
         item = cur.fetchone()
         if item:
             item = item["id"]
         self.stopTimer('find')
         return item
 
+    def find_many( self, values, chunk=500 ):
+        """
+        @param values: list of bytes
+        @return: dict { value: id }
+        """
+        self.startTimer()
+        items = {}
+        values = list(set(values))
+        cur = self.getCursor()
+        for n in range(0, len(values), chunk):
+            part = values[n:n+chunk]
+            if self.isPrefixed():
+                # Whole value compared only for rows with same prefix
+                prefixes = tuple(set(self.getPrefix(value) for value in part))
+                cur.execute("SELECT id, value FROM `%s` " % self.getName()+
+                            " WHERE prefix IN (%s)" % ",".join("?" * len(prefixes)),
+                            prefixes)
+            else:
+                cur.execute("SELECT id, value FROM `%s` " % self.getName()+
+                            " WHERE value IN (%s)" % ",".join("?" * len(part)),
+                            tuple(Binary(value) for value in part))
+            for item in iter(cur.fetchone, None):
+                items[ bytes(item["value"]) ] = item["id"]
+        wanted = set(values)
+        items = dict((value, item_id,) for value, item_id in items.items() if value in wanted)
+        self.stopTimer('find_many')
+        return items
+
     def get_count(self):
         self.startTimer()
         cur = self.getCursor()
@@ -89,6 +214,21 @@ class TableHash( Table ):
         self.stopTimer('get_count')
         return item
 
+    def get_max_id(self):
+        """
+        :return: int - 0 if no hashes
+        """
+        self.startTimer()
+        cur = self.getCursor()
+        cur.execute("SELECT MAX(`id`) as `max_id` FROM `%s`" % self.getName())
+        item = cur.fetchone()
+        if item and item["max_id"]:
+            item = item["max_id"]
+        else:
+            item = 0
+        self.stopTimer('get_max_id')
+        return item
+
     def get_hash_ids(self, start_id, end_id):
         self.startTimer()
         cur = self.getCursor()
@@ -98,6 +238,22 @@ class TableHash( Table ):
         self.stopTimer('get_hash_ids')
         return nameIds
 
+    def get_batch(self, start_id, limit):
+        """
+        Keyset pagination by id
+
+        :param start_id: int - last id of previous batch, 0 - from start
+        :param limit: int
+        :return: list of Row
+        """
+        self.startTimer()
+        cur = self.getCursor()
+        cur.execute("SELECT `id`, `value` FROM `%s` " % self.getName()+
+                    " WHERE `id`>? ORDER BY `id` LIMIT ?", (start_id, limit,))
+        items = list(cur.fetchall())
+        self.stopTimer('get_batch')
+        return items
+
     def remove_by_ids(self, id_str):
         self.startTimer()
         count = 0
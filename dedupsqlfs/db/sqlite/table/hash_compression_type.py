@@ -3,12 +3,15 @@
 __author__ = 'sergey'
 
 from dedupsqlfs.db.sqlite.table import Table
+from dedupsqlfs.lib import constants
 
 
 class TableHashCompressionType(Table):
 
     _table_name = "hash_compression_type"
 
+    _table_role = constants.TABLE_ROLE_INDEX
+
     def create(self):
         c = self.getCursor()
 
@@ -47,6 +50,21 @@ class TableHashCompressionType(Table):
         self.stopTimer('update')
         return count
 
+    def update_many(self, items):
+        """
+        :param items: list of tuples (hash_id, type_id)
+        :return: int
+        """
+        self.startTimer()
+        count = 0
+        if items:
+            cur = self.getCursor()
+            cur.executemany("UPDATE `%s` SET type_id=? WHERE hash_id=?" % self._table_name,
+                            ((type_id, hash_id,) for hash_id, type_id in items))
+            count = len(items)
+        self.stopTimer('update_many')
+        return count
+
     def get(self, hash_id):
         """
         :param hash_id: int
@@ -0,0 +1,87 @@
+# -*- coding: utf8 -*-
+
+__author__ = 'sergey'
+
+from dedupsqlfs.db.sqlite.table import Table
+from dedupsqlfs.lib import constants
+
+
+class TableHashDelta(Table):
+    """
+    Blocks stored as delta against other (base) block.
+    Depth - length of delta chain to non-delta block.
+    """
+
+    _table_name = "hash_delta"
+
+    _table_role = constants.TABLE_ROLE_INDEX
+
+    def create(self):
+        c = self.getCursor()
+
+        # Create table
+        c.execute(
+            "CREATE TABLE IF NOT EXISTS `%s` (" % self.getName() +
+            "hash_id INTEGER PRIMARY KEY, " +
+            "base_hash_id INTEGER NOT NULL, " +
+            "depth INTEGER NOT NULL " +
+            ");"
+        )
+        self.createIndexIfNotExists("base", ("base_hash_id",))
+        return
+
+    def insert(self, hash_id, base_hash_id, depth):
+        """
+        :return: int
+        """
+        self.startTimer()
+        cur = self.getCursor()
+
+        cur.execute("INSERT INTO `%s`(hash_id, base_hash_id, depth) VALUES (?,?,?)" % self.getName(),
+                    (hash_id, base_hash_id, depth,))
+        item = cur.lastrowid
+        self.stopTimer('insert')
+        return item
+
+    def get(self, hash_id):
+        """
+        :param hash_id: int
+        :return: Row
+        """
+        self.startTimer()
+        cur = self.getCursor()
+        cur.execute("SELECT * FROM `%s` WHERE hash_id=?" % self.getName(), (hash_id,))
+        item = cur.fetchone()
+        self.stopTimer('get')
+        return item
+
+    def remove_by_ids(self, id_str):
+        self.startTimer()
+        count = 0
+        if id_str:
+            cur = self.getCursor()
+            cur.execute("DELETE FROM `%s` " % self.getName() +
+                        " WHERE `hash_id` IN (%s)" % (id_str,))
+            count = cur.rowcount
+        self.stopTimer('remove_by_ids')
+        return count
+
+    def get_used_base_ids(self, id_str):
+        """
+        Which of hash ids are bases for other delta blocks
+
+        :param id_str: str - comma separated hash ids
+        :return: set
+        """
+        self.startTimer()
+        items = set()
+        if id_str:
+            cur = self.getCursor()
+            cur.execute("SELECT DISTINCT `base_hash_id` FROM `%s` " % self.getName() +
+                        " WHERE `base_hash_id` IN (%s)" % (id_str,))
+            for _i in iter(cur.fetchone, None):
+                items.add(_i["base_hash_id"])
+        self.stopTimer('get_used_base_ids')
+        return items
+
+    pass
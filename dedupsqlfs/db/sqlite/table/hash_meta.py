@@ -0,0 +1,151 @@
+# -*- coding: utf8 -*-
+"""
+Merged metadata of hash: compression type, sizes, references count.
+Same data as in hash_compression_type, hash_sizes and hash_count tables,
+so block read needs only one lookup here.
+"""
+
+__author__ = 'sergey'
+
+from dedupsqlfs.db.sqlite.table import Table
+from dedupsqlfs.lib import constants
+
+class TableHashMeta( Table ):
+
+    _table_name = "hash_meta"
+
+    _table_role = constants.TABLE_ROLE_INDEX
+
+    def create( self ):
+        c = self.getCursor()
+
+        # Create table
+        c.execute(
+            "CREATE TABLE IF NOT EXISTS `%s` (" % self.getName()+
+                "`hash_id` INTEGER PRIMARY KEY, "+
+                "`type_id` INTEGER NOT NULL DEFAULT 0, "+
+                "`writed_size` INTEGER NOT NULL DEFAULT 0, "+
+                "`compressed_size` INTEGER NOT NULL DEFAULT 0, "+
+                "`refcount` INTEGER NOT NULL DEFAULT 0"+
+            ");"
+        )
+        return
+
+    def _upsert( self, hash_id, fields, values ):
+        cur = self.getCursor()
+        cur.execute("UPDATE `%s` SET " % self.getName()+
+                    ", ".join("`%s`=?" % f for f in fields)+
+                    " WHERE `hash_id`=?", tuple(values) + (hash_id,))
+        if not cur.rowcount:
+            cur.execute("INSERT INTO `%s`(`hash_id`, " % self.getName()+
+                        ", ".join("`%s`" % f for f in fields)+
+                        ") VALUES (?%s)" % (",?" * len(fields)), (hash_id,) + tuple(values))
+        return 1
+
+    def set_type( self, hash_id, type_id):
+        """
+        :return: int
+        """
+        self.startTimer()
+        count = self._upsert(hash_id, ("type_id",), (type_id,))
+        self.stopTimer('set_type')
+        return count
+
+    def set_sizes( self, hash_id, writed_size, compressed_size):
+        """
+        :return: int
+        """
+        self.startTimer()
+        count = self._upsert(hash_id, ("writed_size", "compressed_size",), (writed_size, compressed_size,))
+        self.stopTimer('set_sizes')
+        return count
+
+    def inc( self, hash_id):
+        """
+        Increase references counter
+
+        :param hash_id: int
+        :return: int
+        """
+        self.startTimer()
+        cur = self.getCursor()
+        cur.execute("UPDATE `%s` SET `refcount`=`refcount`+1 WHERE `hash_id`=?" % self.getName(), (hash_id,))
+        if not cur.rowcount:
+            cur.execute("INSERT INTO `%s`(`hash_id`, `refcount`) VALUES (?,1)" % self.getName(), (hash_id,))
+        self.stopTimer('inc')
+        return 1
+
+    def dec( self, hash_id):
+        """
+        Decrease references counter
+
+        :param hash_id: int
+        :return: int
+        """
+        self.startTimer()
+        cur = self.getCursor()
+        cur.execute("UPDATE `%s` SET `refcount`=`refcount`-1 WHERE `hash_id`=?" % self.getName(), (hash_id,))
+        count = cur.rowcount
+        self.stopTimer('dec')
+        return count
+
+    def get( self, hash_id):
+        """
+        :param hash_id: int
+        :return: Row
+        """
+        self.startTimer()
+        cur = self.getCursor()
+        cur.execute("SELECT * FROM `%s` WHERE `hash_id`=?" % self.getName(), (hash_id,))
+        item = cur.fetchone()
+        self.stopTimer('get')
+        return item
+
+    def remove_by_ids(self, id_str):
+        self.startTimer()
+        count = 0
+        if id_str:
+            cur = self.getCursor()
+            cur.execute("DELETE FROM `%s` " % self.getName()+
+                        " WHERE `hash_id` IN (%s)" % (id_str,))
+            count = cur.rowcount
+        self.stopTimer('remove_by_ids')
+        return count
+
+    def fill( self, batch=10000 ):
+        """
+        Copy data of hash_compression_type, hash_sizes and hash_count tables
+
+        :return: int - count of hashes
+        """
+        self.startTimer()
+        cur = self.getCursor()
+        cur.execute("DELETE FROM `%s`" % self.getName())
+
+        copy = (
+            ("hash_compression_type", "SELECT `hash_id`, `type_id` FROM `%s`",
+             "INSERT INTO `%s`(`hash_id`, `type_id`) VALUES (?,?)",),
+            ("hash_sizes", "SELECT `writed_size`, `compressed_size`, `hash_id` FROM `%s`",
+             "UPDATE `%s` SET `writed_size`=?, `compressed_size`=? WHERE `hash_id`=?",),
+            ("hash_count", "SELECT `cnt`, `hash_id` FROM `%s`",
+             "UPDATE `%s` SET `refcount`=? WHERE `hash_id`=?",),
+        )
+        for tname, select, query in copy:
+            table = self.getManager().getTable(tname)
+            src = table.getCursor(True)
+            src.execute(select % table.getName())
+            while True:
+                rows = src.fetchmany(batch)
+                if not rows:
+                    break
+                cur.executemany(query % self.getName(), (tuple(row.values()) for row in rows))
+            src.close()
+
+        self.commit()
+
+        cur.execute("SELECT COUNT(1) as `cnt` FROM `%s`" % self.getName())
+        count = cur.fetchone()["cnt"]
+        self.stopTimer('fill')
+        return count
+
+    pass
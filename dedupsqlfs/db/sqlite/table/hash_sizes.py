@@ -3,11 +3,14 @@
 __author__ = 'sergey'
 
 from dedupsqlfs.db.sqlite.table import Table
+from dedupsqlfs.lib import constants
 
 class TableHashSizes( Table ):
 
     _table_name = "hash_sizes"
 
+    _table_role = constants.TABLE_ROLE_INDEX
+
     def create( self ):
         c = self.getCursor()
 
@@ -47,6 +50,21 @@ class TableHashSizes( Table ):
         self.stopTimer('update')
         return count
 
+    def update_many( self, items):
+        """
+        :param items: list of tuples (hash_id, writed_size, compressed_size)
+        :return: int
+        """
+        self.startTimer()
+        count = 0
+        if items:
+            cur = self.getCursor()
+            cur.executemany("UPDATE `%s` SET writed_size=?, compressed_size=? WHERE hash_id=?" % self.getName(),
+                            ((writed_size, compressed_size, hash_id,) for hash_id, writed_size, compressed_size in items))
+            count = len(items)
+        self.stopTimer('update_many')
+        return count
+
     def get( self, hash_id):
         """
         :param hash_id: int
@@ -83,6 +101,25 @@ class TableHashSizes( Table ):
         self.stopTimer('get_sizes_by_hash_ids')
         return items
 
+    def get_sample_hash_ids(self, limit, max_size=None):
+        """
+        Random sample of hash ids, for compression dictionary training
+
+        :param limit: int - how many ids to select
+        :param max_size: int - select only blocks with written size not bigger
+        :return: list
+        """
+        self.startTimer()
+        cur = self.getCursor()
+        if max_size:
+            cur.execute("SELECT `hash_id` FROM `%s` WHERE `writed_size`<=? ORDER BY RANDOM() LIMIT ?" % self.getName(),
+                        (max_size, limit,))
+        else:
+            cur.execute("SELECT `hash_id` FROM `%s` ORDER BY RANDOM() LIMIT ?" % self.getName(), (limit,))
+        items = [ item["hash_id"] for item in cur.fetchall() ]
+        self.stopTimer('get_sample_hash_ids')
+        return items
+
 
     def get_median_compressed_size(self):
         self.startTimer()
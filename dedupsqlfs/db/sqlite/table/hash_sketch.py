@@ -0,0 +1,77 @@
+# -*- coding: utf8 -*-
+
+__author__ = 'sergey'
+
+from dedupsqlfs.db.sqlite.table import Table
+from dedupsqlfs.lib import constants
+
+
+class TableHashSketch(Table):
+    """
+    Resemblance sketch index: block super-features
+    """
+
+    _table_name = "hash_sketch"
+
+    _table_role = constants.TABLE_ROLE_INDEX
+
+    def create(self):
+        c = self.getCursor()
+
+        # Create table
+        c.execute(
+            "CREATE TABLE IF NOT EXISTS `%s` (" % self.getName() +
+            "feature INTEGER NOT NULL, " +
+            "hash_id INTEGER NOT NULL " +
+            ");"
+        )
+        self.createIndexIfNotExists("feature", ("feature",))
+        self.createIndexIfNotExists("hash", ("hash_id",))
+        return
+
+    def insert(self, hash_id, features):
+        """
+        :param features: list of int
+        :return: int
+        """
+        self.startTimer()
+        cur = self.getCursor()
+
+        cur.executemany("INSERT INTO `%s`(feature, hash_id) VALUES (?,?)" % self.getName(),
+                        ((f, hash_id,) for f in features))
+        count = cur.rowcount
+        self.stopTimer('insert')
+        return count
+
+    def find(self, features):
+        """
+        Find block with most of equal super-features
+
+        :param features: list of int
+        :return: int|None - hash id
+        """
+        self.startTimer()
+        item = None
+        if features:
+            cur = self.getCursor()
+            cur.execute("SELECT `hash_id`, COUNT(1) AS `cnt` FROM `%s` " % self.getName() +
+                        " WHERE `feature` IN (%s) " % ",".join(str(int(f)) for f in features) +
+                        " GROUP BY `hash_id` ORDER BY `cnt` DESC, `hash_id` DESC LIMIT 1")
+            item = cur.fetchone()
+            if item:
+                item = item["hash_id"]
+        self.stopTimer('find')
+        return item
+
+    def remove_by_ids(self, id_str):
+        self.startTimer()
+        count = 0
+        if id_str:
+            cur = self.getCursor()
+            cur.execute("DELETE FROM `%s` " % self.getName() +
+                        " WHERE `hash_id` IN (%s)" % (id_str,))
+            count = cur.rowcount
+        self.stopTimer('remove_by_ids')
+        return count
+
+    pass
@@ -0,0 +1,54 @@
+# -*- coding: utf8 -*-
+"""
+Background scrubber progress: when every range of hash ids
+was verified last time and how many bad blocks found there.
+"""
+
+__author__ = 'sergey'
+
+from dedupsqlfs.db.sqlite.table import Table
+
+class TableScrubRange( Table ):
+
+    _table_name = "scrub_range"
+
+    def create( self ):
+        c = self.getCursor()
+
+        # Create table
+        c.execute(
+            "CREATE TABLE IF NOT EXISTS `%s` (" % self.getName()+
+                "`range_id` INTEGER PRIMARY KEY, "+
+                "`scrubbed_at` INTEGER NOT NULL, "+
+                "`blocks` INTEGER NOT NULL DEFAULT 0, "+
+                "`errors` INTEGER NOT NULL DEFAULT 0"+
+            ");"
+        )
+        return
+
+    def set( self, range_id, scrubbed_at, blocks, errors):
+        """
+        :param range_id: int - hash_id // range size
+        :param scrubbed_at: int - unix time
+        :return: int
+        """
+        self.startTimer()
+        cur = self.getCursor()
+        cur.execute("INSERT OR REPLACE INTO `%s`(`range_id`, `scrubbed_at`, `blocks`, `errors`) VALUES (?,?,?,?)" % self.getName(),
+                    (range_id, scrubbed_at, blocks, errors,))
+        self.stopTimer('set')
+        return 1
+
+    def get( self, range_id):
+        """
+        :param range_id: int
+        :return: Row
+        """
+        self.startTimer()
+        cur = self.getCursor()
+        cur.execute("SELECT * FROM `%s` WHERE `range_id`=?" % self.getName(), (range_id,))
+        item = cur.fetchone()
+        self.stopTimer('get')
+        return item
+
+    pass
@@ -8,18 +8,23 @@ Used in single or multi process compression classes
 __author__ = 'sergey'
 
 from time import time
+from copy import copy
 from dedupsqlfs.lib import constants
+from dedupsqlfs.fuse.compress import framed
 
 class Task(object):
     """
     @ivar key: int|str          - task primary key
     @ivar data: bytes           - data to compress
+    @ivar policy: str           - compression policy, like "none" or "zstd:19"
     """
 
     key = None
 
     data = None
 
+    policy = None
+
     pass
 
 class Result(object):
@@ -56,6 +61,12 @@ class BaseCompressTool(object):
     @type _methods: set
     """
 
+    _policies = None
+    """
+    @ivar _policies: Parsed compression policies: { policy: [ (method, L{dedupsqlfs.compression.BaseCompression}), ... ] }
+    @type _policies: dict
+    """
+
     _logger = None
     """
     @ivar _logger: Logger
@@ -68,6 +79,7 @@ class BaseCompressTool(object):
         self._compressors = {}
         self._options = {}
         self._methods = set()
+        self._policies = {}
         pass
 
     def checkCpuLimit(self):
@@ -111,61 +123,78 @@ class BaseCompressTool(object):
         if name and name.find(":") != -1:
             name, level = name.split(":")
 
+        self._compressors[name] = self._newCompressor(name)
+        self._compressors[name].setCustomCompressionLevel(level)
+
+        return self
+
+    def _newCompressor(self, name):
+        """
+        Create new compression helper object by method name
+
+        @param name: compression method name
+        @type  name: str
+
+        @rtype: L{dedupsqlfs.compression.BaseCompression}
+        """
+
         if name == "none":
             from dedupsqlfs.compression.none import NoneCompression
-            self._compressors[name] = NoneCompression()
+            return NoneCompression()
         elif name == "zlib":
             from dedupsqlfs.compression.zlib import ZlibCompression
-            self._compressors[name] = ZlibCompression()
+            return ZlibCompression()
         elif name == "deflate":
             from dedupsqlfs.compression.deflate import DeflateCompression
-            self._compressors[name] = DeflateCompression()
+            return DeflateCompression()
         elif name == "brotli":
             from dedupsqlfs.compression.brotli import BrotliCompression
-            self._compressors[name] = BrotliCompression()
+            return BrotliCompression()
         elif name == "bz2":
             from dedupsqlfs.compression.bz2 import Bz2Compression
-            self._compressors[name] = Bz2Compression()
+            return Bz2Compression()
         elif name == "xz":
             from dedupsqlfs.compression.lzma import LzmaCompression
-            self._compressors[name] = LzmaCompression()
+            return LzmaCompression()
         elif name == "lzo":
             from dedupsqlfs.compression.lzo import LzoCompression
-            self._compressors[name] = LzoCompression()
+            return LzoCompression()
         elif name == "lz4":
             from dedupsqlfs.compression.lz4 import Lz4Compression
-            self._compressors[name] = Lz4Compression()
+            return Lz4Compression()
         elif name == "lz4r07":
             from dedupsqlfs.compression.lz4r07 import Lz4r07Compression
-            self._compressors[name] = Lz4r07Compression()
+            return Lz4r07Compression()
         elif name == "lz4h":
             from dedupsqlfs.compression.lz4h import Lz4hCompression
-            self._compressors[name] = Lz4hCompression()
+            return Lz4hCompression()
         elif name == "snappy":
             from dedupsqlfs.compression.snappy import SnappyCompression
-            self._compressors[name] = SnappyCompression()
+            return SnappyCompression()
         elif name == "quicklz":
             from dedupsqlfs.compression.quicklz import QuickLzCompression
-            self._compressors[name] = QuickLzCompression()
+            return QuickLzCompression()
         elif name == "quicklzf":
             from dedupsqlfs.compression.quicklzf import QuickLzFCompression
-            self._compressors[name] = QuickLzFCompression()
+            return QuickLzFCompression()
         elif name == "quicklzm":
             from dedupsqlfs.compression.quicklzm import QuickLzMCompression
-            self._compressors[name] = QuickLzMCompression()
+            return QuickLzMCompression()
         elif name == "quicklzb":
             from dedupsqlfs.compression.quicklzb import QuickLzBCompression
-            self._compressors[name] = QuickLzBCompression()
+            return QuickLzBCompression()
         elif name == "zstd":
             from dedupsqlfs.compression.zstd import ZstdCompression
-            self._compressors[name] = ZstdCompression()
+            return ZstdCompression()
+        elif name == "zstd_dict":
+            from dedupsqlfs.compression.zstd_dict import ZstdDictCompression
+            return ZstdDictCompression()
         else:
             raise ValueError("Unknown compression method! %r" % name)
 
-        self._compressors[name].setCustomCompressionLevel(level)
-
-        return self
 
+    def hasCompressor(self, name):
+        return name in self._compressors
 
     def getCompressor(self, name):
         if name in self._compressors:
@@ -176,12 +205,77 @@ class BaseCompressTool(object):
 
 
     def isMethodSelected(self, name):
-        return name in self._methods
+        return self.getBaseMethod(name) in self._methods
+
+    def isMethodFramed(self, name):
+        return name.endswith(constants.COMPRESSION_FRAMED_SUFFIX)
+
+    def getBaseMethod(self, name):
+        """
+        Method name without seekable framed format suffix
+        """
+        if self.isMethodFramed(name):
+            return name[:-len(constants.COMPRESSION_FRAMED_SUFFIX)]
+        return name
 
-    def _compressData(self, data):
+    def getPolicy(self, policy):
+        """
+        Parse compression policy and cache compressors for it.
+        Policy is comma separated list of <method>[:<level>],
+        method 'none' disables compression at all.
+
+        Compressors with custom level are copied,
+        so global ones are not changed.
+
+        If no method of policy is available and 'none' is not there,
+        globally selected methods are used.
+
+        @param policy: compression policy, like "none", "zstd:19" or "zstd:19,lz4"
+        @type  policy: str
+
+        @return list [ (method, compressor), ... ]
+        """
+        if policy in self._policies:
+            return self._policies[policy]
+
+        items = []
+        skipped = disabled = False
+        for spec in policy.split(","):
+            spec = spec.strip()
+            level = None
+            if spec.find(":") != -1:
+                spec, level = spec.split(":", 1)
+            if spec == constants.COMPRESSION_TYPE_NONE:
+                disabled = True
+                continue
+            if not spec:
+                continue
+            if spec not in self._compressors:
+                self.getLogger().warning("BaseCompressTool::getPolicy - compression method %r not available, skip", spec)
+                skipped = True
+                continue
+            if level is None:
+                comp = self._compressors[spec]
+            else:
+                # Shallow copy - keep loaded module and other state
+                comp = copy(self._compressors[spec])
+                comp.setCustomCompressionLevel(level)
+            items.append((spec, comp,))
+
+        if not items and skipped and not disabled:
+            self.getLogger().warning("BaseCompressTool::getPolicy - no method of policy %r available, use selected methods", policy)
+            items = [ (m, self._compressors[ m ],) for m in self._methods ]
+
+        self._policies[policy] = items
+        return items
+
+    def _compressData(self, data, policy=None):
         """
         Compress data and returns back
 
+        @param policy: compression policy, overrides selected methods
+        @type  policy: str|None
+
         @return tuple (compressed data (bytes), compresion method (string) )
         """
 
@@ -202,13 +296,24 @@ class BaseCompressTool(object):
         if data_length <= minSize and not forced:
             return cdata, cmethod
 
+        if policy:
+            compressors = self.getPolicy(policy)
+            if not compressors:
+                # Policy says - no compression
+                return cdata, cmethod
+        else:
+            compressors = [ (m, self._compressors[ m ],) for m in self._methods ]
+
         cdata_length = data_length
         min_len = data_length
 
-        self.getLogger().debug("BaseCompressTool::_compressData - data length = %r", data_length)
+        # Compress big blocks by independent sub-frames
+        frameSize = self.getOption("compression_frame_size", 0)
+        useFrames = frameSize and data_length > frameSize
 
-        for m in self._methods:
-            comp = self._compressors[ m ]
+        self.getLogger().debug("BaseCompressTool::_compressData - data length = %r, policy = %r", data_length, policy)
+
+        for m, comp in compressors:
             self.getLogger().debug("BaseCompressTool::_compressData - try method = %r", m)
             if comp.isDataMayBeCompressed(data, data_length):
                 # Prefer custom level options
@@ -216,7 +321,11 @@ class BaseCompressTool(object):
                 if not useLevel:
                     useLevel = level
                 self.getLogger().debug("BaseCompressTool::_compressData - try level %r", useLevel)
-                _cdata = comp.compressData(data, useLevel)
+                if useFrames:
+                    _cdata = framed.compress_frames(
+                        lambda frame: comp.compressData(frame, useLevel), data, frameSize)
+                else:
+                    _cdata = comp.compressData(data, useLevel)
                 cdata_length = len(_cdata)
                 self.getLogger().debug("BaseCompressTool::_compressData - cdata length = %r", cdata_length)
                 if min_len > cdata_length:
@@ -224,6 +333,8 @@ class BaseCompressTool(object):
                     min_len = cdata_length
                     cdata = _cdata
                     cmethod = m
+                    if useFrames:
+                        cmethod += constants.COMPRESSION_FRAMED_SUFFIX
 
         cratio = (data_length - cdata_length) * 1.0 / data_length
 
@@ -238,11 +349,12 @@ class BaseCompressTool(object):
 
         return cdata, cmethod
 
-    def compressData(self, dataToCompress):
+    def compressData(self, dataToCompress, policies=None):
         """
         Compress data and returns back
 
         @param dataToCompress: dict { hash id: bytes data }
+        @param policies: dict { hash id: compression policy (string) } or None
 
         @return tuple ( hash id, (compressed data (bytes), compresion method (string) ) )
         """
@@ -251,12 +363,16 @@ class BaseCompressTool(object):
 
         isNoneOnly = not self._methods or (len(self._methods) == 1 and constants.COMPRESSION_TYPE_NONE in self._methods)
 
+        if policies is None:
+            policies = {}
+
         for hash_id, data in dataToCompress.items():
+            policy = policies.get(hash_id)
             # Clean pass - no compress at all
-            if isNoneOnly:
+            if isNoneOnly and not policy:
                 yield hash_id, (data, constants.COMPRESSION_TYPE_NONE,)
             else:
-                yield hash_id, self._compressData(data)
+                yield hash_id, self._compressData(data, policy)
 
         self.time_spent_compressing = time() - start_time
 
@@ -269,17 +385,35 @@ class BaseCompressTool(object):
         @return bytes
         """
         if method != constants.COMPRESSION_TYPE_NONE:
+            if self.isMethodFramed(method):
+                comp = self._compressors[ self.getBaseMethod(method) ]
+                return framed.decompress_frames(comp.decompressData, data)
             comp = self._compressors[ method ]
             return comp.decompressData(data)
         return data
 
+    def decompressDataRange(self, method, data, offset, size):
+        """
+        deCompress only part of data and returns back.
+        For seekable framed format - only touched frames are decompressed.
+
+        @param offset: raw data offset
+        @param size: raw data size
+
+        @return bytes, may be shorter than size
+        """
+        if self.isMethodFramed(method):
+            comp = self._compressors[ self.getBaseMethod(method) ]
+            return framed.decompress_frames_range(comp.decompressData, data, offset, size)
+        return self.decompressData(method, data)[offset:offset + size]
+
     def isDeprecated(self, method):
         """
         Is (de)compression method deprecated and should not be used
 
         @return bool
         """
-        comp = self._compressors[method]
+        comp = self._compressors[ self.getBaseMethod(method) ]
         return comp.isDeprecated()
 
     pass
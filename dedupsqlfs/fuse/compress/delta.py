@@ -0,0 +1,124 @@
+# -*- coding: utf8 -*-
+"""
+Similarity based delta compression helpers
+
+Resemblance sketch of block data - super-features:
+    - rolling hash over every W bytes window
+    - K features - maximums of K linear transforms of window hashes
+    - features grouped into S super-features, hashed together
+
+Blocks with equal super-feature are most likely similar,
+so new block stored as delta against existing one:
+zstd with base block as raw content dictionary (if 'zstandard' module available),
+or zlib with base block as preset dictionary (only last 32 KiB of base are used).
+
+Sketch calculation requires 'numpy' module.
+"""
+
+__author__ = 'sergey'
+
+import struct
+import zlib
+
+from dedupsqlfs.lib import constants
+
+np = None
+try:
+    import numpy as np
+except ImportError:
+    pass
+
+zstandard = None
+try:
+    import zstandard
+except ImportError:
+    pass
+
+WINDOW = 32
+PRIME = 0x01000193
+
+FEATURES = 12
+SUPER_FEATURES = 3
+
+# Fixed transforms, sketches must be equal between runs
+_TRANSFORMS = (
+    (0x9e3779b1, 0x7f4a7c15), (0x85ebca77, 0xc2b2ae3d), (0x27d4eb2f, 0x165667b1),
+    (0xd3a2646d, 0xfd7046c5), (0xb55a4f09, 0x94d049bb), (0x2545f491, 0x4f6cdd1d),
+    (0x5851f42d, 0x14057b7e), (0x6c078965, 0x3c6ef372), (0xa54ff53b, 0x510e527f),
+    (0x9b05688d, 0x1f83d9ab), (0x5be0cd19, 0x428a2f98), (0x71374491, 0xb5c0fbcf),
+)
+
+MIN_DATA_SIZE = 1024
+
+
+def is_available():
+    return np is not None
+
+
+def get_method():
+    """
+    Delta compression method for new data
+    """
+    if zstandard is not None:
+        return constants.COMPRESSION_DELTA_ZSTD
+    return constants.COMPRESSION_DELTA_ZLIB
+
+
+def is_delta_method(method):
+    return method in (constants.COMPRESSION_DELTA_ZSTD, constants.COMPRESSION_DELTA_ZLIB,)
+
+
+def sketch(data):
+    """
+    @param data: block data
+    @type  data: bytes
+
+    @return: list of super-features (int), empty if data too short
+    """
+    if np is None or len(data) < MIN_DATA_SIZE:
+        return []
+
+    buf = np.frombuffer(data, dtype=np.uint8).astype(np.uint32)
+    n = len(buf) - WINDOW + 1
+
+    # Window hashes by Horner's method, wrap around 2^32
+    h = np.zeros(n, dtype=np.uint32)
+    p = np.uint32(PRIME)
+    for j in range(WINDOW):
+        h = h * p + buf[j:j + n]
+
+    features = []
+    for a, b in _TRANSFORMS[:FEATURES]:
+        features.append(int((h * np.uint32(a) + np.uint32(b)).max()))
+
+    per_sf = FEATURES // SUPER_FEATURES
+    sfs = []
+    for s in range(SUPER_FEATURES):
+        sf = zlib.crc32(struct.pack("<%dI" % per_sf, *features[s * per_sf:(s + 1) * per_sf]))
+        # Slot number in high bits - equal features in different slots are not equal super-features
+        sfs.append((s << 32) | sf)
+    return sfs
+
+
+def encode(method, data, base):
+    """
+    @return: bytes - delta of data against base
+    """
+    if method == constants.COMPRESSION_DELTA_ZSTD:
+        d = zstandard.ZstdCompressionDict(base, dict_type=zstandard.DICT_TYPE_RAWCONTENT)
+        return zstandard.ZstdCompressor(level=3, dict_data=d).compress(data)
+    c = zlib.compressobj(6, zdict=base)
+    return c.compress(data) + c.flush()
+
+
+def decode(method, delta, base):
+    """
+    @return: bytes - restored data
+    """
+    if method == constants.COMPRESSION_DELTA_ZSTD:
+        if zstandard is None:
+            raise OSError("Module 'zstandard' required to read %r compressed blocks!" % method)
+        d = zstandard.ZstdCompressionDict(base, dict_type=zstandard.DICT_TYPE_RAWCONTENT)
+        return zstandard.ZstdDecompressor(dict_data=d).decompress(delta)
+    c = zlib.decompressobj(zdict=base)
+    return c.decompress(delta) + c.flush()
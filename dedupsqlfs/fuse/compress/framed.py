@@ -0,0 +1,133 @@
+# -*- coding: utf8 -*-
+"""
+Seekable framed format for compressed block data
+
+Block data is split into sub-frames of equal size (last one may be shorter),
+every frame compressed independently. Stored blob:
+
+    header:  frame size (uint32), frames count (uint16)
+    table:   frames end offsets in compressed payload (uint32 * count)
+    payload: compressed frames
+
+So small random reads decompress only frames they touch,
+and with incremental BLOB I/O read only them from database.
+"""
+
+__author__ = 'sergey'
+
+import struct
+
+HEADER = struct.Struct("<IH")
+
+
+def compress_frames(func_compress, data, frame_size):
+    """
+    @param func_compress: function( bytes ) -> bytes
+    @param data: raw block data
+    @param frame_size: raw frame size
+
+    @return: bytes
+    """
+    frames = []
+    ends = []
+    end = 0
+    for start in range(0, len(data), frame_size):
+        cframe = func_compress(data[start:start + frame_size])
+        end += len(cframe)
+        frames.append(cframe)
+        ends.append(end)
+
+    return HEADER.pack(frame_size, len(frames)) + struct.pack("<%dI" % len(ends), *ends) + b"".join(frames)
+
+
+def read_table(cdata):
+    """
+    @return: tuple (frame size, frames end offsets, payload start)
+    """
+    frame_size, count = HEADER.unpack_from(cdata, 0)
+    ends = struct.unpack_from("<%dI" % count, cdata, HEADER.size)
+    return frame_size, ends, HEADER.size + 4 * count
+
+
+def decompress_frames(func_decompress, cdata):
+    """
+    Decompress all frames
+
+    @param func_decompress: function( bytes ) -> bytes
+    @param cdata: framed blob
+
+    @return: bytes
+    """
+    frame_size, ends, payload = read_table(cdata)
+    data = []
+    start = 0
+    for end in ends:
+        data.append(func_decompress(cdata[payload + start:payload + end]))
+        start = end
+    return b"".join(data)
+
+
+def decompress_frames_range(func_decompress, cdata, offset, size):
+    """
+    Decompress only frames which hold raw data range
+
+    @param func_decompress: function( bytes ) -> bytes
+    @param cdata: framed blob
+    @param offset: raw data offset
+    @param size: raw data size
+
+    @return: bytes, may be shorter than size if block data is shorter
+    """
+    frame_size, ends, payload = read_table(cdata)
+    if not ends or size <= 0:
+        return b''
+
+    first = offset // frame_size
+    last = (offset + size - 1) // frame_size
+    if first >= len(ends):
+        return b''
+    if last >= len(ends):
+        last = len(ends) - 1
+
+    data = []
+    for n in range(first, last + 1):
+        start = 0
+        if n:
+            start = ends[n - 1]
+        data.append(func_decompress(cdata[payload + start:payload + ends[n]]))
+
+    inframe_offset = offset - first * frame_size
+    return b"".join(data)[inframe_offset:inframe_offset + size]
+
+
+def read_frames_range(blob, offset, size):
+    """
+    Read only frames which hold raw data range from stored blob
+
+    @param blob: framed blob, any object sliced into bytes - sqlite3.Blob or bytes
+    @param offset: raw data offset
+    @param size: raw data size
+
+    @return: tuple (framed blob of read frames, raw data offset in it)
+    """
+    frame_size, count = HEADER.unpack(blob[0:HEADER.size])
+    if not count or size <= 0:
+        return HEADER.pack(frame_size, 0), 0
+
+    payload = HEADER.size + 4 * count
+    ends = struct.unpack("<%dI" % count, blob[HEADER.size:payload])
+
+    first = offset // frame_size
+    last = (offset + size - 1) // frame_size
+    if first >= count:
+        return HEADER.pack(frame_size, 0), 0
+    if last >= count:
+        last = count - 1
+
+    start = 0
+    if first:
+        start = ends[first - 1]
+    sub_ends = [ end - start for end in ends[first:last + 1] ]
+
+    return HEADER.pack(frame_size, len(sub_ends)) + struct.pack("<%dI" % len(sub_ends), *sub_ends) + \
+           blob[payload + start:payload + ends[last]], offset - first * frame_size
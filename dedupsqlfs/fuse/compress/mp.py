@@ -111,24 +111,25 @@ class MultiProcCompressTool(BaseCompressTool):
 
             if type(task) is Task:
                 result = Result()
-                result.cdata, result.method = self._compressData(task.data)
+                result.cdata, result.method = self._compressData(task.data, task.policy)
                 result.key = task.key
                 out_queue.put_nowait(result)
                 in_queue.task_done()
 
         return
 
-    def compressData(self, dataToCompress):
+    def compressData(self, dataToCompress, policies=None):
         """
         Compress data and returns back
 
         @param dataToCompress: dict { hash id: bytes data }
+        @param policies: dict { hash id: compression policy (string) } or None
 
         @return dict { hash id: (compressed data (bytes), compresion method (string) ) }
         """
         isNoneOnly = not self._methods or (len(self._methods) == 1 and constants.COMPRESSION_TYPE_NONE in self._methods)
-        if isNoneOnly:
-            for hash_id, item in super().compressData(dataToCompress):
+        if isNoneOnly and not policies:
+            for hash_id, item in super().compressData(dataToCompress, policies):
                 yield hash_id, item
             return
 
@@ -145,6 +146,8 @@ class MultiProcCompressTool(BaseCompressTool):
             task = Task()
             task.key = key
             task.data = data
+            if policies:
+                task.policy = policies.get(key)
             nq = i % self._np
             tq = self._task_queues[ nq ]
             tq.put_nowait(task)
@@ -57,6 +57,10 @@ if int(fv[0]) < 1 and int(fv[1]) < 42:
 from dedupsqlfs.my_formats import format_size
 from dedupsqlfs.proc import pid_exists
 from dedupsqlfs.fuse.helpers.logger import DDSFlogger
+from dedupsqlfs.fuse.helpers.checkpoint import CheckpointThread
+from dedupsqlfs.fuse.helpers.collector import CollectorThread
+from dedupsqlfs.fuse.helpers.scrubber import ScrubberThread
+from dedupsqlfs.fuse.helpers.vacuum import VacuumThread
 from dedupsqlfs.fuse.compress.mp import MultiProcCompressTool, BaseCompressTool
 from dedupsqlfs.fuse.compress.mt import MultiThreadCompressTool
 from dedupsqlfs.lib import constants
@@ -73,6 +77,18 @@ class DedupFS(object): # {{{1
         
         @ivar _cache_flusher_proc
         @type _cache_flusher_proc: Popen
+
+        @ivar _checkpoint_thread
+        @type _checkpoint_thread: CheckpointThread
+
+        @ivar _collector_thread
+        @type _collector_thread: CollectorThread
+
+        @ivar _scrubber_thread
+        @type _scrubber_thread: ScrubberThread
+
+        @ivar _vacuum_thread
+        @type _vacuum_thread: VacuumThread
         """
 
         self.options = dict(vars(options))
@@ -83,6 +99,14 @@ class DedupFS(object): # {{{1
 
         self._cache_flusher_proc = None
 
+        self._checkpoint_thread = None
+
+        self._collector_thread = None
+
+        self._scrubber_thread = None
+
+        self._vacuum_thread = None
+
         self.mount_time = None
 
         self.mountpoint = mountpoint
@@ -181,6 +205,114 @@ class DedupFS(object): # {{{1
         return
 
 
+    def startCheckpointer(self):
+        if not self.mountpoint:
+            return
+        if self.isReadonly():
+            return
+        if self.operations.getManager().TYPE != 'sqlite':
+            return
+        if self.getOption('journal_mode') != 'wal':
+            return
+        if not self.getOption('checkpoint_interval') or self.getOption('checkpoint_interval') <= 0:
+            return
+
+        self._checkpoint_thread = CheckpointThread(
+            self.operations, fuse.lock,
+            self.getOption('checkpoint_interval'), self.getOption('checkpoint_idle') or 0
+        )
+        self._checkpoint_thread.start()
+        return
+
+
+    def stopCheckpointer(self):
+        if not self._checkpoint_thread:
+            return
+
+        self._checkpoint_thread.stop()
+        self._checkpoint_thread = None
+        return
+
+
+    def startCollector(self):
+        if not self.mountpoint:
+            return
+        if not self.operations.online_gc_enabled:
+            return
+
+        self._collector_thread = CollectorThread(
+            self.operations, fuse.lock,
+            self.getOption('online_gc_interval') or 10, self.getOption('online_gc_idle') or 0,
+            self.getOption('online_gc_batch') or 1000
+        )
+        self._collector_thread.start()
+        return
+
+
+    def stopCollector(self):
+        if not self._collector_thread:
+            return
+
+        self._collector_thread.stop()
+        self._collector_thread = None
+        return
+
+
+    def startScrubber(self):
+        if not self.mountpoint:
+            return
+        if self.isReadonly():
+            return
+        if not self.getOption('scrub_rate') or self.getOption('scrub_rate') <= 0:
+            return
+
+        self._scrubber_thread = ScrubberThread(
+            self.operations, fuse.lock,
+            self.getOption('scrub_interval') or 1, self.getOption('scrub_rate')
+        )
+        self._scrubber_thread.start()
+        return
+
+
+    def stopScrubber(self):
+        if not self._scrubber_thread:
+            return
+
+        self._scrubber_thread.stop()
+        self._scrubber_thread = None
+        return
+
+
+    def startVacuumer(self):
+        if not self.mountpoint:
+            return
+        if self.isReadonly():
+            return
+        if self.operations.getManager().TYPE != 'sqlite':
+            return
+        if self.getOption('auto_vacuum') != 2:
+            return
+        if not self.getOption('vacuum_pages') or self.getOption('vacuum_pages') <= 0:
+            return
+
+        self._vacuum_thread = VacuumThread(
+            self.operations, fuse.lock,
+            self.getOption('vacuum_interval') or 30, self.getOption('vacuum_idle') or 0,
+            self.getOption('vacuum_pages')
+        )
+        self._vacuum_thread.start()
+        return
+
+
+    def stopVacuumer(self):
+        if not self._vacuum_thread:
+            return
+
+        self._vacuum_thread.stop()
+        self._vacuum_thread = None
+        return
+
+
     def checkIfLocked(self):
         lockFile = self.getOption('lock_file')
         if lockFile:
@@ -230,6 +362,7 @@ class DedupFS(object): # {{{1
         self.operations.getManager()
 
         self._fixCompressionOptions()
+        self._setupCompressionDictionary()
         self._compressTool.init(self.getLogger())
         manager = self.operations.getManager()
         fs_ver = manager.getTable('option').get('fsversion')
@@ -412,18 +545,50 @@ class DedupFS(object): # {{{1
         self._compressTool.setOption("compression_level", defaultLevel)
         self._compressTool.setOption("compression_forced", self.getOption("compression_forced"))
 
+        frameSize = self.getOption("compression_frame_size")
+        if frameSize and frameSize < constants.COMPRESSION_FRAME_SIZE_MIN:
+            self.getLogger().warning("Compression frame size less than minimal! (%i<%i) Set to minimal.",
+                frameSize, constants.COMPRESSION_FRAME_SIZE_MIN)
+            frameSize = constants.COMPRESSION_FRAME_SIZE_MIN
+        self._compressTool.setOption("compression_frame_size", frameSize or 0)
+
         return
 
 
+    def _setupCompressionDictionary(self):
+        """
+        Select last trained dictionary for new data,
+        load others from DB on demand - for decompression
+        """
+        if not self._compressTool.hasCompressor("zstd_dict"):
+            return
+
+        table = self.operations.getManager().getTable("compression_dict")
+
+        comp = self._compressTool.getCompressor("zstd_dict")
+        comp.setDictionaryLoader(table.get)
+
+        item = table.get_last("zstd_dict")
+        if item:
+            self.getLogger().debug("_setupCompressionDictionary - use dictionary id=%r", item["id"])
+            comp.setCurrentDictionary(item["id"], item["data"])
+        return
+
     def getCompressTool(self):
         return self._compressTool
 
-    def compressData(self, dataBlocks):
-        return self._compressTool.compressData(dataBlocks)
+    def compressData(self, dataBlocks, policies=None):
+        return self._compressTool.compressData(dataBlocks, policies)
 
     def decompressData(self, method, compressedBlock):
         return self._compressTool.decompressData(method, compressedBlock)
 
+    def decompressDataRange(self, method, compressedBlock, offset, size):
+        return self._compressTool.decompressDataRange(method, compressedBlock, offset, size)
+
+    def isMethodFramed(self, method):
+        return self._compressTool.isMethodFramed(method)
+
     def isDeprecated(self, method):
         return self._compressTool.isDeprecated(method)
 
@@ -446,6 +611,18 @@ class DedupFS(object): # {{{1
                 m_id = table.find(m)
                 if not m_id:
                     table.insert(m)
+                if m == constants.COMPRESSION_TYPE_NONE:
+                    continue
+                # Seekable framed variant
+                mf = m + constants.COMPRESSION_FRAMED_SUFFIX
+                m_id = table.find(mf)
+                if not m_id:
+                    table.insert(mf)
+            # Delta compression done by operations, not by compression tool
+            for m in (constants.COMPRESSION_DELTA_ZSTD, constants.COMPRESSION_DELTA_ZLIB,):
+                m_id = table.find(m)
+                if not m_id:
+                    table.insert(m)
             manager.commit()
         return self
 
@@ -467,7 +644,10 @@ class DedupFS(object): # {{{1
         disk_usage += manager.getTable("hash", True).getFileSize()
         disk_usage += manager.getTable("hash_compression_type", True).getFileSize()
         disk_usage += manager.getTable("hash_sizes", True).getFileSize()
+        disk_usage += manager.getTable("hash_delta", True).getFileSize()
+        disk_usage += manager.getTable("hash_sketch", True).getFileSize()
         disk_usage += manager.getTable("compression_type", True).getFileSize()
+        disk_usage += manager.getTable("compression_dict", True).getFileSize()
         disk_usage += manager.getTable("name", True).getFileSize()
         disk_usage += manager.getTable("name_pattern_option", True).getFileSize()
         disk_usage += manager.getTable("option", True).getFileSize()
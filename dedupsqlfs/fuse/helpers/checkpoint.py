@@ -0,0 +1,66 @@
+# -*- coding: utf8 -*-
+"""
+Background WAL checkpoints in idle time
+
+WAL files grow while filesystem writes and commits data.
+Checkpoints on commit slow down writes, so they are done here
+when there were no commits for some time:
+    - first PASSIVE - moves as many pages as possible, doesn't wait for anyone
+    - then TRUNCATE - resets WAL file to zero size
+Nothing is done until new commits happen.
+"""
+
+__author__ = 'sergey'
+
+from dedupsqlfs.fuse.helpers.idle import IdleWorkerThread
+
+
+class CheckpointThread(IdleWorkerThread):
+
+    _interval = 10
+    _idle = 2
+
+    _last_commit_time = None
+    _truncated = True
+
+    def __init__(self, operations, lock, interval, idle):
+        """
+        @param operations: FUSE operations
+        @type  operations: dedupsqlfs.fuse.operations.DedupOperations
+
+        @param lock: FUSE global lock
+
+        @param interval: check for idle every N seconds
+        @type  interval: float
+
+        @param idle: how long there must be no commits, in seconds
+        @type  idle: float
+        """
+        IdleWorkerThread.__init__(self, "wal-checkpoint", operations, lock, interval, idle)
+        self._last_commit_time = operations.last_commit_time
+        pass
+
+    def getMode(self):
+        """
+        Checkpoint mode for now, None - nothing to do
+
+        @rtype: str|None
+        """
+        lastCommit = self._operations.last_commit_time
+        if lastCommit != self._last_commit_time:
+            self._last_commit_time = lastCommit
+            self._truncated = False
+            return "PASSIVE"
+        if not self._truncated:
+            self._truncated = True
+            return "TRUNCATE"
+        return None
+
+    def step(self):
+        mode = self.getMode()
+        if mode:
+            self._operations.checkpointDatabase(mode)
+        # One checkpoint per interval
+        return False
+
+    pass
@@ -0,0 +1,46 @@
+# -*- coding: utf8 -*-
+"""
+Background garbage collection of unused hashes in idle time
+
+References to hashes removed from block index are queued in 'hash_gc' table.
+When there were no commits for some time, queued hashes are checked
+against block indexes of all subvolumes by small batches,
+unused ones are removed with their data blocks.
+Batches go one by one while FS stays idle.
+"""
+
+__author__ = 'sergey'
+
+from dedupsqlfs.fuse.helpers.idle import IdleWorkerThread
+
+
+class CollectorThread(IdleWorkerThread):
+
+    _interval = 10
+    _idle = 5
+    _batch = 1000
+
+    def __init__(self, operations, lock, interval, idle, batch):
+        """
+        @param operations: FUSE operations
+        @type  operations: dedupsqlfs.fuse.operations.DedupOperations
+
+        @param lock: FUSE global lock
+
+        @param interval: check for idle every N seconds
+        @type  interval: float
+
+        @param idle: how long there must be no commits, in seconds
+        @type  idle: float
+
+        @param batch: count of hashes checked at once
+        @type  batch: int
+        """
+        IdleWorkerThread.__init__(self, "online-gc", operations, lock, interval, idle)
+        self._batch = batch
+        pass
+
+    def step(self):
+        return self._operations.collectGarbage(self._batch) >= self._batch
+
+    pass
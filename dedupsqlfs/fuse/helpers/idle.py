@@ -0,0 +1,108 @@
+# -*- coding: utf8 -*-
+"""
+Base of background threads doing work in idle time of filesystem
+
+FS is idle when there were no commits for some time.
+Commits done by thread itself are not an activity of FS.
+Steps of work go one by one while FS stays idle and step says there is more work.
+
+Table connections are shared with FUSE operations,
+so every step is done only with FUSE global lock acquired.
+"""
+
+__author__ = 'sergey'
+
+from threading import Thread, Event
+from time import time
+
+
+class IdleWorkerThread(Thread):
+
+    _operations = None
+    """
+    @ivar _operations: FUSE operations
+    @type _operations: dedupsqlfs.fuse.operations.DedupOperations
+    """
+
+    _lock = None
+    """
+    @ivar _lock: FUSE global lock
+    """
+
+    _interval = 10
+    _idle = 5
+
+    _stop_event = None
+
+    _own_commit_time = None
+    """
+    @ivar _own_commit_time: Commit time after last step - not an activity of FS
+    """
+
+    def __init__(self, name, operations, lock, interval, idle):
+        """
+        @param name: thread name
+        @type  name: str
+
+        @param operations: FUSE operations
+        @type  operations: dedupsqlfs.fuse.operations.DedupOperations
+
+        @param lock: FUSE global lock
+
+        @param interval: check for idle every N seconds
+        @type  interval: float
+
+        @param idle: how long there must be no commits, in seconds
+        @type  idle: float
+        """
+        Thread.__init__(self, name=name)
+        self.daemon = True
+        self._operations = operations
+        self._lock = lock
+        self._interval = interval
+        self._idle = idle
+        self._stop_event = Event()
+        pass
+
+    def isIdle(self):
+        lastCommit = self._operations.last_commit_time
+        if lastCommit == self._own_commit_time:
+            return True
+        return time() - lastCommit >= self._idle
+
+    def step(self):
+        """
+        One step of work, called with FUSE lock acquired
+
+        @return: bool - more work to do right now
+        """
+        raise NotImplementedError
+
+    def run(self):
+        while not self._stop_event.wait(self._interval):
+            while True:
+                with self._lock:
+                    # Stopped while waiting for lock, database may be closed already
+                    if self._stop_event.is_set() or not self.isIdle():
+                        break
+                    try:
+                        more = self.step()
+                    except Exception as e:
+                        # Thread must go on, next step may succeed
+                        self._operations.getLogger().error("%s: %s", self.name, e)
+                        import traceback
+                        self._operations.getLogger().error(traceback.format_exc())
+                        more = False
+                    self._own_commit_time = self._operations.last_commit_time
+                if not more:
+                    break
+        return
+
+    def stop(self):
+        """
+        Don't wait for thread here - caller may hold FUSE lock
+        """
+        self._stop_event.set()
+        return self
+
+    pass
@@ -31,6 +31,7 @@ class ReportHelper:
         self.bytes_written = 0
         self.bytes_input_written = 0
         self.bytes_written_compressed = 0
+        self.delta_blocks_written = 0
 
         self.compressed_ratio = 0
 
@@ -46,6 +47,22 @@ class ReportHelper:
         self.time_spent_writing_meta = 0
         self.time_spent_writing_blocks = 0
         self.time_spent_commiting = 0
+        self.time_spent_counting_usage = 0
+        self.time_spent_checkpointing = 0
+
+        self.checkpoints_passive = 0
+        self.checkpoints_truncate = 0
+        self.checkpointed_pages = 0
+
+        self.vacuum_steps = 0
+        self.vacuumed_pages = 0
+        self.time_spent_vacuuming = 0
+
+        self.scrub_blocks = 0
+        self.scrub_bytes = 0
+        self.scrub_errors = 0
+        self.scrub_passes = 0
+        self.time_spent_scrubbing = 0
 
         self.time_spent_flushing_block_cache = 0
         self.time_spent_flushing_writed_block_cache = 0
@@ -97,11 +114,13 @@ class ReportHelper:
             self.__report_compressed_usage()
             self.__report_deduped_usage()
             self.__report_throughput()
+            self.__report_scrub()
             if self.get_option("verbose_stats_detailed"):
                 self.__report_timings()
                 self.__report_database_timings()
                 self.__report_fs_timings()
                 self.__report_database_operations()
+                self.__report_database_commits()
                 self.__report_fs_operations()
                 self.__report_cache_timings()
                 self.__report_cache_operations()
@@ -132,6 +151,10 @@ class ReportHelper:
                 'Writing blocks to database'),
             (self.get_manager().getTimeSpent(), 'Database operations'),
             (self.time_spent_commiting, 'Commiting all changes to database'),
+            (self.time_spent_counting_usage, 'Updating subvolume usage counters'),
+            (self.time_spent_checkpointing, 'Checkpointing WAL files in idle time'),
+            (self.time_spent_vacuuming, 'Incremental vacuum in idle time'),
+            (self.time_spent_scrubbing, 'Scrubbing stored blocks in background'),
             (self.time_spent_flushing_writed_block_cache - self.time_spent_writing_blocks,
                 'Flushing writed block cache'),
             (self.time_spent_flushing_readed_block_cache, 'Flushing readed block cache (cumulative)'),
@@ -240,6 +263,24 @@ class ReportHelper:
                     self.get_logger().info(
                         " - %-*s%s (%.1f%%)", maxdescwidth, description + ':', count, percentage)
 
+    def __report_database_commits(self):  # {{{3
+        commits, files, skipped = self.get_manager().getCommitStats()
+        if not commits:
+            return
+        msg = "Database commits: %d, table files committed: %d (%.2f per commit), clean skipped: %d" % (
+            commits, files, files * 1.0 / commits, skipped)
+        if self.get_manager().getSynchronous():
+            msg += ", every committed file does fsync"
+        self.get_logger().info(msg + '.')
+
+        if self.checkpoints_passive + self.checkpoints_truncate:
+            self.get_logger().info("WAL checkpoints in idle time: %d passive, %d truncate, %d pages moved." % (
+                self.checkpoints_passive, self.checkpoints_truncate, self.checkpointed_pages))
+
+        if self.vacuum_steps:
+            self.get_logger().info("Incremental vacuum in idle time: %d steps, %d free pages removed." % (
+                self.vacuum_steps, self.vacuumed_pages))
+
     def __report_fs_operations(self):  # {{{3
         if self.get_logger().isEnabledFor(logging.INFO):
             counts = []
@@ -363,8 +404,18 @@ class ReportHelper:
             msg += " (%s by %.2f%%)" % (direction, difference)
         msg += " (%s to %s)" % (format_size(self.bytes_written), format_size(self.bytes_written_compressed))
         self.get_logger().info(msg + '.')
+        if self.delta_blocks_written:
+            self.get_logger().info("Current delta compressed blocks written is %d." % self.delta_blocks_written)
         self.compressed_ratio = ratio
 
+    def __report_scrub(self):  # {{{3
+        if not self.scrub_blocks:
+            return
+        self.get_logger().info("Scrubbed %d blocks (%s, %s/s), full passes %d, bad blocks %d.",
+            self.scrub_blocks, format_size(self.scrub_bytes),
+            format_size(self.scrub_bytes / max(1, self.time_spent_scrubbing)),
+            self.scrub_passes, self.scrub_errors)
+
     def __report_throughput(self, nbytes=None, nseconds=None, label=None):  # {{{3
         if nbytes == None:
             self.__report_throughput(self.bytes_read, self.time_spent_reading, "read")
@@ -0,0 +1,58 @@
+# -*- coding: utf8 -*-
+"""
+Background scrubbing of stored blocks
+
+Blocks are read in order of hash_id, decompressed and their digest compared
+with stored hash value. Reading is limited by bytes per second budget,
+so full pass over big filesystem may take days.
+Position is saved after every batch, time of scrub for every range of hash ids.
+"""
+
+__author__ = 'sergey'
+
+from time import time
+
+from dedupsqlfs.fuse.helpers.idle import IdleWorkerThread
+
+
+class ScrubberThread(IdleWorkerThread):
+
+    _interval = 1
+    _rate = 0
+
+    _last_run = None
+
+    def __init__(self, operations, lock, interval, rate):
+        """
+        @param operations: FUSE operations
+        @type  operations: dedupsqlfs.fuse.operations.DedupOperations
+
+        @param lock: FUSE global lock
+
+        @param interval: scrub next blocks every N seconds
+        @type  interval: float
+
+        @param rate: bytes of stored data to read per second
+        @type  rate: int
+        """
+        IdleWorkerThread.__init__(self, "scrubber", operations, lock, interval, 0)
+        self._rate = rate
+        self._last_run = time()
+        pass
+
+    def isIdle(self):
+        """
+        Scrub goes all the time, it is limited by rate only
+        """
+        return True
+
+    def step(self):
+        now = time()
+        # No bursts after long wait for lock
+        budget = int(self._rate * min(now - self._last_run, self._interval * 2))
+        self._last_run = now
+        self._operations.scrubBlocks(budget)
+        # One budget per interval
+        return False
+
+    pass
@@ -0,0 +1,46 @@
+# -*- coding: utf8 -*-
+"""
+Background incremental vacuum in idle time
+
+With 'incremental' auto vacuum mode sqlite keeps free pages of removed
+rows inside of table files and removes them only on request.
+When there were no commits for some time, free pages are removed
+by small steps - tables with bigger part of free pages go first.
+Steps go one by one while FS stays idle and there are free pages.
+"""
+
+__author__ = 'sergey'
+
+from dedupsqlfs.fuse.helpers.idle import IdleWorkerThread
+
+
+class VacuumThread(IdleWorkerThread):
+
+    _interval = 30
+    _idle = 10
+    _pages = 1000
+
+    def __init__(self, operations, lock, interval, idle, pages):
+        """
+        @param operations: FUSE operations
+        @type  operations: dedupsqlfs.fuse.operations.DedupOperations
+
+        @param lock: FUSE global lock
+
+        @param interval: check for idle every N seconds
+        @type  interval: float
+
+        @param idle: how long there must be no commits, in seconds
+        @type  idle: float
+
+        @param pages: count of free pages removed at one step
+        @type  pages: int
+        """
+        IdleWorkerThread.__init__(self, "incremental-vacuum", operations, lock, interval, idle)
+        self._pages = pages
+        pass
+
+    def step(self):
+        return self._operations.vacuumDatabase(self._pages) >= self._pages
+
+    pass
@@ -8,6 +8,7 @@ import sys
 try:
     from io import BytesIO
     import errno
+    import fnmatch
     import hashlib
     import math
     from math import floor, ceil, modf
@@ -50,12 +51,13 @@ FUSEError = llfuse.FUSEError
 # Local modules that are mostly useful for debugging.
 from dedupsqlfs.lib import constants
 from dedupsqlfs.my_formats import format_timespan
-from dedupsqlfs.lib.cache.simple import CacheTTLseconds, CompressionSizesValue
+from dedupsqlfs.lib.cache.simple import CacheTTLseconds, CacheTTLsecondsSize, CompressionSizesValue
 from dedupsqlfs.lib.cache.storage import StorageTimeSize
 from dedupsqlfs.lib.cache.index import IndexTime
 from dedupsqlfs.lib.cache.inodes import InodesTime
 from dedupsqlfs.lib.timers_ops import TimersOps
 from dedupsqlfs.fuse.subvolume import Subvolume
+from dedupsqlfs.fuse.compress import delta, framed
 from dedupsqlfs.fuse.helpers.repr import entry_attributes_to_dict, setattr_fields_to_dict
 from dedupsqlfs.fuse.helpers.report import ReportHelper
 from dedupsqlfs import __fsversion__
@@ -75,6 +77,15 @@ class DedupOperations(llfuse.Operations,TimersOps):  # {{{1
 
         # Initialize instance attributes.
         self.block_partitions = 1
+        self.hash_meta_enabled = False
+        self.online_gc_enabled = False
+        self.gc_unlinked_inodes = set()
+        self.usage_counters_enabled = False
+        self.usage_hash_refs = {}
+        self.usage_apparent_size = 0
+        self.scrub_range_id = None
+        self.scrub_range_blocks = 0
+        self.scrub_range_errors = 0
 
         self.block_size = constants.BLOCK_SIZE_DEFAULT
         self.hash_function = constants.HASH_FUNCTION_DEFAULT
@@ -97,6 +108,8 @@ class DedupOperations(llfuse.Operations,TimersOps):  # {{{1
 
         self.subvol_uptate_last_run = time()
 
+        self.last_commit_time = time()
+
         self.cached_names = CacheTTLseconds()
         self.cached_name_ids = CacheTTLseconds()
         self.cached_nodes = CacheTTLseconds()
@@ -105,6 +118,14 @@ class DedupOperations(llfuse.Operations,TimersOps):  # {{{1
 
         self.cached_hash_sizes = CacheTTLseconds()
         self.cached_hash_compress = CacheTTLseconds()
+        self.cached_compress_policy = CacheTTLseconds()
+        self.cached_framed_blobs = CacheTTLsecondsSize()
+        self.cached_delta_bases = CacheTTLsecondsSize()
+
+        self.delta_enabled = False
+        self.delta_max_depth = constants.COMPRESSION_DELTA_DEPTH_DEFAULT
+
+        self.compression_patterns = []
 
         self.cached_blocks = StorageTimeSize()
         self.cached_indexes = IndexTime()
@@ -208,6 +229,11 @@ class DedupOperations(llfuse.Operations,TimersOps):  # {{{1
                 self.getLogger().error("FS databases need to process migrations! They not (all) applyed!")
                 raise OSError("FS DB not migrated!")
 
+            if self.getOption("hash_prefix_index") and not self.getOption("readonly"):
+                # Option enabled on migrated FS
+                if self.manager.getTable("hash").addPrefixIndex():
+                    self.getLogger().info("Hash table converted to integer prefix index.")
+
             self.flushCompressionType()
 
             jm = self.getOption("journal_mode")
@@ -246,6 +272,52 @@ class DedupOperations(llfuse.Operations,TimersOps):  # {{{1
     def getLogger(self):
         return self.application.logger
 
+    def checkpointDatabase(self, mode="PASSIVE"):
+        """
+        Checkpoint WAL files of database tables, see L{dedupsqlfs.fuse.helpers.checkpoint}
+
+        @param mode: PASSIVE or TRUNCATE
+        @type  mode: str
+
+        @return: int - count of checkpointed pages
+        """
+        start_time = time()
+        pages = self.getManager().checkpoint(mode)
+        elapsed_time = time() - start_time
+
+        self.reportHelper.time_spent_checkpointing += elapsed_time
+        self.reportHelper.checkpointed_pages += pages
+        if mode == "TRUNCATE":
+            self.reportHelper.checkpoints_truncate += 1
+        else:
+            self.reportHelper.checkpoints_passive += 1
+
+        self.getLogger().debug("WAL checkpoint %s: %i pages in %s", mode, pages, format_timespan(elapsed_time))
+        return pages
+
+    def vacuumDatabase(self, pages):
+        """
+        Incremental vacuum of database tables, see L{dedupsqlfs.fuse.helpers.vacuum}
+
+        @param pages: max count of removed free pages
+        @type  pages: int
+
+        @return: int - count of removed pages
+        """
+        start_time = time()
+        pages = self.getManager().incrementalVacuum(pages)
+        elapsed_time = time() - start_time
+
+        self.reportHelper.time_spent_vacuuming += elapsed_time
+        self.reportHelper.vacuumed_pages += pages
+        self.reportHelper.vacuum_steps += 1
+        if pages:
+            # Pages are in WAL files now
+            self.last_commit_time = time()
+
+        self.getLogger().debug("Incremental vacuum: %i pages in %s", pages, format_timespan(elapsed_time))
+        return pages
+
     def flushCaches(self):
         return self.__cache_meta_hook() + self.__cache_block_hook()
 
@@ -358,6 +430,10 @@ class DedupOperations(llfuse.Operations,TimersOps):  # {{{1
         self.startTimer("destroy")
         # Stop flushing thread if it started
         self.getApplication().stopCacheFlusher()
+        self.getApplication().stopCheckpointer()
+        self.getApplication().stopCollector()
+        self.getApplication().stopScrubber()
+        self.getApplication().stopVacuumer()
 
         self.getApplication().addLockMessage("destroy")
 
@@ -376,6 +452,7 @@ class DedupOperations(llfuse.Operations,TimersOps):  # {{{1
                 self.cached_indexes.clear()
 
                 self.getLogger().debug("Committing outstanding changes.")
+                self.__flush_usage_counters()
                 self.getManager().commit()
 
             if self.getOption("verbosity") > 1:
@@ -404,6 +481,7 @@ class DedupOperations(llfuse.Operations,TimersOps):  # {{{1
             self.getLogger().logCall('flush', '-- inode(%i) size=%i', fh, attr["size"])
             if not attr["size"]:
                 self.getLogger().logCall('flush', '-- inode(%i) zero sized! remove all blocks', fh)
+                self.__release_inode_hashes(fh)
                 self.getTable("inode_hash_block").delete(fh)
                 self.cached_blocks.forget(fh)
             else:
@@ -434,6 +512,9 @@ class DedupOperations(llfuse.Operations,TimersOps):  # {{{1
                 self.cached_attrs.expire(ituple[0])
                 self.cached_blocks.expire(ituple[0])
                 self.cached_indexes.expire(ituple[0])
+                self.cached_compress_policy.unset(ituple[0])
+                if ituple[0] in self.gc_unlinked_inodes:
+                    self.__purge_unlinked_inode(ituple[0])
         except FUSEError:
             pass
         except Exception as e:
@@ -460,6 +541,7 @@ class DedupOperations(llfuse.Operations,TimersOps):  # {{{1
             self.getLogger().logCall('fsync', '-- inode(%i) size=%i', fh, attr["size"])
             if not attr["size"]:
                 self.getLogger().logCall('fsync', '-- inode(%i) zero sized! remove all blocks', fh)
+                self.__release_inode_hashes(fh)
                 self.getTable("inode_hash_block").delete(fh)
                 self.cached_blocks.forget(fh)
                 self.cached_indexes.expire(fh)
@@ -589,6 +671,14 @@ class DedupOperations(llfuse.Operations,TimersOps):  # {{{1
             if self.getOption("flush_interval") is not None:
                 self.flush_interval = self.getOption("flush_interval")
 
+            if self.getOption("delta_compression"):
+                if delta.is_available():
+                    self.delta_enabled = True
+                else:
+                    self.getLogger().warning("Delta compression requires 'numpy' module! Disabled.")
+            if self.getOption("delta_max_depth") is not None:
+                self.delta_max_depth = int(self.getOption("delta_max_depth"))
+
             if self.getOption("verbosity") < 2:
                 self.cached_blocks.setEnableTimers(False)
                 self.cached_indexes.setEnableTimers(False)
@@ -599,6 +689,9 @@ class DedupOperations(llfuse.Operations,TimersOps):  # {{{1
                 self.cached_xattrs.setEnableTimers(False)
                 self.cached_hash_sizes.setEnableTimers(False)
                 self.cached_hash_compress.setEnableTimers(False)
+                self.cached_compress_policy.setEnableTimers(False)
+                self.cached_framed_blobs.setEnableTimers(False)
+                self.cached_delta_bases.setEnableTimers(False)
             else:
                 self.cached_blocks.setEnableTimers()
                 self.cached_indexes.setEnableTimers()
@@ -609,6 +702,9 @@ class DedupOperations(llfuse.Operations,TimersOps):  # {{{1
                 self.cached_xattrs.setEnableTimers()
                 self.cached_hash_sizes.setEnableTimers()
                 self.cached_hash_compress.setEnableTimers()
+                self.cached_compress_policy.setEnableTimers()
+                self.cached_framed_blobs.setEnableTimers()
+                self.cached_delta_bases.setEnableTimers()
 
             if not self.cache_enabled:
                 self.cached_blocks.setMaxReadTtl(0)
@@ -621,6 +717,9 @@ class DedupOperations(llfuse.Operations,TimersOps):  # {{{1
                 self.cached_xattrs.set_max_ttl(0)
                 self.cached_hash_sizes.set_max_ttl(0)
                 self.cached_hash_compress.set_max_ttl(0)
+                self.cached_compress_policy.set_max_ttl(0)
+                self.cached_framed_blobs.set_max_ttl(0)
+                self.cached_delta_bases.set_max_ttl(0)
             else:
                 if self.block_size:
                     self.cached_blocks.setBlockSize(self.block_size)
@@ -629,6 +728,8 @@ class DedupOperations(llfuse.Operations,TimersOps):  # {{{1
 
                 self.cached_hash_sizes.set_max_ttl(self.cache_block_write_timeout)
                 self.cached_hash_compress.set_max_ttl(self.cache_block_write_timeout)
+                self.cached_framed_blobs.set_max_ttl(self.cache_block_read_timeout)
+                self.cached_delta_bases.set_max_ttl(self.cache_block_read_timeout)
 
                 if self.cache_block_write_size:
                     if self.getOption("memory_limit") and not self.getOption("cache_block_write_size"):
@@ -641,6 +742,9 @@ class DedupOperations(llfuse.Operations,TimersOps):  # {{{1
                         if self.cache_block_read_size > 256*self.block_size or self.cache_block_read_size < 0:
                             self.cache_block_read_size = 256*self.block_size
                     self.cached_blocks.setMaxReadCacheSize(self.cache_block_read_size)
+                    # Compressed framed blobs and decompressed base blocks - same limit as read cache
+                    self.cached_framed_blobs.set_max_size(self.cache_block_read_size)
+                    self.cached_delta_bases.set_max_size(self.cache_block_read_size)
 
                 self.cached_nodes.set_max_ttl(self.cache_meta_timeout)
                 self.cached_names.set_max_ttl(self.cache_meta_timeout)
@@ -648,6 +752,7 @@ class DedupOperations(llfuse.Operations,TimersOps):  # {{{1
                 self.cached_attrs.set_max_ttl(self.cache_meta_timeout)
                 self.cached_xattrs.set_max_ttl(self.cache_meta_timeout)
                 self.cached_indexes.setMaxTtl(self.cache_meta_timeout)
+                self.cached_compress_policy.set_max_ttl(self.cache_meta_timeout)
 
             if self.getOption("synchronous") is not None:
                 self.synchronous = self.getOption("synchronous")
@@ -672,7 +777,19 @@ class DedupOperations(llfuse.Operations,TimersOps):  # {{{1
                 self.mounted_subvolume_name = b'' + self.mounted_subvolume_name.encode()
 
             self.__select_subvolume()
+
             self.__get_opts_from_db()
+            self.__init_hash_meta()
+            self.__init_online_gc()
+            self.__init_usage_counters()
+
+            # After subvolume selected - its tables are attached, not default ones
+            if self.getOption("sqlite_attach"):
+                jm = self.getOption("journal_mode")
+                if jm not in ("truncate", "delete",):
+                    self.getLogger().warning("Journal mode %r: attached files are commited atomically only one by one!", jm)
+                self.getManager().setAttach(True, [ self.getTable(name) for name in self.__get_flush_tables() ])
+            self.__load_compression_patterns()
             # Make sure the hash function is (still) valid (since the database was created).
 
             try:
@@ -685,6 +802,10 @@ class DedupOperations(llfuse.Operations,TimersOps):  # {{{1
 
             # NOT READONLY - AND - Mountpoint defined (mount action)
             self.getApplication().startCacheFlusher()
+            self.getApplication().startCheckpointer()
+            self.getApplication().startCollector()
+            self.getApplication().startScrubber()
+            self.getApplication().startVacuumer()
 
 
             if self.getApplication().mountpoint:
@@ -710,6 +831,9 @@ class DedupOperations(llfuse.Operations,TimersOps):  # {{{1
                 ps = blockTable.getDbPageSize()
                 self.getLogger().debug("DedupFS: real block table page_size=%r" % ps)
 
+            if self.getOption("parallel_block_partitions") and not self.isReadonly():
+                blockTable.startWriters()
+
             self.getApplication().addLockMessage("inited")
 
             self.getLogger().debug("DedupFS: inited and mounted")
@@ -1111,6 +1235,8 @@ class DedupOperations(llfuse.Operations,TimersOps):  # {{{1
             treeTable.rename_inode(node_old["id"], node_parent_new["id"], string_id)
 
             self.cached_nodes.unset("%i-%s" % (inode_parent_old, hashlib.md5(name_old).hexdigest()))
+            self.cached_nodes.unset(node_old["inode_id"])
+            self.cached_compress_policy.unset(node_old["inode_id"])
             if name_old != name_new:
                 self.cached_names.unset(hashlib.md5(name_old).hexdigest())
                 self.cached_name_ids.unset(node_old['name_id'])
@@ -1635,7 +1761,11 @@ class DedupOperations(llfuse.Operations,TimersOps):  # {{{1
 
         type_id = self.cached_hash_compress.get(hash_id)
 
-        if type_id is None:
+        if type_id is None and self.hash_meta_enabled:
+            self.__get_hash_meta_to_cache(hash_id)
+            type_id = self.cached_hash_compress.get(hash_id)
+
+        elif type_id is None:
 
             self.getLogger().debug("get compression type from DB: hash_id=%i", hash_id)
 
@@ -1652,7 +1782,10 @@ class DedupOperations(llfuse.Operations,TimersOps):  # {{{1
 
         citem = self.cached_hash_sizes.get(hash_id)
 
-        if citem is None:
+        if citem is None and self.hash_meta_enabled:
+            citem = self.__get_hash_meta_to_cache(hash_id)
+
+        elif citem is None:
 
             self.getLogger().debug("get sizes for hash from DB: hash_id=%i", hash_id)
 
@@ -1665,6 +1798,25 @@ class DedupOperations(llfuse.Operations,TimersOps):  # {{{1
             self.cached_hash_sizes.set(hash_id, citem)
         return citem
 
+    def __get_hash_meta_to_cache(self, hash_id):
+        """
+        One lookup for compression type and sizes of hash
+
+        @return: CompressionSizesValue
+        """
+        self.getLogger().debug("get hash metadata from DB: hash_id=%i", hash_id)
+
+        item = self.getTable("hash_meta").get(hash_id)
+        type_id = None
+        citem = CompressionSizesValue()
+        if item:
+            # Row may be created by references counter before data is flushed
+            type_id = item["type_id"] or None
+            citem = CompressionSizesValue(item["compressed_size"], item["writed_size"])
+        self.cached_hash_compress.set(hash_id, type_id)
+        self.cached_hash_sizes.set(hash_id, citem)
+        return citem
+
     def __get_block_from_cache(self, inode, block_number):
         self.getLogger().logCall('__get_block_from_cache', '->(inode=%i, block_number=%i)', inode, block_number)
 
@@ -1739,7 +1891,7 @@ class DedupOperations(llfuse.Operations,TimersOps):  # {{{1
                 # Try all decompression methods
                 if tryAll:
                     try:
-                        bdata = self.__decompress(item["data"], compTypeId)
+                        bdata = self.__decompress(item["data"], compTypeId, indexItem["hash_id"])
                     except:
                         bdata = False
                     if bdata is False:
@@ -1752,7 +1904,7 @@ class DedupOperations(llfuse.Operations,TimersOps):  # {{{1
                                 continue
 
                             try:
-                                bdata = self.__decompress(item["data"], type_id)
+                                bdata = self.__decompress(item["data"], type_id, indexItem["hash_id"])
                             except:
                                 bdata = False
                             if bdata is not False:
@@ -1771,9 +1923,10 @@ class DedupOperations(llfuse.Operations,TimersOps):  # {{{1
 
                 else:
                     # If it fails - OSError raised
-                    block.write(self.__decompress(item["data"], compTypeId))
+                    block.write(self.__decompress(item["data"], compTypeId, indexItem["hash_id"]))
 
-                if compression != constants.COMPRESSION_TYPE_NONE:
+                # Delta blocks are not recompressed - they are compressed against base
+                if compression != constants.COMPRESSION_TYPE_NONE and not delta.is_delta_method(compression):
                     if self.getOption('compression_recompress_now') and self.application.isDeprecated(compression):
                         recompress = True
                     if self.getOption('compression_recompress_current') and not self.application.isMethodSelected(compression):
@@ -1787,6 +1940,71 @@ class DedupOperations(llfuse.Operations,TimersOps):  # {{{1
             self.cached_blocks.set(inode, block_number, block, writed=recompress)
         return block
 
+    def __get_block_range_from_framed(self, inode, block_number, offset, size):
+        """
+        Read part of block stored in seekable framed format,
+        decompress only touched frames, don't put whole block into cache.
+
+        @return: bytes or None if block must be read whole
+        """
+        if self.cached_blocks.get(inode, block_number) is not None:
+            return None
+
+        if self.getOption('decompress_try_all') \
+                or self.getOption('compression_recompress_now') \
+                or self.getOption('compression_recompress_current'):
+            return None
+
+        indexItem = self.__get_index_from_cache(inode, block_number)
+        if not indexItem:
+            return None
+
+        real_size = int(indexItem["real_size"])
+        # Whole block read - cache it as usual
+        if not real_size or size >= real_size:
+            return None
+
+        hash_id = indexItem["hash_id"]
+
+        compTypeId = self.__get_compression_type_by_hash_from_cache(hash_id)
+        if not compTypeId:
+            return None
+
+        compression = self.getCompressionTypeName(compTypeId)
+        if not self.application.isMethodFramed(compression):
+            return None
+
+        frames_offset = offset
+        cdata = self.cached_framed_blobs.get(hash_id)
+        if cdata is None:
+            blob = self.getTable("block").open_blob(hash_id)
+            if blob is not None:
+                # Read only touched frames from database, nothing to cache
+                with blob:
+                    cdata, frames_offset = framed.read_frames_range(blob, offset, size)
+            else:
+                item = self.getTable("block").get(hash_id)
+                if not item:
+                    return None
+                cdata = item["data"]
+                self.cached_framed_blobs.set(hash_id, cdata)
+
+        self.getLogger().debug("READ: framed Hash = %r, method = %r, offset = %s, size = %s", hash_id, compression, offset, size)
+
+        start_time = time()
+        data = self.application.decompressDataRange(compression, cdata, frames_offset, size)
+        self.reportHelper.time_spent_decompressing += time() - start_time
+
+        # Zero-bytes tail is not stored
+        if offset + size > real_size:
+            size = real_size - offset
+        if size < 0:
+            size = 0
+        if len(data) < size:
+            data += b'\x00' * (size - len(data))
+
+        return data
+
     def __get_block_data_by_offset(self, inode, offset, size):
         """
         @type inode: int
@@ -1818,18 +2036,22 @@ class DedupOperations(llfuse.Operations,TimersOps):  # {{{1
 
         for n in range(read_blocks):
 
-            block = self.__get_block_from_cache(inode, n + first_block_number)
-            block.seek(0)
-
+            read_offset = 0
             read_size = size - readed_size
             if read_size > self.block_size:
                 read_size = self.block_size
             if n == 0:
-                block.seek(inblock_offset)
+                read_offset = inblock_offset
                 if read_size > (self.block_size - inblock_offset):
                     read_size = self.block_size - inblock_offset
 
-            raw_data.write(block.read(read_size))
+            data = self.__get_block_range_from_framed(inode, n + first_block_number, read_offset, read_size)
+            if data is None:
+                block = self.__get_block_from_cache(inode, n + first_block_number)
+                block.seek(read_offset)
+                data = block.read(read_size)
+
+            raw_data.write(data)
             readed_size += read_size
 
         self.reportHelper.bytes_read += readed_size
@@ -1925,6 +2147,13 @@ class DedupOperations(llfuse.Operations,TimersOps):  # {{{1
             for name in ("hash_function",):
                 optTable.insert(name, "%s" % self.getOption(name))
 
+            optTable.insert("block_storage", self.getOption("block_storage") or constants.BLOCK_STORAGE_SQLITE)
+
+            blockTable = self.getTable("block")
+            if hasattr(blockTable, "getPartitionPaths"):
+                # Stores directories of partitions
+                blockTable.getPartitionPaths()
+
             optTable.insert("mounted_subvolume", self.mounted_subvolume_name)
 
             optTable.insert("fs_version", __fsversion__)
@@ -1958,6 +2187,21 @@ class DedupOperations(llfuse.Operations,TimersOps):  # {{{1
 
         optTable.commit()
 
+        patterns = self.getOption("compression_pattern")
+        if patterns:
+            tableNPO = self.getTable("name_pattern_option")
+            stored = tableNPO.getAll()
+            for item in patterns:
+                if item.find(":") == -1:
+                    self.getLogger().warning("Ignoring bad --compression-pattern=%r argument, must be <patterns>:<policy>", item)
+                    continue
+                pattern, policy = item.split(":", 1)
+                if pattern in stored or pattern.encode() in stored:
+                    tableNPO.update_compression(pattern, policy)
+                else:
+                    tableNPO.insert(pattern, None, policy)
+            tableNPO.commit()
+
         return
 
     def __select_subvolume(self):
@@ -2029,8 +2273,145 @@ class DedupOperations(llfuse.Operations,TimersOps):  # {{{1
             self.getLogger().warning("Ignoring --block-partitions=%r argument, using previously chosen partitions number %r instead",
                 self.block_partitions, parts)
             self.block_partitions = parts
+
+        # Filesystems created before storage option - sqlite
+        block_storage = options.get("block_storage", constants.BLOCK_STORAGE_SQLITE)
+        if self.getOption("block_storage") is not None and block_storage != self.getOption("block_storage"):
+            self.getLogger().warning("Ignoring --block-storage=%r argument, using previously chosen block storage %r instead",
+                self.getOption("block_storage"), block_storage)
+        self.application.setOption("block_storage", block_storage)
+        pass
+
+    def __get_flush_tables(self):  # {{{3
+        """
+        Tables changed by flush of cached blocks and inodes,
+        for enabled features only
+
+        @return: list of table names
+        """
+        names = ["inode", "inode_hash_block", "hash", "hash_count", "hash_owner",
+                 "hash_sizes", "hash_compression_type"]
+        if self.hash_meta_enabled:
+            names.append("hash_meta")
+        if self.delta_enabled:
+            names.extend(("hash_delta", "hash_sketch",))
+        if self.online_gc_enabled:
+            names.append("hash_gc")
+        if self.usage_counters_enabled:
+            names.append("subvolume_usage")
+        names.append("block")
+        return names
+
+    def __init_hash_meta(self):  # {{{3
+        """
+        Merged hash metadata table is filled once when enabled,
+        then it is used always
+        """
+        optTable = self.getTable("option")
+        self.hash_meta_enabled = optTable.get("hash_meta") == "1"
+        if not self.hash_meta_enabled and self.getOption("hash_meta") and not self.isReadonly():
+            self.getLogger().info("Fill merged hash metadata table...")
+            count = self.getTable("hash_meta").fill()
+            self.getLogger().info("Hash metadata of %d blocks merged.", count)
+            optTable.insert("hash_meta", "1")
+            self.hash_meta_enabled = True
+        pass
+
+    def __init_online_gc(self):  # {{{3
+        """
+        Hashes and blocks in cluster path may be used by other nodes,
+        they are collected offline only
+        """
+        self.online_gc_enabled = False
+        if not self.getOption("online_gc") or self.isReadonly():
+            return
+        if self.getTable("hash").getClustered():
+            self.getLogger().warning("Hashes and blocks are clustered! Online garbage collector disabled.")
+            return
+        self.online_gc_enabled = True
+        self.getLogger().debug("Online GC: %d hashes queued.", self.getTable("hash_gc").get_count())
+        pass
+
+    def __init_usage_counters(self):  # {{{3
+        """
+        Counters of mounted subvolume are changed only if they are calculated already
+        """
+        self.usage_counters_enabled = False
+        self.usage_hash_refs = {}
+        self.usage_apparent_size = 0
+        if self.isReadonly() or not self.mounted_subvolume:
+            return
+        if self.getTable("subvolume_usage").get(self.mounted_subvolume["id"]) is None:
+            self.getLogger().debug("Usage counters of subvolume %r are not calculated.", self.mounted_subvolume_name)
+            return
+        self.usage_counters_enabled = True
         pass
 
+    def __load_compression_patterns(self):  # {{{3
+        """
+        Read name pattern compression policies from DB:
+            '*.mp4,*.jpg' => 'none'
+            '*.log,*.txt' => 'zstd:19'
+        """
+        self.compression_patterns = []
+
+        for pattern, opts in self.getTable("name_pattern_option").getAll().items():
+            policy = opts.get("compression")
+            if not policy:
+                continue
+            if type(pattern) is bytes:
+                pattern = pattern.decode()
+            if type(policy) is bytes:
+                policy = policy.decode()
+            masks = [ mask.strip().lower() for mask in pattern.split(",") if mask.strip() ]
+            self.compression_patterns.append((masks, policy,))
+
+        self.getLogger().debug("Compression patterns: %r", self.compression_patterns)
+        return
+
+    def __get_compression_policy(self, inode):  # {{{3
+        """
+        Resolve compression policy for inode once:
+            1. per inode option
+            2. first matched file name pattern
+
+        @param  inode: inode ID
+        @type   inode: int
+
+        @return: str|None
+        """
+        policy = self.cached_compress_policy.get(inode)
+        if policy is not None:
+            return policy or None
+
+        policy = False
+
+        item = self.getTable("inode_option").get(inode)
+        if item and item["compression"]:
+            policy = item["compression"]
+            if type(policy) is bytes:
+                policy = policy.decode()
+        elif self.compression_patterns:
+            try:
+                node = self.__get_tree_node_by_inode(inode)
+                name = self.__get_name_by_id(node["name_id"])
+            except FUSEError:
+                name = None
+            if name:
+                name = name.decode("utf-8", "replace").lower()
+                for masks, p in self.compression_patterns:
+                    for mask in masks:
+                        if fnmatch.fnmatchcase(name, mask):
+                            policy = p
+                            break
+                    if policy:
+                        break
+
+        self.getLogger().debug("Compression policy for inode %i: %r", inode, policy)
+
+        self.cached_compress_policy.set(inode, policy)
+        return policy or None
+
     def __insert(self, parent_inode, name, mode, size, ctx, rdev=0):  # {{{3
         """
 
@@ -2058,6 +2439,8 @@ class DedupOperations(llfuse.Operations,TimersOps):  # {{{1
             nlinks, mode, ctx.uid, ctx.gid, rdev, size,
             newt, newt, newt
         )
+        if self.usage_counters_enabled:
+            self.usage_apparent_size += size
 
         name_id = self.__intern(name)
 
@@ -2126,6 +2509,9 @@ class DedupOperations(llfuse.Operations,TimersOps):  # {{{1
 
         # Inodes with nlinks = 0 are purged periodically from __collect_garbage() so
         # we don't have to do that here.
+        # Online GC releases their blocks when kernel forgets inode.
+        if self.online_gc_enabled and not attr["nlinks"] and not attr["mode"] & stat.S_IFDIR:
+            self.gc_unlinked_inodes.add(cur_node["inode_id"])
 
         self.cached_attrs.expire(cur_node["inode_id"])
         self.cached_xattrs.unset(cur_node["inode_id"])
@@ -2134,6 +2520,7 @@ class DedupOperations(llfuse.Operations,TimersOps):  # {{{1
         self.cached_names.unset(hashlib.md5(name).hexdigest())
         self.cached_name_ids.unset(cur_node["name_id"])
         self.cached_indexes.expire(cur_node["inode_id"])
+        self.cached_compress_policy.unset(cur_node["inode_id"])
 
         self.__cache_meta_hook()
 
@@ -2192,19 +2579,82 @@ class DedupOperations(llfuse.Operations,TimersOps):  # {{{1
         self.reportHelper.time_spent_hashing += time() - start_time
         return digest
 
-    def __decompress(self, block_data, compression_type_id):
+    def __decompress(self, block_data, compression_type_id, hash_id=None):
         """
         @param block_data: bytes
         @param compression_type_id: int
+        @param hash_id: int - required for delta compressed blocks
         @return: bytes
         """
-        start_time = time()
         compression = self.getCompressionTypeName( compression_type_id )
         self.getLogger().debug("-- decompress block: type = %s", compression)
-        result = self.application.decompressData(compression, block_data)
+        if delta.is_delta_method(compression):
+            deltaItem = self.getTable("hash_delta").get(hash_id)
+            if not deltaItem:
+                raise OSError("Delta block %r has no base block!" % (hash_id,))
+            base_data = self.__get_delta_base_data(deltaItem["base_hash_id"])
+            start_time = time()
+            result = delta.decode(compression, block_data, base_data)
+        else:
+            start_time = time()
+            result = self.application.decompressData(compression, block_data)
         self.reportHelper.time_spent_decompressing += time() - start_time
         return result
 
+    def decompressHashData(self, hash_id, block_data, compression_type_id):
+        """
+        Decompress stored block data, resolve delta base blocks
+
+        @return: bytes
+        """
+        return self.__decompress(block_data, compression_type_id, hash_id)
+
+    def __get_delta_base_data(self, hash_id):
+        """
+        Base blocks are shared by many delta blocks - keep them in cache
+
+        @return: bytes
+        """
+        data = self.cached_delta_bases.get(hash_id)
+        if data is None:
+            item = self.getTable("block").get(hash_id)
+            if not item:
+                raise OSError("Delta base block %r not found!" % (hash_id,))
+            compTypeId = self.__get_compression_type_by_hash_from_cache(hash_id)
+            data = self.__decompress(item["data"], compTypeId, hash_id)
+            self.cached_delta_bases.set(hash_id, data)
+        return data
+
+    def __find_delta_base(self, hash_id, data):
+        """
+        Find similar block by sketch and make delta against it
+
+        @return: tuple (sketch, delta item or None)
+                delta item: (method, delta data, base hash id, depth)
+        """
+        features = delta.sketch(data)
+        if not features:
+            return features, None
+
+        base_id = self.getTable("hash_sketch").find(features)
+        if not base_id or base_id == hash_id:
+            return features, None
+
+        depth = 1
+        baseItem = self.getTable("hash_delta").get(base_id)
+        if baseItem:
+            depth = baseItem["depth"] + 1
+        if depth > self.delta_max_depth:
+            return features, None
+
+        try:
+            base_data = self.__get_delta_base_data(base_id)
+        except OSError:
+            return features, None
+
+        method = delta.get_method()
+        return features, (method, delta.encode(method, data, base_data), base_id, depth,)
+
 
     def __write_block_data(self, inode, block_number, block, blocks_from_cache={}):
         """
@@ -2228,6 +2678,7 @@ class DedupOperations(llfuse.Operations,TimersOps):  # {{{1
 
         result = {
             "hash": None,
+            "digest": None,
             "data": None,
             "new": False,
             "recompress": False,
@@ -2277,6 +2728,7 @@ class DedupOperations(llfuse.Operations,TimersOps):  # {{{1
         self.getLogger().debug("-- hash_id: %r", hash_id)
 
         result["hash"] = hash_id
+        result["digest"] = hash_value
 
         # It is new block now?
         if not hash_id:
@@ -2305,7 +2757,7 @@ class DedupOperations(llfuse.Operations,TimersOps):  # {{{1
             if hash_CompressType_id:
                 compression = self.getCompressionTypeName(hash_CompressType_id)
 
-                if compression != constants.COMPRESSION_TYPE_NONE:
+                if compression != constants.COMPRESSION_TYPE_NONE and not delta.is_delta_method(compression):
                     if self.getOption('compression_recompress_now') and self.application.isDeprecated(compression):
                         self.getLogger().debug("FS thinks that compression %r is deprecated. Block data will be recompressed!", compression)
                         self.getLogger().debug("hash id: %s, value: %r, inode: %s, block-number: %s",
@@ -2332,7 +2784,7 @@ class DedupOperations(llfuse.Operations,TimersOps):  # {{{1
                     old_data = blocks_from_cache.get(hash_id)
 
                 elif hash_CompressType_id:
-                    old_data = self.__decompress(old_block["data"], hash_CompressType_id)
+                    old_data = self.__decompress(old_block["data"], hash_CompressType_id, hash_id)
                     del old_block
 
                 else:
@@ -2364,6 +2816,9 @@ class DedupOperations(llfuse.Operations,TimersOps):  # {{{1
                 tableHashCount.insert(hash_id)
             else:
                 tableHashCount.inc(hash_id)
+            if self.hash_meta_enabled:
+                self.getTable("hash_meta").inc(hash_id)
+            self.__count_usage_refs((hash_id,), 1)
 
             indexItem = {
                 "real_size": result["real_size"],
@@ -2375,11 +2830,18 @@ class DedupOperations(llfuse.Operations,TimersOps):  # {{{1
                 inode, block_number, hash_id, result["real_size"]
             )
 
+            if indexItem["hash_id"] != hash_id:
+                self.__release_hashes((indexItem["hash_id"],))
+
             fnd = tableHashCount.find(hash_id)
             if not fnd:
                 tableHashCount.insert(hash_id)
             else:
                 tableHashCount.inc(hash_id)
+            if self.hash_meta_enabled:
+                self.getTable("hash_meta").inc(hash_id)
+            if indexItem["hash_id"] != hash_id:
+                self.__count_usage_refs((hash_id,), 1)
 
             indexItem.update({
                 "real_size": result["real_size"],
@@ -2391,16 +2853,368 @@ class DedupOperations(llfuse.Operations,TimersOps):  # {{{1
         self.reportHelper.time_spent_writing_blocks += time() - start_time
         return result
 
+    def __release_hashes(self, hash_ids):
+        """
+        References to hashes removed from block index:
+        counters decreased, hashes queued for online garbage collector
+
+        @return: int - count of queued hashes
+        """
+        hash_ids = tuple(hash_ids)
+        self.__count_usage_refs(hash_ids, -1)
+        if not self.online_gc_enabled:
+            return 0
+        if not hash_ids:
+            return 0
+        tableHashCount = self.getTable("hash_count")
+        for hash_id in hash_ids:
+            tableHashCount.dec(hash_id)
+            if self.hash_meta_enabled:
+                self.getTable("hash_meta").dec(hash_id)
+        return self.getTable("hash_gc").add_many(hash_ids)
+
+    def __release_inode_hashes(self, inode):
+        if not self.online_gc_enabled and not self.usage_counters_enabled:
+            return 0
+        tableIndex = self.getTable("inode_hash_block")
+        return self.__release_hashes(tuple(tableIndex.get_hashid_by_inodes((str(inode),))))
+
+    def __count_usage_refs(self, hash_ids, delta):
+        """
+        References to hashes added to or removed from block index of mounted subvolume,
+        counters are changed on commit
+        """
+        if not self.usage_counters_enabled:
+            return
+        refs = self.usage_hash_refs
+        for hash_id in hash_ids:
+            refs[ hash_id ] = refs.get(hash_id, 0) + delta
+        return
+
+    def __flush_usage_counters(self):
+        """
+        Sizes of hashes are multiplied by count of added or removed references.
+        Hash is unique for subvolume while index has references to it -
+        index is changed already, so count before changes is count now minus delta.
+
+        @return: int - count of changed hashes
+        """
+        refs = self.usage_hash_refs
+        apparentSize = self.usage_apparent_size
+        self.usage_hash_refs = {}
+        self.usage_apparent_size = 0
+
+        if not self.usage_counters_enabled:
+            return 0
+
+        hash_ids = [ hash_id for hash_id, delta in refs.items() if delta ]
+        if not hash_ids and not apparentSize:
+            return 0
+
+        start_time = time()
+
+        dataSize = 0
+        uniqueSize = 0
+        compressedSize = 0
+        compressedUniqueSize = 0
+
+        tableIndex = self.getTable("inode_hash_block")
+        tableHS = self.getTable("hash_sizes")
+
+        batch = 1000
+        for start in range(0, len(hash_ids), batch):
+            ids = hash_ids[start:start + batch]
+
+            counts = tableIndex.count_by_hashes(ids)
+            sizes = tableHS.get_sizes_by_hash_ids(",".join(str(hash_id) for hash_id in ids))
+
+            for hash_id in ids:
+                delta = refs[ hash_id ]
+                writed, compressed = sizes.get(hash_id, (0, 0,))
+
+                dataSize += writed * delta
+                compressedSize += compressed * delta
+
+                after = counts.get(hash_id, 0)
+                before = after - delta
+                if before <= 0 < after:
+                    uniqueSize += writed
+                    compressedUniqueSize += compressed
+                elif after <= 0 < before:
+                    uniqueSize -= writed
+                    compressedUniqueSize -= compressed
+
+        self.getTable("subvolume_usage").add(
+            self.mounted_subvolume["id"],
+            apparentSize, dataSize, uniqueSize, compressedSize, compressedUniqueSize
+        )
+
+        self.reportHelper.time_spent_counting_usage += time() - start_time
+        return len(hash_ids)
+
+    def __purge_unlinked_inode(self, inode):
+        """
+        Last lookup of removed inode forgotten - nobody can read it now,
+        so its blocks are removed from index
+        """
+        self.gc_unlinked_inodes.discard(inode)
+        attr = self.__get_inode_row(inode)
+        if attr["nlinks"] > 0:
+            # Linked again
+            return 0
+        self.cached_blocks.forget(inode)
+        self.__release_inode_hashes(inode)
+        count = self.getTable("inode_hash_block").delete(inode)
+        self.cached_indexes.expire(inode)
+        return count
+
+    def __collect_hashes(self, hash_ids):
+        """
+        Remove hashes not used by any subvolume, with their data blocks
+
+        @param hash_ids: list of int
+        @return: int - count of removed hashes
+        """
+        id_str = ",".join(str(hash_id) for hash_id in hash_ids)
+
+        # Snapshots have own block indexes
+        used = set()
+        for subvol_id in self.getTable("subvolume").get_ids():
+            used |= self.getManager().getTable("inode_hash_block_%d" % subvol_id).get_used_hashes(id_str)
+
+        tableHDelta = self.getTable("hash_delta")
+
+        to_delete = set(hash_ids) - used
+        id_str = ",".join(str(hash_id) for hash_id in to_delete)
+        # Blocks still used as delta base must stay
+        to_delete -= tableHDelta.get_used_base_ids(id_str)
+        if not to_delete:
+            return 0
+
+        # Base of removed delta block may be unused now
+        bases = set()
+        for hash_id in to_delete:
+            item = tableHDelta.get(hash_id)
+            if item:
+                bases.add(item["base_hash_id"])
+
+        id_str = ",".join(str(hash_id) for hash_id in to_delete)
+        # Block files are found by hash value
+        self.getTable("block").remove_by_ids(id_str)
+        count = self.getTable("hash").remove_by_ids(id_str)
+        for name in ("hash_compression_type", "hash_sizes", "hash_owner", "hash_delta", "hash_sketch", "hash_count",):
+            self.getTable(name).remove_by_ids(id_str)
+        if self.hash_meta_enabled:
+            self.getTable("hash_meta").remove_by_ids(id_str)
+
+        # Removed ids may be given to new hashes
+        for hash_id in to_delete:
+            self.cached_hash_compress.unset(hash_id)
+            self.cached_hash_sizes.unset(hash_id)
+            self.cached_framed_blobs.unset(hash_id)
+            self.cached_delta_bases.unset(hash_id)
+
+        if bases:
+            self.getTable("hash_gc").add_many(bases - to_delete)
+        return count
+
+    def collectGarbage(self, limit=1000):
+        """
+        Check queued hashes, remove unused ones with their data blocks.
+        Called by online garbage collector thread with FUSE lock acquired.
+
+        @param limit: count of queued hashes to check
+        @type  limit: int
+
+        @return: int - count of checked hashes
+        """
+        if not self.online_gc_enabled:
+            return 0
+
+        self.startTimer("collectGarbage")
+        start_time = time()
+
+        tableQueue = self.getTable("hash_gc")
+        hash_ids = ()
+        try:
+            hash_ids = tableQueue.get_batch(limit)
+            if hash_ids:
+                # Changes of FS go first, rollback on error drops only changes of GC.
+                # Usage counters are flushed too - sizes of released hashes are needed
+                # before they are removed.
+                self.__commit_changes()
+                count = self.__collect_hashes(hash_ids)
+                tableQueue.remove_by_ids(",".join(str(hash_id) for hash_id in hash_ids))
+                self.__commit_changes()
+
+                self.getLogger().debug("Online GC: checked %i hashes, removed %i unused in %s.",
+                    len(hash_ids), count, format_timespan(time() - start_time))
+        except Exception as e:
+            # Should not raise anything in collector thread
+            self.__rollback_changes()
+            self.getLogger().error("Online GC: %s", e)
+            import traceback
+            self.getLogger().error(traceback.format_exc())
+            hash_ids = ()
+
+        self.stopTimer("collectGarbage")
+        return len(hash_ids)
+
+    def __scrub_range_done(self):
+        """
+        Save scrub time and counters of current range of hash ids
+        """
+        if self.scrub_range_id is not None:
+            self.getTable("scrub_range").set(self.scrub_range_id, int(time()),
+                self.scrub_range_blocks, self.scrub_range_errors)
+        self.scrub_range_id = None
+        self.scrub_range_blocks = 0
+        self.scrub_range_errors = 0
+        return
+
+    def __scrub_block(self, hash_id, hash_value, block_item):
+        """
+        @return: bool - block data is good
+        """
+        if not block_item:
+            self.getLogger().error("Scrub: block data of hash_id=%i not found!", hash_id)
+            return False
+        type_id = self.__get_compression_type_by_hash_from_cache(hash_id)
+        if type_id is None:
+            self.getLogger().error("Scrub: compression type of hash_id=%i not found!", hash_id)
+            return False
+        try:
+            data = self.__decompress(block_item["data"], type_id, hash_id)
+        except Exception as e:
+            self.getLogger().error("Scrub: block data of hash_id=%i not decompressed: %s", hash_id, e)
+            return False
+        if self.do_hash(data) != hash_value:
+            self.getLogger().error("Scrub: block data of hash_id=%i has wrong hash!", hash_id)
+            return False
+        return True
+
+    def __commit_scrub_progress(self, rollback=False):
+        """
+        Only scrub tables are written. Time of last commit is not changed,
+        so other background threads still see filesystem as idle.
+
+        @param rollback: Drop changes instead of commit
+        @type  rollback: bool
+        """
+        if self.use_transactions:
+            return
+        for name in ("option", "scrub_range",):
+            table = self.getTable(name)
+            if rollback:
+                table.rollback()
+            else:
+                table.commit()
+        return
+
+    def scrubBlocks(self, budget):
+        """
+        Verify next stored blocks in order of hash_id.
+        Called by scrubber thread with FUSE lock acquired.
+
+        @param budget: bytes of stored data to read
+        @type  budget: int
+
+        @return: int - count of read bytes
+        """
+        if budget <= 0:
+            return 0
+
+        self.startTimer("scrubBlocks")
+        start_time = time()
+
+        tableOption = self.getTable("option")
+        tableHash = self.getTable("hash")
+        tableHashSZ = self.getTable("hash_sizes")
+        tableBlock = self.getTable("block")
+
+        last_id = int(tableOption.get("scrub_last_id") or 0)
+        readed = 0
+        try:
+            while readed < budget:
+                hashItems = tableHash.get_batch(last_id, constants.SCRUB_BATCH_SIZE)
+                if not hashItems:
+                    # Pass over all blocks done, next one from start
+                    self.__scrub_range_done()
+                    self.reportHelper.scrub_passes += 1
+                    self.getLogger().info("Scrub: pass over all blocks done, bad blocks found: %i.",
+                                          self.reportHelper.scrub_errors)
+                    last_id = 0
+                    break
+
+                # Read only blocks which fit in rest of budget,
+                # one bigger block is read only at start of tick
+                sizes = tableHashSZ.get_sizes_by_hash_ids(",".join(str(item["id"]) for item in hashItems))
+                rest = budget - readed
+                count = 0
+                for hashItem in hashItems:
+                    size = sizes.get(hashItem["id"], (0, 0,))[1]
+                    if (count or readed) and size > rest:
+                        break
+                    rest -= size
+                    count += 1
+                partial = count < len(hashItems)
+                hashItems = hashItems[:count]
+
+                blocks = tableBlock.get_many([ item["id"] for item in hashItems ])
+                for hashItem in hashItems:
+                    hash_id = hashItem["id"]
+
+                    range_id = hash_id // constants.SCRUB_RANGE_SIZE
+                    if range_id != self.scrub_range_id:
+                        self.__scrub_range_done()
+                        self.scrub_range_id = range_id
+
+                    blockItem = blocks.get(hash_id)
+                    if blockItem:
+                        readed += len(blockItem["data"])
+
+                    self.scrub_range_blocks += 1
+                    self.reportHelper.scrub_blocks += 1
+                    if not self.__scrub_block(hash_id, hashItem["value"], blockItem):
+                        self.scrub_range_errors += 1
+                        self.reportHelper.scrub_errors += 1
+
+                    last_id = hash_id
+
+                if partial:
+                    # Budget is spent, continue from last checked block
+                    break
+
+            if tableOption.get("scrub_last_id") is None:
+                tableOption.insert("scrub_last_id", "%i" % last_id)
+            else:
+                tableOption.update("scrub_last_id", "%i" % last_id)
+            self.__commit_scrub_progress()
+        except Exception as e:
+            # Should not raise anything in scrubber thread
+            self.__commit_scrub_progress(True)
+            self.getLogger().error("Scrub: %s", e)
+            import traceback
+            self.getLogger().error(traceback.format_exc())
+
+        self.reportHelper.scrub_bytes += readed
+        self.reportHelper.time_spent_scrubbing += time() - start_time
+        self.stopTimer("scrubBlocks")
+        return readed
+
     def __flush_old_cached_blocks(self, cached_blocks, writed=False):
         count = 0
 
         blocksToCompress = {}
         blocksReCompress = {}
+        blocksPolicy = {}
         blockSize = {}
+        blocksDigest = {}
 
         hashToBlock = {}
 
         for inode, inode_data in cached_blocks.items():
+            policy = None
             for block_number, block_data in inode_data.items():
                 if block_data.c_written:
                     block = block_data.c_block
@@ -2409,6 +3223,12 @@ class DedupOperations(llfuse.Operations,TimersOps):  # {{{1
                         blocksToCompress[ item["hash"] ] = item["data"]
                         blocksReCompress[ item["hash"] ] = item["recompress"]
                         blockSize[ item["hash"] ] = item["writed_size"]
+                        blocksDigest[ item["hash"] ] = item["digest"]
+
+                        if policy is None:
+                            policy = self.__get_compression_policy(int(inode)) or False
+                        if policy:
+                            blocksPolicy[ item["hash"] ] = policy
 
                         if item["hash"] not in hashToBlock:
                             hashToBlock[ item["hash"] ] = item["data"]
@@ -2421,12 +3241,43 @@ class DedupOperations(llfuse.Operations,TimersOps):  # {{{1
         tableBlock = self.getTable("block")
         tableHCT = self.getTable("hash_compression_type")
         tableHSZ = self.getTable("hash_sizes")
+        tableHashMeta = None
+        if self.hash_meta_enabled:
+            tableHashMeta = self.getTable("hash_meta")
+
+        blocksDelta = {}
+        blocksSketch = {}
+        if self.delta_enabled:
+            tableHashDelta = self.getTable("hash_delta")
+            tableHashSketch = self.getTable("hash_sketch")
+
+            start_time = time()
+            for hash_id, data in blocksToCompress.items():
+                if blocksReCompress[ hash_id ]:
+                    continue
+                blocksSketch[ hash_id ], deltaItem = self.__find_delta_base(hash_id, data)
+                if deltaItem:
+                    blocksDelta[ hash_id ] = deltaItem
+            self.reportHelper.time_spent_compressing += time() - start_time
 
         self.application.getCompressTool().time_spent_compressing = 0
 
-        for hash_id, cItem in self.application.compressData(blocksToCompress):
+        for hash_id, cItem in self.application.compressData(blocksToCompress, blocksPolicy):
             cdata, cmethod = cItem
 
+            depth = 0
+            if hash_id in blocksDelta:
+                dmethod, ddata, base_id, depth = blocksDelta[ hash_id ]
+                if len(ddata) < len(cdata):
+                    cdata, cmethod = ddata, dmethod
+                    tableHashDelta.insert(hash_id, base_id, depth)
+                    self.reportHelper.delta_blocks_written += 1
+                else:
+                    depth = 0
+            # Blocks at max depth are not used as bases
+            if blocksSketch.get(hash_id) and depth < self.delta_max_depth:
+                tableHashSketch.insert(hash_id, blocksSketch[ hash_id ])
+
             self.getLogger().debug("WRITE: Hash = %r, method = %r", hash_id, cmethod)
 
             comp_size = len(cdata)
@@ -2436,18 +3287,23 @@ class DedupOperations(llfuse.Operations,TimersOps):  # {{{1
             cmethod_id = self.getCompressionTypeId(cmethod)
 
             if blocksReCompress.get(hash_id, False) is True:
-                tableBlock.update(hash_id, cdata)
+                tableBlock.update(hash_id, cdata, blocksDigest[ hash_id ])
+                self.cached_framed_blobs.unset(hash_id)
             else:
-                tableBlock.insert(hash_id, cdata)
+                tableBlock.insert(hash_id, cdata, blocksDigest[ hash_id ])
 
             hash_CompressType_id = self.__get_compression_type_by_hash_from_cache(hash_id)
             if hash_CompressType_id:
                 if hash_CompressType_id != cmethod_id:
                     tableHCT.update(hash_id, cmethod_id)
                     self.cached_hash_compress.set(hash_id, cmethod_id)
+                    if self.hash_meta_enabled:
+                        tableHashMeta.set_type(hash_id, cmethod_id)
             else:
                 tableHCT.insert(hash_id, cmethod_id)
                 self.cached_hash_compress.set(hash_id, cmethod_id)
+                if self.hash_meta_enabled:
+                    tableHashMeta.set_type(hash_id, cmethod_id)
 
             hash_SZ = self.__get_sizes_by_hash_from_cache(hash_id)
             if hash_SZ and hash_SZ.size_c > 0 and hash_SZ.size_w > 0:
@@ -2456,11 +3312,15 @@ class DedupOperations(llfuse.Operations,TimersOps):  # {{{1
                     hash_SZ.size_c = comp_size
                     hash_SZ.size_w = writed_size
                     self.cached_hash_sizes.set(hash_id, hash_SZ)
+                    if self.hash_meta_enabled:
+                        tableHashMeta.set_sizes(hash_id, writed_size, comp_size)
             else:
                 tableHSZ.insert(hash_id, writed_size, comp_size)
                 hash_SZ.size_c = comp_size
                 hash_SZ.size_w = writed_size
                 self.cached_hash_sizes.set(hash_id, hash_SZ)
+                if self.hash_meta_enabled:
+                    tableHashMeta.set_sizes(hash_id, writed_size, comp_size)
 
             self.reportHelper.bytes_written_compressed += comp_size
 
@@ -2492,6 +3352,9 @@ class DedupOperations(llfuse.Operations,TimersOps):  # {{{1
             flushed_writed_blocks += flushed
             flushed_writed_expiredByTime_blocks += flushed
 
+            self.cached_framed_blobs.clear()
+            self.cached_delta_bases.clear()
+
             self.cache_gc_block_write_last_run = time()
 
             elapsed_time1 = self.cache_gc_block_write_last_run - start_time1
@@ -2547,6 +3410,12 @@ class DedupOperations(llfuse.Operations,TimersOps):  # {{{1
 
     def __flush_expired_inodes(self, inodes):
         count = 0
+        if self.usage_counters_enabled and inodes:
+            # Size of linked inodes only
+            for inode_id, (size, nlinks) in self.getTable("inode").get_sizes_nlinks_by_ids(inodes.keys()).items():
+                update_data = inodes.get(inode_id, {})
+                self.usage_apparent_size += (update_data.get("nlinks", nlinks) > 0 and update_data.get("size", size) or 0) - \
+                                            (nlinks > 0 and size or 0)
         for inode_id, update_data in inodes.items():
             self.getLogger().debug("flush inode: %i = %r", int(inode_id), update_data)
             if "truncated" in update_data:
@@ -2565,6 +3434,7 @@ class DedupOperations(llfuse.Operations,TimersOps):  # {{{1
         items = tableIndex.delete_by_inode_number_more(inode_id, max_block_number)
         for item in items:
             self.cached_indexes.expireBlock(inode_id, item["block_number"])
+        self.__release_hashes(item["hash_id"] for item in items)
 
         # 2. Truncate last block with zeroes
         block = self.__get_block_from_cache(inode_id, max_block_number)
@@ -2602,6 +3472,7 @@ class DedupOperations(llfuse.Operations,TimersOps):  # {{{1
             flushed_xattrs = self.cached_xattrs.clear()
 
             flushed_hash_compress = self.cached_hash_compress.clear()
+            self.cached_compress_policy.clear()
             flushed_hash_sizes = self.cached_hash_sizes.clear()
 
             # Just readed...
@@ -2634,14 +3505,19 @@ class DedupOperations(llfuse.Operations,TimersOps):  # {{{1
 
 
     def __commit_changes(self):  # {{{3
+        self.__flush_usage_counters()
         if not self.use_transactions:
             start_time = time()
             self.getManager().commit()
             self.getManager().begin()
             self.reportHelper.time_spent_commiting += time() - start_time
+        # Changes are written to database now, in autocommit mode too
+        self.last_commit_time = time()
         self.getManager().shrinkMemory()
 
     def __rollback_changes(self):  # {{{3
+        self.usage_hash_refs = {}
+        self.usage_apparent_size = 0
         if not self.use_transactions:
             self.getLogger().note('Rolling back changes')
             self.getManager().rollback()
@@ -46,6 +46,16 @@ class Snapshot(Subvolume):
             tableSubvol.stats_time(subvolItemTo["id"], subvolItemFrom["stats_at"])
             tableSubvol.set_stats(subvolItemTo["id"], subvolItemFrom["stats"])
 
+        # Same data - same usage
+        tableUsage = self.getTable('subvolume_usage')
+        usageItem = tableUsage.get(subvolItemFrom["id"])
+        if usageItem:
+            tableUsage.set_usage(
+                subvolItemTo["id"],
+                usageItem["apparent_size"], usageItem["data_size"], usageItem["unique_size"],
+                usageItem["compressed_size"], usageItem["compressed_unique_size"]
+            )
+
         self.getManager().getManager().commit()
 
         self.getLogger().debug("Use subvolume: %r" % subvol_from)
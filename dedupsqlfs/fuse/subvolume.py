@@ -9,13 +9,25 @@ import math
 from datetime import datetime
 from dedupsqlfs.my_formats import format_size
 from dedupsqlfs.lib.constants import ROOT_SUBVOLUME_NAME, COMPRESSION_PROGS_NONE
+from dedupsqlfs.lib.hash_bitmap import HashIdBitmap
 import json
 
+np = None
+try:
+    import numpy as np
+except ImportError:
+    pass
+
 class Subvolume(object):
 
     _manager = None
     _last_error = None
 
+    USAGE_BATCH = 1000
+    """
+    @cvar USAGE_BATCH: Count of ids in one select of usage statistics
+    """
+
     def __init__(self, manager):
         """
         @param manager: FUSE wrapper
@@ -107,6 +119,9 @@ class Subvolume(object):
         inode_id = tableInode.insert(2, self.root_mode, uid, gid, 0, sz, newt_ns, newt_ns, newt_ns)
         tableTree.insert(None, name_id, inode_id)
 
+        # Empty subvolume - counters are known
+        self.getTable('subvolume_usage').set_usage(subvolItem["id"], sz)
+
         self.getManager().getManager().commit()
         self.getManager().getManager().close()
 
@@ -249,13 +264,13 @@ class Subvolume(object):
 
     def prepareIndexHashIds(self):
         """
-        List all subvolumes
-        @rtype: set
+        Mark hashes used by inodes in FS tree of all subvolumes
+        @rtype: dedupsqlfs.lib.hash_bitmap.HashIdBitmap
         """
 
         tableSubvol = self.getTable('subvolume')
 
-        hashIds = set()
+        hashIds = HashIdBitmap(self.getTable('hash').get_max_id() + 1, self.getManager().getOption("temp"))
         pageSize = 10000
 
         for subvol_id in tableSubvol.get_ids():
@@ -278,16 +293,8 @@ class Subvolume(object):
 
                 inodes_in_tree = set(tableTree.get_inodes_by_inodes_intgen(inode_ids))
 
-                for item in items:
-
-                    # Check if FS tree has inode
-
-                    inode_id = item["inode_id"]
-                    if inode_id not in inodes_in_tree:
-                        continue
-
-                    hash_id = item["hash_id"]
-                    hashIds.add(hash_id)
+                # Check if FS tree has inode
+                hashIds.mark(item["hash_id"] for item in items if item["inode_id"] in inodes_in_tree)
 
             curIndex.close()
             tableIndex.close()
@@ -388,6 +395,11 @@ class Subvolume(object):
 
         freedSpace = 0
         try:
+            if self.getManager().getOption("online_gc"):
+                # Hashes used only by this subvolume are unused now
+                tableIndex = self.getTable('inode_hash_block_%d' % subvolItem["id"])
+                self.getTable('hash_gc').add_many(tableIndex.get_uniq_hashes())
+
             for tname in (
                 'tree_%d' % subvolItem["id"],
                 'inode_%d' % subvolItem["id"],
@@ -401,6 +413,7 @@ class Subvolume(object):
                 freedSpace += space
 
             tableSubvol.delete(subvolItem["id"])
+            self.getTable('subvolume_usage').delete(subvolItem["id"])
         except Exception as e:
             self.getLogger().warn("Can't remove subvolume and related tables!")
             self.getLogger().error("E: %s", e)
@@ -470,6 +483,10 @@ class Subvolume(object):
             self.getLogger().error("Subvolume with name %r not found!", name)
             return 0
 
+        usageItem = self.getTable('subvolume_usage').get(subvolItem["id"])
+        if usageItem:
+            return usageItem["apparent_size"]
+
         if subvolItem["stats_at"] and subvolItem["stats"]:
             stats_at = int(subvolItem["stats_at"])
             updated_at = int(subvolItem["updated_at"])
@@ -502,6 +519,20 @@ class Subvolume(object):
             self.getLogger().error("Subvolume with name %r not found!", name)
             return False
 
+        checkTree = self.getManager().getOption('check_tree_inodes')
+
+        tableUsage = self.getTable('subvolume_usage')
+
+        usageItem = None
+        if not checkTree:
+            usageItem = tableUsage.get(subvolItem["id"])
+
+        if usageItem:
+            # Compression types are known only from last calculation
+            stats = self.get_usage_from_counters(usageItem, subvolItem)
+            if stats["compressionTypesAll"] or not hashTypes:
+                return stats
+
         if subvolItem["stats_at"] and subvolItem["stats"]:
             stats_at = int(subvolItem["stats_at"])
             updated_at = int(subvolItem["updated_at"])
@@ -510,10 +541,6 @@ class Subvolume(object):
                 return json.loads(subvolItem["stats"])
 
         compMethods = {}
-        hashCT = {}
-        hashSZ = {}
-
-        checkTree = self.getManager().getOption('check_tree_inodes')
 
         tableHCT = self.getTable('hash_compression_type')
         tableHS = self.getTable('hash_sizes')
@@ -521,57 +548,71 @@ class Subvolume(object):
         tableTree = self.getTable('tree_%d' % subvolItem["id"])
         tableInode = self.getTable('inode_%d' % subvolItem["id"])
 
-        nodesInodes = set()
-        if checkTree:
-            nodesInodes = tableTree.get_all_inodes_set()
-
         dataSize = 0
         compressedSize = 0
         uniqueSize = 0
         compressedUniqueSize = 0
         apparentSize = 0
 
+        # Whole index in two columns, sizes and types are selected by batches of unique ids
+        hashIds = []
+        inodeIds = []
         for item in tableIndex.get_hash_inode_ids():
+            hashIds.append(item["hash_id"])
+            inodeIds.append(item["inode_id"])
 
-            # Check if FS tree has inode
-            inode_id = int(item["inode_id"])
-            getSize = True
-            if checkTree:
-                if inode_id not in nodesInodes:
-                    getSize = False
-            else:
-                if inode_id in nodesInodes:
-                    getSize = False
-                nodesInodes.add(inode_id)
-            if getSize:
-                apparentSize += tableInode.get_size(inode_id)
-
-            hash_id = item["hash_id"]
+        if checkTree:
+            # Only inodes which FS tree has
+            inodeIds = set(inodeIds) & tableTree.get_all_inodes_set()
+            inodeIds = [ str(inode_id) for inode_id in inodeIds ]
 
+            for start in range(0, len(inodeIds), self.USAGE_BATCH):
+                apparentSize += sum(tableInode.get_sizes_by_id(inodeIds[start:start + self.USAGE_BATCH]).values())
+        else:
+            # Same as counters: all linked inodes
+            apparentSize = tableInode.get_sizes()
+        del inodeIds
+
+        # Count of blocks for every unique hash
+        if np is not None:
+            uniqIds, counts = np.unique(np.array(hashIds, dtype=np.int64), return_counts=True)
+            uniqIds = uniqIds.tolist()
+            counts = counts.tolist()
+        else:
+            hashCounts = {}
+            for hash_id in hashIds:
+                hashCounts[ hash_id ] = hashCounts.get(hash_id, 0) + 1
+            uniqIds = list(hashCounts.keys())
+            counts = list(hashCounts.values())
+        del hashIds
+
+        for start in range(0, len(uniqIds), self.USAGE_BATCH):
+            ids = uniqIds[start:start + self.USAGE_BATCH]
+            id_str = ",".join(str(hash_id) for hash_id in ids)
+
+            hashSZ = tableHS.get_sizes_by_hash_ids(id_str)
+            hashCT = {}
             if hashTypes:
+                hashCT = tableHCT.get_types_by_hash_ids(id_str)
 
-                if hash_id in hashCT:
-                    method = hashCT[hash_id]
-                else:
-                    hctItem = tableHCT.get(hash_id)
-                    if not hctItem:
+            for hash_id, cnt in zip(ids, counts[start:start + self.USAGE_BATCH]):
+
+                if hashTypes:
+                    if hash_id not in hashCT:
                         self.getLogger().error("Hash compression type not found! hash_id=%r" % hash_id)
                         continue
-                    method = self.getManager().getCompressionTypeName(hctItem["type_id"])
-                    hashCT[hash_id] = method
+                    method = self.getManager().getCompressionTypeName(hashCT[hash_id])
+                    compMethods[ method ] = compMethods.get(method, 0) + cnt
 
-                compMethods[ method ] = compMethods.get(method, 0) + 1
-
-            if hash_id in hashSZ:
-                hszItem = hashSZ[hash_id]
-            else:
-                hszItem = tableHS.get(hash_id)
-                hashSZ[hash_id] = hszItem
-                uniqueSize += hszItem["writed_size"]
-                compressedUniqueSize += hszItem["compressed_size"]
+                if hash_id not in hashSZ:
+                    self.getLogger().error("Hash sizes not found! hash_id=%r" % hash_id)
+                    continue
+                writed, compressed = hashSZ[hash_id]
 
-            dataSize += hszItem["writed_size"]
-            compressedSize += hszItem["compressed_size"]
+                uniqueSize += writed
+                compressedUniqueSize += compressed
+                dataSize += writed * cnt
+                compressedSize += compressed * cnt
 
         sparseSize = apparentSize - dataSize
         dedupSize = dataSize - uniqueSize
@@ -603,10 +644,66 @@ class Subvolume(object):
         tableSubvol.stats_time(subvolItem["id"])
         tableSubvol.set_stats(subvolItem["id"], json.dumps(stats))
 
+        if not checkTree:
+            tableUsage.set_usage(
+                subvolItem["id"],
+                apparentSize, dataSize, uniqueSize, compressedSize, compressedUniqueSize
+            )
+            tableUsage.commit()
+
         tableSubvol.commit()
 
         return stats
 
+    def get_usage_from_counters(self, usageItem, subvolItem):
+        """
+        Sizes from usage counters, compression types - from last calculated stats
+
+        @param usageItem: subvolume_usage table row
+        @type  usageItem: dict
+
+        @param subvolItem: subvolume table row
+        @type  subvolItem: dict
+
+        @rtype: dict
+        """
+        comp_types = {}
+        count_all = 0
+        comp_types_at = None
+        if subvolItem["stats_at"] and subvolItem["stats"]:
+            last = json.loads(subvolItem["stats"])
+            comp_types = last.get("compressionTypes", {})
+            count_all = last.get("compressionTypesAll", 0)
+            if subvolItem["updated_at"] and int(subvolItem["updated_at"]) > int(subvolItem["stats_at"]):
+                comp_types_at = int(subvolItem["stats_at"])
+
+        stats = {
+            "apparentSize": usageItem["apparent_size"],
+            "dataSize": usageItem["data_size"],
+            "dedupSize": usageItem["data_size"] - usageItem["unique_size"],
+            "sparseSize": usageItem["apparent_size"] - usageItem["data_size"],
+            "uniqueSize": usageItem["unique_size"],
+            "compressedSize": usageItem["compressed_size"],
+            "compressedUniqueSize": usageItem["compressed_unique_size"],
+            "compressionTypes": comp_types,
+            "compressionTypesAll": count_all,
+            "compressionTypesAt": comp_types_at
+        }
+        return stats
+
+    def recalculate_stats(self, name):
+        """
+        Usage counters and stats calculated again by all subvolume tables
+
+        @param name: Subvolume name
+        @type  name: bytes
+
+        @rtype: dict|false
+        """
+        if self.clean_stats(name) is False:
+            return False
+        return self.get_usage(name, True)
+
     def get_root_diff(self, name):
         """
         @param name: Subvolume name
@@ -700,6 +797,11 @@ class Subvolume(object):
         tableSubvol.root_diff_time(subvolItem["id"], 0)
         tableSubvol.set_root_diff(subvolItem["id"], None)
 
+        # Calculated again on next request
+        tableUsage = self.getTable('subvolume_usage')
+        tableUsage.delete(subvolItem["id"])
+        tableUsage.commit()
+
         tableSubvol.commit()
 
         return
@@ -764,7 +866,9 @@ class Subvolume(object):
         keys = list(comp_types.keys())
         keys.sort(reverse=True)
 
-        if keys:
+        if keys and usage.get("compressionTypesAt"):
+            self.print_out("Compression by types (calculated at %s):\n" % datetime.fromtimestamp(usage["compressionTypesAt"]))
+        elif keys:
             self.print_out("Compression by types:\n")
         for key in keys:
             compression = comp_types[key]
@@ -132,3 +132,44 @@ class CacheTTLseconds(TimedCache):
                 count += 1
         self.stopTimer("clear")
         return count
+
+
+class CacheTTLsecondsSize(CacheTTLseconds):
+    """
+    Cache storage of bytes values, limited by summary size of them.
+    Least recently used items go away first, when limit is reached.
+    """
+
+    _max_size = -1
+    _cur_size = 0
+
+    def set_max_size(self, in_bytes):
+        """
+        @param in_bytes: size limit, -1 - unlimited
+        """
+        self._max_size = in_bytes
+        return self
+
+    def set(self, key, value):
+        self.unset(key)
+        super().set(key, value)
+        self._cur_size += len(value)
+        if self._max_size >= 0 and self._cur_size > self._max_size:
+            self.startTimer()
+            for key in sorted(self._storage, key=lambda k: self._storage[k].c_time):
+                if self._cur_size <= self._max_size:
+                    break
+                self._cur_size -= len(self._storage.pop(key).c_value)
+            self.stopTimer("shrink")
+        return self
+
+    def unset(self, key):
+        item = self._storage.get(key)
+        if item is not None:
+            self._cur_size -= len(item.c_value)
+        return super().unset(key)
+
+    def clear(self):
+        count = super().clear()
+        self._cur_size = sum(len(item.c_value) for item in self._storage.values())
+        return count
@@ -7,14 +7,25 @@ __author__ = 'sergey'
 
 COMPRESSION_SUPPORTED=(
     'lzo', 'zlib', 'deflate', 'bz2', 'xz', 'snappy',
-    'lz4', 'brotli', 'zstd',
+    'lz4', 'brotli', 'zstd', 'zstd_dict',
 )
+# Python modules for methods if names differ
+COMPRESSION_MODULES={
+    'zstd_dict': 'zstandard',
+}
 COMPRESSION_READONLY=()
 COMPRESSION_TYPE_BEST="all_best"
 COMPRESSION_TYPE_DEFAULT="all"
 COMPRESSION_TYPE_FAST="all_fast"
 COMPRESSION_TYPE_CUSTOM="custom"
 COMPRESSION_TYPE_NONE="none"
+# Seekable sub-block framed format: <method>_framed
+COMPRESSION_FRAMED_SUFFIX="_framed"
+COMPRESSION_FRAME_SIZE_MIN=1024
+# Similarity based delta compression against base block
+COMPRESSION_DELTA_ZSTD="delta_zstd"
+COMPRESSION_DELTA_ZLIB="delta_zlib"
+COMPRESSION_DELTA_DEPTH_DEFAULT=3
 
 COMPRESSION_LEVEL_DEFAULT="default"
 COMPRESSION_LEVEL_FAST="fast"
@@ -67,3 +78,50 @@ ROOT_SUBVOLUME_NAME=b"@root"
 BLOCK_SIZE_MIN=512
 BLOCK_SIZE_DEFAULT=64*1024      # 64kb
 BLOCK_SIZE_MAX=16*1024*1024     # 16Mb
+
+# SQLite table roles: memory of page cache and mmap per table file
+TABLE_ROLE_BLOCK="block"
+TABLE_ROLE_INDEX="index"
+TABLE_ROLE_META="meta"
+
+SQLITE_CACHE_SIZE_DEFAULT=64*1024*1024      # 64Mb
+SQLITE_MMAP_SIZE_DEFAULT=256*1024*1024      # 256Mb
+
+# Multipliers of cache-size-per-table option
+SQLITE_CACHE_SIZE_ROLE_FACTOR={
+    TABLE_ROLE_BLOCK: 1.0,
+    TABLE_ROLE_INDEX: 2.0,
+    TABLE_ROLE_META: 0.5,
+}
+
+# Multipliers of mmap-size option, metadata is read via page cache
+SQLITE_MMAP_SIZE_ROLE_FACTOR={
+    TABLE_ROLE_BLOCK: 1.0,
+    TABLE_ROLE_INDEX: 1.0,
+    TABLE_ROLE_META: 0,
+}
+
+# Where block data is stored
+BLOCK_STORAGE_SQLITE="sqlite"
+BLOCK_STORAGE_FS="fs"
+BLOCK_STORAGE_PACKFILE="packfile"
+
+BLOCK_STORAGE_TYPES=(BLOCK_STORAGE_SQLITE, BLOCK_STORAGE_FS, BLOCK_STORAGE_PACKFILE,)
+
+PACKFILE_SEGMENT_SIZE_DEFAULT=1024*1024*1024    # 1Gb
+# Segments with less live data are rewritten by compaction
+PACKFILE_COMPACT_LIVE_RATIO=0.5
+
+# File-per-block storage
+BLOCK_FS_IO_THREADS_DEFAULT=4
+BLOCK_FS_DIGESTS_CACHE_SIZE=100000
+
+# Garbage collection: bitmap of used hash ids over this size is memory-mapped to temporary file
+GC_BITMAP_MMAP_SIZE=64*1024*1024    # 64Mb - ~512M hash ids
+
+# Background scrubber: hashes read at once, hash ids in range with own scrub time
+SCRUB_BATCH_SIZE=100
+SCRUB_RANGE_SIZE=100000
+
+# Locality defragmentation: seek distance is measured over first blocks of subvolume files
+LOCALITY_SAMPLE_SIZE=100000
@@ -0,0 +1,137 @@
+# -*- coding: utf8 -*-
+"""
+Bitmap of used hash ids for garbage collection
+
+One bit per hash id, so memory is max hash id / 8 bytes:
+300M hashes need ~36Mb instead of tens of Gb of python set.
+
+Big bitmaps are memory-mapped to temporary file.
+With 'numpy' module marks and checks are done over whole arrays of ids.
+"""
+
+__author__ = 'sergey'
+
+import mmap
+import tempfile
+
+from dedupsqlfs.lib import constants
+
+np = None
+try:
+    import numpy as np
+except ImportError:
+    pass
+
+
+class HashIdBitmap(object):
+
+    _size = 0
+    """
+    @ivar _size: Count of bits, max hash id + 1
+    """
+
+    _buffer = None
+    """
+    @ivar _buffer: Bits storage
+    @type _buffer: bytearray | mmap.mmap
+    """
+
+    _array = None
+    """
+    @ivar _array: numpy view of buffer
+    """
+
+    _file = None
+
+    def __init__(self, size, tmp_dir=None, mmap_size=constants.GC_BITMAP_MMAP_SIZE):
+        """
+        @param size: Max hash id + 1
+        @param tmp_dir: Directory for temporary file, default - TMPDIR
+        @param mmap_size: Bitmap of more bytes is memory-mapped to file, 0 - never
+        """
+        self._size = max(int(size), 1)
+        nbytes = (self._size + 7) >> 3
+
+        if mmap_size and nbytes > mmap_size:
+            self._file = tempfile.TemporaryFile(prefix="dedupsqlfs-gc-", dir=tmp_dir)
+            self._file.truncate(nbytes)
+            self._buffer = mmap.mmap(self._file.fileno(), nbytes)
+        else:
+            self._buffer = bytearray(nbytes)
+
+        if np is not None:
+            self._array = np.frombuffer(self._buffer, dtype=np.uint8)
+        pass
+
+    def getSize(self):
+        return self._size
+
+    def isMapped(self):
+        return self._file is not None
+
+    def _toArray(self, hash_ids):
+        ids = np.fromiter(hash_ids, dtype=np.int64)
+        return ids[ (ids >= 0) & (ids < self._size) ]
+
+    def mark(self, hash_ids):
+        """
+        Set bits of hash ids, ids out of bitmap are ignored
+
+        @param hash_ids: iterable of int
+        """
+        if self._array is not None:
+            ids = self._toArray(hash_ids)
+            np.bitwise_or.at(self._array, ids >> 3, (1 << (ids & 7)).astype(np.uint8))
+            return self
+
+        buf = self._buffer
+        size = self._size
+        for hash_id in hash_ids:
+            if 0 <= hash_id < size:
+                buf[hash_id >> 3] |= 1 << (hash_id & 7)
+        return self
+
+    def isMarked(self, hash_id):
+        if not 0 <= hash_id < self._size:
+            return False
+        return bool(self._buffer[hash_id >> 3] & (1 << (hash_id & 7)))
+
+    def unmarked(self, hash_ids):
+        """
+        Hash ids without bit set - not used.
+        Ids out of bitmap are added after it was made - never returned.
+
+        @param hash_ids: iterable of int
+        @return: set of int
+        """
+        if self._array is not None:
+            ids = self._toArray(hash_ids)
+            bits = (self._array[ ids >> 3 ] >> (ids & 7).astype(np.uint8)) & 1
+            return set(ids[ bits == 0 ].tolist())
+
+        size = self._size
+        return set(hash_id for hash_id in hash_ids if 0 <= hash_id < size and not self.isMarked(hash_id))
+
+    def count(self):
+        """
+        @return: int - count of set bits
+        """
+        step = 1024*1024
+        count = 0
+        for start in range(0, len(self._buffer), step):
+            if self._array is not None:
+                count += int(np.unpackbits(self._array[start:start+step]).sum())
+            else:
+                count += bin(int.from_bytes(self._buffer[start:start+step], "little")).count("1")
+        return count
+
+    def close(self):
+        self._array = None
+        if self._file is not None:
+            self._buffer.close()
+            self._file.close()
+            self._file = None
+        self._buffer = None
+        return
+
+    pass